@@ -1,8 +1,71 @@
+import hashlib
+
 from django.contrib import admin
-from .models import Bottle, ChangeListEntry
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.utils.functional import cached_property
+
+from .models import ArchivedBottle, Bottle, BottleEvent, ChangeListEntry, LocationCount, ParticipatingGroup
 
 # Register your models here.
 
+ADMIN_COUNT_TIMEOUT = 60 * 5
+"""Time (in seconds) the admin reuses a row count before counting again"""
+
+
+def estimated_row_count(queryset):
+    """
+    Return the planner's estimate of the number of rows of an unfiltered <queryset> on PostgreSQL, else None
+    """
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0) for tables that were never analyzed
+    return int(row[0]) if row and row[0] > 0 else None
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that does not count the rows on every page load.
+    Unfiltered tables use the planner estimate where available, all other counts are cached for ADMIN_COUNT_TIMEOUT,
+    so page counts can lag behind by a few minutes.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return super().count
+        key = 'inventorymanagement:admin-count:' + hashlib.md5(str(query).encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = estimated_row_count(self.object_list)
+            if count is None:
+                count = super().count
+            cache.set(key, count, ADMIN_COUNT_TIMEOUT)
+        return count
+
+
+class OwnerGroupListFilter(admin.SimpleListFilter):
+    """
+    Filter on owner_group with the choices taken from the (small) registry of participating groups,
+    instead of a SELECT DISTINCT over all bottles
+    """
+    title = 'owner group'
+    parameter_name = 'owner_group'
+
+    def lookups(self, request, model_admin):
+        return [(prefix, f'{prefix} ({name})' if name else prefix)
+                for prefix, name in ParticipatingGroup.objects.order_by('prefix').values_list('prefix', 'name')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(owner_group=self.value())
+        return queryset
+
 
 class BottleAdmin(admin.ModelAdmin):
     fieldsets = [
@@ -12,24 +75,103 @@ class BottleAdmin(admin.ModelAdmin):
         ('Status information', {'fields': ['status', 'borrowed_two_weeks']}),
         ('Last borrower information', {'fields': ['borrower_full_name', 'borrower_group', 'borrower_email']}),
     ]
-    list_display = ('id', 'code', 'location', 'status', 'checkout_date', 'borrowed_two_weeks')
-    list_filter = ['status', 'borrower_group', 'owner_group']
-    search_fields = ['id']
+    list_display = ('id', 'code', 'location', 'status', 'checkout_date', 'overdue')
+    # status and borrower_group have fixed choices, so none of the filters needs to query the bottles
+    list_filter = ['status', 'borrower_group', OwnerGroupListFilter]
+    search_fields = ['id']  # shows the search box, see get_search_results
+    paginator = CachedCountPaginator
+    show_full_result_count = False
     actions = ['mark_checked_out', 'mark_checked_in']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_overdue()
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search for bottles whose number starts with the search term.
+        This is a range query on the primary key (instead of the default icontains), so it uses the index.
+        """
+        term = search_term.strip().replace('-', '')
+        if not term:
+            return queryset, False
+        upper_bound = term[:-1] + chr(ord(term[-1]) + 1)
+        return queryset.filter(id__gte=term, id__lt=upper_bound), False
+
+    def overdue(self, obj):
+        return obj.is_overdue
+    overdue.boolean = True
+    overdue.short_description = '2 weeks exceeded?'
+    overdue.admin_order_field = 'is_overdue'
+
+    @staticmethod
+    def set_status(queryset, status, action):
+        """
+        Set the status of the selected bottles that are not in <status> yet, and log this as <action> for these
+        bottles only (bottles already in <status> would otherwise show up as loans in the analytics)
+        """
+        with transaction.atomic():
+            bottle_ids = list(queryset.exclude(status=status).select_for_update().values_list('id', flat=True))
+            with LocationCount.objects.tracking(bottle_ids):
+                Bottle.objects.filter(id__in=bottle_ids).update(status=status)
+            BottleEvent.objects.record(bottle_ids, action, source='admin')
+
     def mark_checked_out(self, request, queryset):
-        queryset.update(status='out')
+        self.set_status(queryset, 'out', 'checkout')
     mark_checked_out.short_description = "Mark selected bottles as checked out"
 
     def mark_checked_in(self, request, queryset):
-        queryset.update(status='in')
+        self.set_status(queryset, 'in', 'checkin')
     mark_checked_in.short_description = "Mark selected bottles as checked in"
 
 
+class BottleEventAdmin(admin.ModelAdmin):
+    """Read-only view of the (append-only) bottle history"""
+    list_display = ['timestamp', 'bottle_id', 'action', 'source', 'borrower_email']
+    list_filter = ['action', 'source']
+    search_fields = ['=bottle_id', '=borrower_email']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedBottleAdmin(admin.ModelAdmin):
+    """Read-only view of the archived bottles (moved there by archivebottles and the Expereact sync)"""
+    list_display = ['id', 'description', 'code', 'reason', 'archived_at', 'borrower_full_name']
+    list_filter = ['reason', 'owner_group']
+    search_fields = ['=id', '=code']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 class ChangeListEntryAdmin(admin.ModelAdmin):
     fields = ['date', 'description']
     list_display = ['entry_id', 'date', 'description']
 
 
+class ParticipatingGroupAdmin(admin.ModelAdmin):
+    fields = ['prefix', 'name']
+    list_display = ['prefix', 'name']
+
+
 admin.site.register(Bottle, BottleAdmin)
+admin.site.register(BottleEvent, BottleEventAdmin)
+admin.site.register(ArchivedBottle, ArchivedBottleAdmin)
 admin.site.register(ChangeListEntry, ChangeListEntryAdmin)
+admin.site.register(ParticipatingGroup, ParticipatingGroupAdmin)
@@ -0,0 +1,170 @@
+"""
+Usage analytics from precomputed daily rollups.
+
+Every day, after it has ended, the BottleEvents of that day are aggregated into LoanRollup and DescriptionRollup rows
+(management command aggregateanalytics). Each day is read from the event log only once, and the dashboard only reads
+the rollup tables, so it stays fast however long the history grows.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedBottle, Bottle, BottleEvent, DescriptionRollup, LoanRollup, SyncState
+
+DASHBOARD_DAYS = 90
+"""Number of days shown on the dashboard"""
+
+TOP_DESCRIPTIONS = 10
+"""Number of most-borrowed chemicals shown on the dashboard"""
+
+ANALYTICS_SOURCE = 'analytics'
+"""Key of the SyncState entry that records the last aggregated day"""
+
+
+def local_date(value=None):
+    """
+    Return the date of the datetime <value> (default: now) in the current time zone
+    """
+    value = value or timezone.now()
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def day_bounds(day):
+    """
+    Return the (start, end) datetimes of <day> in the current time zone
+    """
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    if timezone.is_naive(timezone.now()):
+        return start, end
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def last_aggregated_day():
+    """
+    Return the last day that was aggregated, None if no day was aggregated yet.
+    The day is recorded in the SyncState of the analytics (see mark_aggregated), so that days without events are not
+    scanned again. Before that was recorded, the last day with rollups is used.
+    """
+    last_day = SyncState.objects.filter(source=ANALYTICS_SOURCE).values_list('aggregated_until', flat=True).first()
+    return last_day or LoanRollup.objects.aggregate(last_day=Max('date'))['last_day']
+
+
+def mark_aggregated(day):
+    """
+    Record <day> as the last aggregated day (unless a later day is recorded already)
+    """
+    state, _ = SyncState.objects.get_or_create(source=ANALYTICS_SOURCE)
+    if state.aggregated_until is None or state.aggregated_until < day:
+        state.aggregated_until = day
+        state.save(update_fields=['aggregated_until'])
+
+
+def days_to_aggregate(today=None):
+    """
+    Return the days that have ended but are not aggregated yet, i.e. the days after the last aggregated day (or, if
+    no day was aggregated yet, from the day of the first event on).
+    """
+    today = today or local_date()
+    last_day = last_aggregated_day()
+    if last_day is None:
+        first_event = BottleEvent.objects.aggregate(first_event=Min('timestamp'))['first_event']
+        if first_event is None:
+            return []
+        first_day = local_date(first_event)
+    else:
+        first_day = last_day + datetime.timedelta(days=1)
+    return [first_day + datetime.timedelta(days=i) for i in range((today - first_day).days)]
+
+
+def aggregate_day(day):
+    """
+    Replace the rollups of <day> with aggregates of the BottleEvents of that day.
+    Owner group and description are taken from the bottle (or the archived bottle), the start of a loan that ended on
+    <day> is the checkout event preceding its end (found through the index on bottle and timestamp).
+    :return: tuple (number of loans, number of returns)
+    """
+    start, end = day_bounds(day)
+    events = BottleEvent.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    bottle = Bottle.objects.filter(id=OuterRef('bottle_id'))
+    archived_bottle = ArchivedBottle.objects.filter(id=OuterRef('bottle_id'))
+    owner_group = Coalesce(Subquery(bottle.values('owner_group')[:1]),
+                           Subquery(archived_bottle.values('owner_group')[:1]),
+                           Value(''))
+
+    checkouts = (events.filter(action='checkout')
+                 .annotate(owner_group=owner_group,
+                           description=Coalesce(Subquery(bottle.values('description')[:1]),
+                                                Subquery(archived_bottle.values('description')[:1]),
+                                                Value('')))
+                 .values_list('owner_group', 'borrower_group', 'description'))
+
+    previous = (BottleEvent.objects
+                .filter(bottle_id=OuterRef('bottle_id'), timestamp__lt=OuterRef('timestamp'),
+                        action__in=['checkout', 'checkin', 'empty'])
+                .order_by('-timestamp', '-id'))
+    returns = (events.filter(action__in=['checkin', 'empty'])
+               .annotate(owner_group=owner_group,
+                         previous_action=Subquery(previous.values('action')[:1]),
+                         loan_start=Subquery(previous.values('timestamp')[:1]),
+                         loan_borrower_group=Subquery(previous.values('borrower_group')[:1]))
+               # only the end of a loan (marking a checked-in bottle empty is not)
+               .filter(previous_action='checkout')
+               .values_list('owner_group', 'loan_borrower_group', 'loan_start', 'timestamp'))
+
+    loans = Counter()
+    descriptions = Counter()
+    for owner_group, borrower_group, description in checkouts:
+        loans[owner_group, borrower_group or ''] += 1
+        descriptions[description] += 1
+    returned = Counter()
+    loan_days = defaultdict(float)
+    for owner_group, borrower_group, loan_start, loan_end in returns:
+        returned[owner_group, borrower_group or ''] += 1
+        loan_days[owner_group, borrower_group or ''] += (loan_end - loan_start).total_seconds() / 86400
+
+    with transaction.atomic():
+        LoanRollup.objects.filter(date=day).delete()
+        DescriptionRollup.objects.filter(date=day).delete()
+        LoanRollup.objects.bulk_create([
+            LoanRollup(date=day, owner_group=owner_group, borrower_group=borrower_group,
+                       loans=loans[owner_group, borrower_group], returns=returned[owner_group, borrower_group],
+                       loan_days=loan_days[owner_group, borrower_group])
+            for owner_group, borrower_group in loans.keys() | returned.keys()
+        ])
+        DescriptionRollup.objects.bulk_create([
+            DescriptionRollup(date=day, description=description, loans=count)
+            for description, count in descriptions.items()
+        ])
+    return sum(loans.values()), sum(returned.values())
+
+
+def dashboard(days=DASHBOARD_DAYS, today=None):
+    """
+    Return the dashboard data for the last <days> days (read from the rollups only):
+        - group_loans: loans, returns and mean loan duration per owner group and borrower group
+        - top_descriptions: the TOP_DESCRIPTIONS most borrowed chemicals
+        - aggregated_until: the last aggregated day
+    """
+    today = today or local_date()
+    since = today - datetime.timedelta(days=days)
+    group_loans = list(LoanRollup.objects.filter(date__gte=since)
+                       .values('owner_group', 'borrower_group')
+                       .annotate(loans=Sum('loans'), returns=Sum('returns'), loan_days=Sum('loan_days'))
+                       .order_by('-loans', 'owner_group', 'borrower_group'))
+    for row in group_loans:
+        row['mean_loan_days'] = row['loan_days'] / row['returns'] if row['returns'] else None
+    top_descriptions = (DescriptionRollup.objects.filter(date__gte=since)
+                        .values('description')
+                        .annotate(loans=Sum('loans'))
+                        .order_by('-loans', 'description')[:TOP_DESCRIPTIONS])
+    return {
+        'days': days,
+        'group_loans': group_loans,
+        'top_descriptions': list(top_descriptions),
+        'aggregated_until': last_aggregated_day(),
+    }
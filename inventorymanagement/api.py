@@ -0,0 +1,142 @@
+"""
+A lightweight JSON API for barcode scanners and lab scripts.
+
+Lookups are answered by a single GET (no form, no redirect). State transitions take a JSON body with a list of
+bottle codes, so several bottles can be handled in one request. Validation is shared with the batch forms.
+"""
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .forms import BatchCheckoutForm, BatchCheckinForm, MAX_BATCH_SIZE
+from .models import Bottle
+from .views import apply_batch_checkout, apply_batch_checkin
+
+API_FIELDS = ['id', 'description', 'code', 'location', 'status', 'borrower_full_name', 'checkout_date']
+"""Bottle fields contained in the API payloads"""
+
+
+def error_response(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def clean_code(code):
+    """Remove dashes that people might have placed in a bottle code"""
+    return code.replace('-', '')
+
+
+def read_json_body(request):
+    """
+    Return the decoded JSON body of <request>, or None if the body is not a JSON object
+    """
+    if request.content_type != 'application/json':
+        return None
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def transition_payload(results):
+    """
+    Convert the per-bottle results of a batch checkout/checkin to the API format
+    """
+    return {'results': [
+        {
+            'id': code,
+            'ok': error is None,
+            'status': bottle.status if bottle is not None else None,
+            'error': error,
+        }
+        for code, bottle, error in results
+    ]}
+
+
+@require_GET
+def bottle_detail(request, pk):
+    """
+    Return the bottle with code <pk>
+    """
+    bottle = Bottle.objects.filter(id=clean_code(pk)).values(*API_FIELDS).first()
+    if bottle is None:
+        return error_response('This bottle is not listed in the database.', status=404)
+    return JsonResponse(bottle)
+
+
+@require_GET
+def bottle_list(request):
+    """
+    Return all bottles with the codes given as comma-separated list in the query parameter 'ids'
+    """
+    ids = [clean_code(code) for code in request.GET.get('ids', '').split(',') if code.strip()]
+    if not ids:
+        return error_response('Please give at least one bottle code in the parameter ids.', status=400)
+    if len(ids) > MAX_BATCH_SIZE:
+        return error_response(f'Please give at most {MAX_BATCH_SIZE} bottle codes at once.', status=400)
+    bottles = list(Bottle.objects.filter(id__in=ids).values(*API_FIELDS))
+    found = {bottle['id'] for bottle in bottles}
+    return JsonResponse({'bottles': bottles, 'missing': [code for code in ids if code not in found]})
+
+
+@require_GET
+def owner_bottles(request, code):
+    """
+    Return all bottles of the owner code <code>. With the query parameter only_checked_out=true, only the bottles that
+    are checked out are returned.
+    """
+    code = code.upper()
+    queryset = Bottle.objects.filter(code=code)
+    if request.GET.get('only_checked_out', '').lower() in ('1', 'true'):
+        queryset = queryset.filter(status='out')
+    return JsonResponse({'code': code, 'bottles': list(queryset.order_by('description').values(*API_FIELDS))})
+
+
+@csrf_exempt
+@require_POST
+def checkout(request):
+    """
+    Check out the bottles given in the JSON body
+    {"ids": [...], "borrower_full_name": ..., "borrower_email": ..., "borrower_group": ...}
+    """
+    data = read_json_body(request)
+    if data is None or not isinstance(data.get('ids'), list):
+        return error_response('Please send a JSON object with a list of bottle codes in "ids".', status=400)
+    form = BatchCheckoutForm({
+        'bottle_codes': ' '.join(str(code) for code in data['ids']),
+        'borrower_full_name': data.get('borrower_full_name'),
+        'borrower_email': data.get('borrower_email'),
+        'borrower_group': data.get('borrower_group'),
+    })
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    results, _ = apply_batch_checkout(form)
+    return JsonResponse(transition_payload(results))
+
+
+def checkin_view(return_status):
+    """
+    Create a view that returns (return_status='OK') or marks empty (return_status='EMPTY') the bottles given in the
+    JSON body {"ids": [...]}
+    """
+    @csrf_exempt
+    @require_POST
+    def view(request):
+        data = read_json_body(request)
+        if data is None or not isinstance(data.get('ids'), list):
+            return error_response('Please send a JSON object with a list of bottle codes in "ids".', status=400)
+        form = BatchCheckinForm({
+            'bottle_codes': ' '.join(str(code) for code in data['ids']),
+            'return_status': return_status,
+        })
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        results, _ = apply_batch_checkin(form)
+        return JsonResponse(transition_payload(results))
+    return view
+
+
+checkin = checkin_view('OK')
+mark_empty = checkin_view('EMPTY')
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class InventorymanagementConfig(AppConfig):
     name = 'inventorymanagement'
+
+    def ready(self):
+        # connect the signal receivers
+        from . import signals  # noqa: F401
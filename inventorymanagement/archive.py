@@ -0,0 +1,86 @@
+"""
+Archival of bottles that are no longer in use.
+
+Empty bottles stay in the Bottle table for a retention period (so that the last borrower can still look them up and
+remove them from Expereact), then they are moved to the ArchivedBottle table by the management command archivebottles.
+As long as an archived empty bottle is still listed in Expereact, the sync leaves it in the archive.
+Bottles that disappear from Expereact are moved there by the sync (see parseexpereact). The queries on the Bottle
+table (listings, admin, counts) then only see live bottles, while the status page falls back to the archive.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedBottle, Bottle, BottleEvent, LocationCount
+from .search import unindex_bottles
+
+ARCHIVE_FIELDS = [field.name for field in ArchivedBottle._meta.get_fields() if field.name not in ('reason', 'archived_at')]
+"""Bottle fields that are copied to the archive"""
+
+EMPTY_RETENTION_DAYS = 30
+"""Default number of days an empty bottle is kept in the Bottle table"""
+
+ARCHIVE_BATCH_SIZE = 500
+"""Default number of bottles moved to the archive per transaction"""
+
+
+def copy_to_archive(bottle_ids, reason):
+    """
+    Copy the bottles with ids <bottle_ids> to the archive (replacing earlier archived bottles with the same ids),
+    with one SELECT, one DELETE and one INSERT. The bottles are not removed from the Bottle table.
+    :param reason: why the bottles are archived (see ArchivedBottle.REASONS)
+    :return: number of bottles copied
+    """
+    archived_at = timezone.now()
+    archived = [ArchivedBottle(reason=reason, archived_at=archived_at, **bottle)
+                for bottle in Bottle.objects.filter(id__in=bottle_ids).values(*ARCHIVE_FIELDS)]
+    ArchivedBottle.objects.filter(id__in=[bottle.id for bottle in archived]).delete()
+    ArchivedBottle.objects.bulk_create(archived)
+    return len(archived)
+
+
+def expired_empty_bottles(retention_days=EMPTY_RETENTION_DAYS, now=None):
+    """
+    Returns the bottles that were marked empty more than <retention_days> days before <now> (default: now).
+    The time a bottle was marked empty is taken from its BottleEvents, empty bottles without such an event
+    (marked empty before the events were logged) count as expired.
+    """
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=retention_days)
+    marked_empty_recently = BottleEvent.objects.filter(bottle_id=OuterRef('id'), action='empty',
+                                                       timestamp__gte=cutoff)
+    return Bottle.objects.filter(status='empty').exclude(Exists(marked_empty_recently))
+
+
+def archive_bottles(bottle_ids, reason):
+    """
+    Move the bottles with ids <bottle_ids> to the archive in a single transaction: they are copied to ArchivedBottle,
+    removed from the Bottle table, the search index and the location counts, and the archival is logged as a
+    BottleEvent.
+    :param reason: why the bottles are archived (see ArchivedBottle.REASONS)
+    """
+    bottle_ids = list(bottle_ids)
+    with transaction.atomic(), LocationCount.objects.tracking(bottle_ids):
+        copy_to_archive(bottle_ids, reason)
+        bottles = Bottle.objects.filter(id__in=bottle_ids)
+        bottles._raw_delete(bottles.db)  # faster than .delete (we don't need cascading)
+        unindex_bottles(bottle_ids)
+        BottleEvent.objects.record(bottle_ids, 'archived', source='command')
+
+
+def archive_empty_bottles(retention_days=EMPTY_RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move all empty bottles past the retention period to the archive, <batch_size> bottles per transaction
+    (so that the Bottle table is never locked for long).
+    :return: list of the ids of the archived bottles
+    """
+    archived = []
+    while True:
+        with transaction.atomic():
+            bottle_ids = list(expired_empty_bottles(retention_days).select_for_update()
+                              .order_by('id').values_list('id', flat=True)[:batch_size])
+            if not bottle_ids:
+                return archived
+            archive_bottles(bottle_ids, 'empty')
+        archived += bottle_ids
@@ -0,0 +1,250 @@
+"""
+Benchmark suite for the Expereact sync and the web request paths (management command runbenchmarks).
+
+Synthetic exports in the 14-column HTML format of Expereact are synced into an empty database, timing every stage of
+the sync pipeline. Then every URL of the app (see urls.py) is requested through the Django test client, recording
+latency and the number of database queries. The results are plain dicts, so they can be written as JSON and compared
+across commits.
+"""
+import datetime
+import html
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+import pandas as pd
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls
+from .management.commands.parseexpereact import EXPEREACT_COLUMNS, apply_schema, cleanup, \
+    convert_file_to_df_parallel, convert_rows_to_df, convert_table_to_df, filter_groups, iter_expereact_rows, \
+    load_export, parse_expereact, stage_export, swap_in_staged, update_records
+from .models import ArchivedBottle, Bottle, BottleEvent, DescriptionRollup, LoanRollup, LocationCount
+from .search import rebuild_index
+
+EXPEREACT_HEADER = ['Supplier', 'Catalogue Nr', 'Product Description', 'Group Code', 'User Name', 'Location',
+                    'Bottle Nr', 'Order Nr', 'Quantity', 'Price (CHF)', 'Order Date', 'Reception Date', 'Status',
+                    'Comment']
+"""Header of the Expereact table"""
+
+CHEMICALS = ['Acetone', 'Tetrahydrofuran (THF)', 'THF', 'Oxolane', 'Toluene', 'Dichloromethane', 'DCM',
+             'Dimethylformamide (DMF)', 'Ethanol', 'Methanol', 'Diethyl ether', 'Acetonitrile', 'Ethyl acetate',
+             'Hexane', 'Triethylamine', 'Sodium chloride', 'Palladium(II) acetate', '2-(Trimethylsilyl)ethanol',
+             'Benzaldehyde', 'Copper(I) iodide']
+"""Chemical names of the synthetic exports (including synonyms of the same compound)"""
+
+GRADES = ['', ', anhydrous', ', 99%', ' (HPLC grade)', ', dry', ', puriss. p.a.']
+
+PARTICIPATING_PREFIXES = ['GBOD', 'GYAM', 'LEHR', 'GZEN']
+"""Group prefixes that are participating groups in a fresh database (see migration 0046)"""
+
+OTHER_PREFIXES = ['GCAR', 'GKAS', 'GMOR', 'GWEN']
+
+
+def synthetic_rows(n_rows, seed=0):
+    """
+    Yield <n_rows> rows (lists of the 14 cell texts) of a synthetic Expereact export with a realistic mix:
+    half of the bottles belong to participating groups, some owner codes are malformed, descriptions repeat and
+    contain synonyms, locations are room-shelf.
+    """
+    rng = random.Random(seed)
+    codes = [prefix + a + b for prefix in PARTICIPATING_PREFIXES + OTHER_PREFIXES for a in 'ABCDEF' for b in 'ABCDEF']
+    for i in range(n_rows):
+        code = rng.choice(codes) if rng.random() < 0.99 else rng.choice(['GBODd1', 'n/a', 'GBODDUX'])
+        if rng.random() < 0.8:
+            description = rng.choice(CHEMICALS) + rng.choice(GRADES)
+        else:
+            description = f'Chemical <b>{rng.randrange(5000)}</b>'
+        yield ['Sial', str(rng.randrange(100000)), description, code, f'User {code}',
+               f'F{rng.randrange(300, 330)}-SHELF{rng.randrange(10)}', str(100000 + i), str(rng.randrange(1000)),
+               rng.choice(['5 mL', '100 mL', '1 L', '25 g']), f'{rng.randrange(1, 500)}.{rng.randrange(100):02d}',
+               '2020-01-01', '2020-01-02', 'ok', '']
+
+
+def write_synthetic_export(path, n_rows, seed=0):
+    """
+    Write a synthetic Expereact export with <n_rows> bottles to <path>, in the HTML format of the real export
+    (cells may contain markup, the table is followed by a row that does not belong to it)
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<html><head><meta charset="utf-8"></head><body><table>\n')
+        file.write('<tr>' + ''.join(f'<th>{html.escape(name)}</th>' for name in EXPEREACT_HEADER) + '</tr>\n')
+        for row in synthetic_rows(n_rows, seed):
+            file.write('<tr>' + ''.join(f'<td>{cell}</td>' for cell in row) + '</tr>\n')
+        file.write('<tr><td>Total</td></tr>\n</table></body></html>')
+
+
+def reset_data():
+    """Remove all bottles and everything derived from them (on the benchmark database only!)"""
+    for model in [Bottle, BottleEvent, LocationCount, ArchivedBottle, LoanRollup, DescriptionRollup]:
+        model.objects.all().delete()
+    rebuild_index()
+    cache.clear()
+
+
+def measure(func, *args, **kwargs):
+    """
+    Call <func> and return a tuple (result, dict with the run time in seconds and the number of queries)
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    return result, {'seconds': round(seconds, 6), 'queries': len(queries)}
+
+
+def change_locations(df, fraction=0.01, seed=0):
+    """Return a copy of the cleaned DataFrame <df> in which <fraction> of the bottles moved to another shelf"""
+    df = df.copy()
+    changed = df.sample(frac=fraction, random_state=seed).index
+    for column, value in [('location', 'F399-SHELF9'), ('room', 'F399'), ('shelf', 'SHELF9')]:
+        if value not in df[column].cat.categories:
+            df[column] = df[column].cat.add_categories([value])
+        df.loc[changed, column] = value
+    return df
+
+
+def benchmark_sync(path, workers=None):
+    """
+    Sync the export at <path> into the (empty) database, timing every stage of the pipeline, then time the syncs of
+    the same export (nothing changed) and of an export in which 1 % of the bottles moved (directly and through the
+    staging table), and the alternative parsers (streaming, parallel with <workers> processes (default: one per CPU)
+    and from the snapshot).
+    :return: dict {stage: {'seconds': ..., 'queries': ...}}, plus the number of rows after some stages and the
+        memory used by the DataFrame (bytes) after filter_groups and apply_schema
+    """
+    stages = {}
+    table, stages['parse'] = measure(parse_expereact, local=True, path=path)
+    df, stages['convert_table_to_df'] = measure(convert_table_to_df, table)
+    del table
+    stages['convert_table_to_df']['rows'] = len(df)
+    df, stages['cleanup'] = measure(cleanup, df)
+    df, stages['filter_groups'] = measure(filter_groups, df)
+    stages['filter_groups']['rows'] = len(df)
+    stages['filter_groups']['bytes'] = int(df.memory_usage(deep=True).sum())
+    (df, _), stages['apply_schema'] = measure(apply_schema, df)
+    stages['apply_schema']['bytes'] = int(df.memory_usage(deep=True).sum())
+    _, stages['update_records'] = measure(update_records, df)
+    _, stages['update_records (unchanged)'] = measure(update_records, df)
+    _, stages['update_records (1% moved)'] = measure(update_records, change_locations(df))
+    _, stages['stage_export (1% moved)'] = measure(stage_export, change_locations(df, seed=1))
+    _, stages['swap_in_staged (1% moved)'] = measure(swap_in_staged)
+    _, stages['parse (streaming)'] = measure(
+        lambda: convert_rows_to_df(iter_expereact_rows(path), columns=list(EXPEREACT_COLUMNS)))
+    workers = workers or os.cpu_count()
+    _, stages[f'parse (parallel, {workers} workers)'] = measure(
+        convert_file_to_df_parallel, path, workers=workers, columns=list(EXPEREACT_COLUMNS))
+    _, stages['load_export (writes snapshot)'] = measure(load_export, path, columns=list(EXPEREACT_COLUMNS))
+    _, stages['load_export (from snapshot)'] = measure(load_export, path, columns=list(EXPEREACT_COLUMNS))
+    return stages
+
+
+def url_cases(repeat):
+    """
+    Returns the requests of the URL benchmark: list of (url name, method, function of the run number returning the
+    tuple (url arguments, request data)). Runs that change a bottle use a different bottle every time, so that every
+    run does the full work. Needs a synced database.
+    """
+    bottle_ids = list(Bottle.objects.filter(status='in').order_by('id').values_list('id', flat=True)[:6 * repeat])
+    if len(bottle_ids) < 6 * repeat:
+        raise ValueError('Not enough bottles for the URL benchmark, sync more rows or use fewer repeats')
+    to_checkout, to_return, to_batch, to_api = (bottle_ids[:repeat], bottle_ids[repeat:2 * repeat],
+                                                bottle_ids[2 * repeat:4 * repeat], bottle_ids[4 * repeat:6 * repeat])
+    for bottle_id in to_return + to_api[repeat:]:
+        Bottle.objects.check_out(bottle_id, 'Test Guy', 'testguy@ethz.ch', 'Bode', timezone.now().date())
+    bottle = Bottle.objects.get(id=bottle_ids[0])
+    borrower = {'borrower_full_name': 'Test Guy', 'borrower_email': 'testguy@ethz.ch', 'borrower_group': 'Bode'}
+    return [
+        ('index', 'get', lambda i: ([], None)),
+        ('borrow', 'post', lambda i: ([], dict(borrower, id=to_checkout[i], status='out',
+                                              checkout_date=timezone.now().date()))),
+        ('borrow_batch', 'post', lambda i: ([], dict(borrower, bottle_codes='\n'.join(to_batch[2 * i:2 * i + 2])))),
+        ('confirmcheckout', 'get', lambda i: ([to_checkout[i]], None)),
+        ('return', 'post', lambda i: ([], {'id': to_return[i], 'status': 'in', 'return_status': 'OK'})),
+        ('return_batch', 'post', lambda i: ([], {'bottle_codes': '\n'.join(to_batch[2 * i:2 * i + 2]),
+                                                 'return_status': 'OK'})),
+        ('confirmreturn', 'get', lambda i: ([to_return[i]], None)),
+        ('confirmempty', 'get', lambda i: ([to_return[i]], None)),
+        ('status', 'post', lambda i: ([], {'bottle_code': bottle.id})),
+        ('detail', 'get', lambda i: ([bottle.id], None)),
+        ('search', 'get', lambda i: ([], {'q': 'thf dry'})),
+        ('compound', 'get', lambda i: ([bottle.compound_key or 'acetone'], None)),
+        ('about', 'get', lambda i: ([], None)),
+        ('changelist', 'get', lambda i: ([], None)),
+        ('analytics', 'get', lambda i: ([], None)),
+        ('locations', 'get', lambda i: ([], None)),
+        ('room', 'get', lambda i: ([bottle.room or '-'], None)),
+        ('shelf', 'get', lambda i: ([bottle.room or '-', bottle.shelf or '-'], None)),
+        ('list', 'post', lambda i: ([], {'user_code': bottle.code})),
+        ('list_detail', 'get', lambda i: ([bottle.code, 'False'], None)),
+        ('api_bottle_list', 'get', lambda i: ([], {'ids': ','.join(bottle_ids[:20])})),
+        ('api_bottle_detail', 'get', lambda i: ([bottle.id], None)),
+        ('api_owner_bottles', 'get', lambda i: ([bottle.code], None)),
+        ('api_checkout', 'post', lambda i: ([], dict(borrower, ids=[to_api[i]]))),
+        ('api_checkin', 'post', lambda i: ([], {'ids': [to_api[repeat + i]]})),
+        ('api_empty', 'post', lambda i: ([], {'ids': [to_api[i]]})),
+    ]
+
+
+def missing_url_cases(cases):
+    """Returns the names of the URLs in urls.py that have no benchmark case"""
+    return sorted({pattern.name for pattern in urls.urlpatterns} - {name for name, _, _ in cases})
+
+
+def benchmark_urls(cases, repeat=5):
+    """
+    Request every URL <repeat> times through the test client (the first run of cached pages fills the cache).
+    :param cases: the requests, as returned by url_cases(repeat)
+    :return: dict {url name: {'median_ms', 'min_ms', 'max_ms', 'queries' (of the last run), 'status_code'}}
+    """
+    client = Client()
+    results = {}
+    for name, method, request in cases:
+        timings = []
+        for i in range(repeat):
+            args, data = request(i)
+            path = reverse(f'{urls.app_name}:{name}', args=args)
+            if name.startswith('api_') and method == 'post':
+                response, stats = measure(client.post, path, data, content_type='application/json')
+            else:
+                response, stats = measure(getattr(client, method), path, data)
+            timings.append(stats['seconds'] * 1000)
+        results[name] = {
+            'median_ms': round(statistics.median(timings), 3),
+            'min_ms': round(min(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': stats['queries'],
+            'status_code': response.status_code,
+        }
+    return results
+
+
+def git_commit():
+    """Returns the hash of the checked out git commit (None outside of a git repository)"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def environment():
+    """Returns the commit, the versions and the database the benchmarks ran with"""
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'pandas': pd.__version__,
+        'database': connection.vendor,
+    }
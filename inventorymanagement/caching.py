@@ -0,0 +1,52 @@
+"""
+Caching of rendered pages that are requested often but change rarely.
+
+The cache keys contain the current date, so pages that depend on it (e.g. "recent" changes) are rebuilt every day.
+Pages are invalidated explicitly (see signals.py) when the data shown on them changes. In production, configure a
+cache that is shared between the server processes (e.g. FileBasedCache), otherwise an invalidation only reaches the
+process that made the change.
+"""
+import datetime
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+"""Maximum time (in seconds) a page is served from the cache"""
+
+CHANGELIST_PAGES = ['index', 'changelist']
+"""Cached pages that show ChangeListEntry objects"""
+
+
+def page_cache_key(name, date=None):
+    """
+    Return the cache key of the page <name> on <date> (default: today)
+    """
+    date = date or datetime.date.today()
+    return f'inventorymanagement:page:{name}:{date.isoformat()}'
+
+
+def invalidate_pages(names):
+    """
+    Remove today's version of the pages <names> from the cache
+    """
+    cache.delete_many([page_cache_key(name) for name in names])
+
+
+class CachedPageMixin:
+    """
+    Mixin for class-based views that serves GET requests from the cache.
+    The rendered content is stored under page_cache_key(cache_name) until it is invalidated or times out.
+    Only use this for pages that do not depend on the request (no forms, no cookies, no query parameters).
+    """
+    cache_name = None
+
+    def get(self, request, *args, **kwargs):
+        key = page_cache_key(self.cache_name)
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        cache.set(key, response.content, PAGE_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,125 @@
+"""
+Normalisation of the free-text chemical names (bottle descriptions) from Expereact.
+
+A description such as "THF, anhydrous, 99.9%" or "Tetrahydrofuran (THF) extra dry" is
+    1. case-folded,
+    2. stripped of purity and grade information (percentages, "anhydrous", "for synthesis", "p.a.", ...),
+    3. split into its parts (comma-separated segments and parenthesised synonyms),
+    4. mapped to a canonical compound key through the synonym table in data/chemical_synonyms.csv.
+Names that are not in the synonym table are their own key, so bottles with the same name still share a key.
+The key is stored in Bottle.compound_key (indexed), so all bottles of a compound are found with one query.
+"""
+import csv
+import functools
+import hashlib
+import os
+import re
+import unicodedata
+
+SYNONYM_FILE = os.path.join(os.path.dirname(__file__), 'data', 'chemical_synonyms.csv')
+
+MAX_KEY_LENGTH = 200
+"""Maximum length of a compound key (length of Bottle.compound_key)"""
+
+GRADE_PATTERN = re.compile(
+    r"""
+    [≥>~]?=?\s*\d+(?:[.,]\d+)?\s*\+?\s*%      # purity (99.9%, >=99 %, 99+%)
+    | \bp\.\s?a\.                                  # p.a.
+    | \bph\.?\s?eur\.?                             # Ph. Eur.
+    | \bfor\s+(?:synthesis|analysis|hplc|gc|spectroscopy|peptide\s+synthesis)\b
+    | \bover\s+molecular\s+sieves?\b
+    | \bsure/?seal\b
+    | \binhibitor[\s-]free\b
+    | \btrace\s+metals?\s+basis\b
+    | \bextra\s+dry\b
+    """,
+    re.VERBOSE,
+)
+
+GRADE_WORDS = frozenset([
+    'absolute', 'acs', 'analytical', 'anhydrous', 'bioreagent', 'certified', 'chromasolv', 'distilled', 'dry',
+    'gc', 'grade', 'hplc', 'puriss', 'purified', 'purum', 'reagent', 'reagentplus', 'redistilled', 'spectroscopic',
+    'stabilised', 'stabilized', 'tech', 'technical', 'ultrapure', 'usp', 'uvasol',
+])
+"""Words that describe the grade (not the compound) and are removed"""
+
+FORM_WORDS = frozenset([
+    'beads', 'chips', 'crystalline', 'crystals', 'flakes', 'foil', 'granular', 'granules', 'lumps', 'pellets',
+    'pieces', 'powder', 'shot', 'turnings', 'wire',
+])
+"""Words that describe the physical form of a solid and are removed"""
+
+SEGMENT_SEPARATOR = re.compile(r'[,;]\s+|\s+-\s+')
+"""Separates the parts of a description (commas without a space are locants, e.g. 2,4-dinitrophenol)"""
+
+PARENTHESES = re.compile(r'(?<!\S)\(([^()]*)\)(?=[\s,]|$)')
+"""Parenthesised words of a name (but not parentheses within a word, e.g. palladium(ii) acetate)"""
+
+
+def normalize_name(description):
+    """
+    Return the normalised name of the compound in <description>: case-folded, without purity and grade information
+    and with single spaces
+    """
+    name = unicodedata.normalize('NFKC', description or '').casefold()
+    name = GRADE_PATTERN.sub(' ', name)
+    segments = []
+    for segment in SEGMENT_SEPARATOR.split(name):
+        words = [word.strip('.,;:') for word in segment.split()]
+        words = [word for word in words if word.strip('()') and word.strip('()') not in GRADE_WORDS | FORM_WORDS]
+        if words:
+            segments.append(' '.join(words))
+    return ', '.join(segments)
+
+
+def name_candidates(name):
+    """
+    Yield the parts of a normalised <name> that may be a synonym, most specific first: the full name, the name
+    without parenthesised parts, the parenthesised parts and the comma-separated segments
+    """
+    yield name
+    without_parentheses = ' '.join(PARENTHESES.sub(' ', name).split()).strip(', ')
+    yield without_parentheses
+    for part in PARENTHESES.findall(name):
+        yield part.strip()
+    for segment in without_parentheses.split(', '):
+        yield segment
+
+
+@functools.lru_cache(maxsize=None)
+def synonyms(path=SYNONYM_FILE):
+    """
+    Return the synonym table at <path> as dict {normalised synonym: compound key}
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        return {normalize_name(row['synonym']): row['compound_key'] for row in csv.DictReader(file)}
+
+
+@functools.lru_cache(maxsize=None)
+def synonyms_of(compound_key, path=SYNONYM_FILE):
+    """
+    Return all synonyms of <compound_key> in the synonym table at <path> (empty for unknown compounds)
+    """
+    return tuple(sorted(synonym for synonym, key in synonyms(path).items() if key == compound_key))
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def compound_key(description):
+    """
+    Return the canonical compound key of the chemical in <description>
+    """
+    name = normalize_name(description)
+    table = synonyms()
+    for candidate in name_candidates(name):
+        if candidate in table:
+            return table[candidate]
+    without_parentheses = ' '.join(PARENTHESES.sub(' ', name).split()).strip(', ')
+    return (without_parentheses or name)[:MAX_KEY_LENGTH]
+
+
+def synonym_file_digest(path=SYNONYM_FILE):
+    """
+    Return a digest of the synonym table at <path>, which changes whenever compound keys may change
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
@@ -0,0 +1,18 @@
+"""
+Path converters of the URLs of the app
+"""
+from django.contrib.admin.utils import quote, unquote
+
+
+class LocationConverter:
+    """
+    A room or shelf in the URLs of the location pages. Locations may contain slashes (e.g. "H 332/334-SHELF1"), so
+    the value is escaped the same way as the primary keys in the admin URLs ("/" becomes "_2F", "_" becomes "_5F").
+    """
+    regex = '[^/]+'
+
+    def to_python(self, value):
+        return unquote(value)
+
+    def to_url(self, value):
+        return quote(value)
@@ -1,10 +1,79 @@
+import re
+
 from django import forms
 from django.core.exceptions import ValidationError
 from django.forms import ModelForm, HiddenInput
-from .models import Bottle
+from .models import ArchivedBottle, Bottle
+
+
+def not_in_db_error():
+    """
+    Returns the ValidationError for a bottle code that is not in the database
+    """
+    return ValidationError(
+        message='This bottle is not listed in the database. '
+                'Please check if you used the right bottle code and try again.',
+        code='not_in_db'
+    )
+
+
+def checkout_unavailable_error(bottle):
+    """
+    Returns the ValidationError for a bottle that cannot be checked out because of its current status
+    (or because it is no longer in the database, if <bottle> is None)
+    """
+    if bottle is None:
+        return not_in_db_error()
+    if bottle.status == 'out':
+        return ValidationError(
+            message=f'This bottle is already checked out by {bottle.borrower_full_name}.',
+            code='checked_out'
+        )
+    return ValidationError(
+        message='This bottle is marked as empty and cannot be checked out.',
+        code='empty'
+    )
+
+
+def checkin_unavailable_error(bottle):
+    """
+    Returns the ValidationError for a bottle that cannot be returned because of its current status
+    (or because it is no longer in the database, if <bottle> is None)
+    """
+    if bottle is None:
+        return not_in_db_error()
+    if bottle.status == 'empty':
+        return ValidationError(
+            message='This bottle is already marked as empty.',
+            code='empty'
+        )
+    return ValidationError(
+        message='This bottle is not checked out.',
+        code='checked_in'
+    )
+
 
+class BottleLookupMixin:
+    """
+    Mixin for the ModelForms that change a bottle.
+    The user-entered bottle code is resolved to a Bottle only once, and the result is used as the form instance.
+    The view can then use form.instance (e.g. to render the confirmation) without querying the bottle again.
+    """
+
+    def resolve_bottle(self, id):
+        """
+        Set the form instance to the bottle with code <id> and return it. Raises ValidationError if there is no such
+        bottle. If the form was already created with this bottle as instance, no query is made.
+        """
+        if self.instance.pk != id or self.instance._state.adding:
+            try:
+                self.instance = Bottle.objects.get(id=id)
+            except Bottle.DoesNotExist:
+                raise not_in_db_error()
+        return self.instance
 
-class BottleCheckoutForm(ModelForm):
+
+class BottleCheckoutForm(BottleLookupMixin, ModelForm):
     """
     This is a form derived from the models.Bottle that records data to check out a bottle
     """
@@ -26,16 +95,13 @@ class BottleCheckoutForm(ModelForm):
         Validate that the user-entered bottle code exists in the database
         """
         id = ''.join(self.cleaned_data['id'].split('-'))
-        if not Bottle.objects.filter(id=id).exists():
-            raise ValidationError(
-                message='This bottle is not listed in the database. '
-                        'Please check if you used the right bottle code and try again.',
-                code='not_in_db'
-            )
+        bottle = self.resolve_bottle(id)
+        if bottle.status != 'in':
+            raise checkout_unavailable_error(bottle)
         return id
 
 
-class BottleCheckinForm(ModelForm):
+class BottleCheckinForm(BottleLookupMixin, ModelForm):
     """
     This is a form derived from the models.Bottle that records data to return a bottle
     """
@@ -54,15 +120,90 @@ class BottleCheckinForm(ModelForm):
         Validate that the user-entered bottle code exists in the database
         """
         id = ''.join(self.cleaned_data['id'].split('-'))
-        try:
-            Bottle.objects.filter(id=id)[0]
-        except IndexError:
+        self.resolve_bottle(id)
+        return id
+
+    def clean(self):
+        """
+        Validate that the bottle can be returned (or marked empty) in its current status
+        """
+        cleaned_data = super().clean()
+        id = cleaned_data.get('id')
+        return_status = cleaned_data.get('return_status')
+        # id is only in cleaned_data if clean_id() resolved the bottle (which is then the form instance)
+        if id is not None and return_status is not None:
+            allowed_status = ['in', 'out'] if return_status == 'EMPTY' else ['out']
+            if self.instance.status not in allowed_status:
+                self.add_error('id', checkin_unavailable_error(self.instance))
+        return cleaned_data
+
+
+MAX_BATCH_SIZE = 100
+"""Maximum number of bottle codes in one batch checkout/checkin"""
+
+
+class BatchBottleCodesMixin:
+    """
+    Mixin for the batch forms. The field bottle_codes takes a list of bottle codes (separated by line breaks, spaces,
+    commas or semicolons, as they come from pasting or scanning one bottle after another).
+    All bottles are looked up with a single query. Unknown codes do not invalidate the form, they are reported per bottle.
+    """
+
+    def clean_bottle_codes(self):
+        """
+        Split the user input into a list of bottle codes (without dashes and duplicates)
+        and look up the corresponding bottles (available as self.bottles afterwards)
+        """
+        codes = []
+        for code in re.split(r'[\s,;]+', self.cleaned_data['bottle_codes']):
+            code = code.replace('-', '')
+            if code and code not in codes:
+                codes.append(code)
+        if not codes:
+            raise ValidationError(message='Please enter at least one bottle code.', code='required')
+        if len(codes) > MAX_BATCH_SIZE:
             raise ValidationError(
-                message='This bottle is not listed in the database. '
-                        'Please check if you used the right bottle code and try again.',
-                code='not_in_db'
+                message=f'Please enter at most {MAX_BATCH_SIZE} bottle codes at once.',
+                code='too_many'
             )
-        return id
+        self.bottles = Bottle.objects.in_bulk(codes)
+        return codes
+
+
+class BatchCheckoutForm(BatchBottleCodesMixin, ModelForm):
+    """
+    This is a form to check out several bottles at once. The borrower information is taken from models.Bottle
+    (the form is never saved, the bottles are updated by the view).
+    """
+
+    class Meta:
+        model = Bottle
+        fields = ['borrower_full_name', 'borrower_email', 'borrower_group']
+
+    bottle_codes = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 10}),
+        help_text='One bottle code per line (or scan the bottles one after another)',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(BatchCheckoutForm, self).__init__(*args, **kwargs)
+
+        for key in self.fields:
+            self.fields[key].required = True
+
+
+class BatchCheckinForm(BatchBottleCodesMixin, forms.Form):
+    """
+    This is a form to return (or mark as empty) several bottles at once
+    """
+    bottle_codes = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 10}),
+        help_text='One bottle code per line (or scan the bottles one after another)',
+    )
+    return_status = forms.ChoiceField(
+        choices=[('EMPTY', 'empty'), ('OK', 'Returned to assigned shelf')],
+        widget=forms.RadioSelect
+    )
 
 
 def return_list_with_ascending_x_values(start, interval, steps):
@@ -93,17 +234,12 @@ class CheckStatus(forms.Form):
 
     def clean_bottle_code(self):
         """
-        Validate that the user-entered bottle code exists in the database
+        Validate that the user-entered bottle code exists in the database (or in the archive)
         """
         bottle_code = ''.join(self.cleaned_data['bottle_code'].split('-'))
-        try:
-            Bottle.objects.filter(id=bottle_code)[0]
-        except IndexError:
-            raise ValidationError(
-                message='This bottle is not listed in the database. '
-                        'Please check if you used the right bottle code and try again.',
-                code='not_in_db'
-            )
+        if not (Bottle.objects.filter(id=bottle_code).exists()
+                or ArchivedBottle.objects.filter(id=bottle_code).exists()):
+            raise not_in_db_error()
         return bottle_code
 
 
@@ -132,9 +268,7 @@ class CheckUserChemicals(forms.Form):
         """
         user_code = self.cleaned_data['user_code']
         user_code = user_code.upper()
-        try:
-            Bottle.objects.filter(code=user_code)[0]
-        except IndexError:
+        if not Bottle.objects.filter(code=user_code).exists():
             raise ValidationError(
                 message='This user is not listed in the database. '
                         'If you wish to add your group chemicals, '
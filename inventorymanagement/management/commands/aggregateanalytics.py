@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from inventorymanagement.analytics import ANALYTICS_SOURCE, aggregate_day, days_to_aggregate, mark_aggregated
+from inventorymanagement.caching import invalidate_pages
+from inventorymanagement.models import DescriptionRollup, LoanRollup, SyncState
+
+
+class Command(BaseCommand):
+    help = 'Aggregates the bottle events of all days that are not aggregated yet into the daily analytics rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Delete all rollups and aggregate the whole history again',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild'] is True:
+            LoanRollup.objects.all().delete()
+            DescriptionRollup.objects.all().delete()
+            SyncState.objects.filter(source=ANALYTICS_SOURCE).delete()
+
+        days = days_to_aggregate()
+        n_loans = n_returns = 0
+        for day in days:
+            loans, returns = aggregate_day(day)
+            mark_aggregated(day)
+            n_loans += loans
+            n_returns += returns
+        if days:
+            invalidate_pages(['analytics'])
+            self.stdout.write(f'Aggregated {days[0].strftime("%d.%m.%Y")} to {days[-1].strftime("%d.%m.%Y")}: '
+                              f'{n_loans} loans, {n_returns} returns')
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS: Aggregated {len(days)} days'))
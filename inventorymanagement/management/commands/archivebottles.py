@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from inventorymanagement.archive import ARCHIVE_BATCH_SIZE, EMPTY_RETENTION_DAYS, archive_empty_bottles, \
+    expired_empty_bottles
+
+
+class Command(BaseCommand):
+    help = 'Moves the bottles that have been empty for longer than the retention period to the archive ' \
+           '(they are still shown on the status page).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=EMPTY_RETENTION_DAYS,
+            help=f'Number of days empty bottles are kept before they are archived (default: {EMPTY_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help=f'Number of bottles archived per transaction (default: {ARCHIVE_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many bottles would be archived',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run'] is True:
+            n_bottles = expired_empty_bottles(options['days']).count()
+            self.stdout.write(f'{n_bottles} empty bottles would be archived')
+            return
+        archived = archive_empty_bottles(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS: Archived {len(archived)} empty bottles'))
@@ -0,0 +1,120 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from inventorymanagement.models import Bottle
+
+
+def seed_bottles(n_rows, seed=0):
+    """
+    Fill the Bottle table with <n_rows> bottles with a realistic distribution:
+    some 300 owner codes, 90 % of the bottles checked in, 8 % checked out (during the last 4 weeks), 2 % empty.
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    prefixes = ['GBOD', 'GYAM', 'LEHR', 'GZEN', 'GCAR', 'GMOR', 'GKAS', 'GWEN']
+    codes = [prefix + a + b for prefix in prefixes for a in 'ABCDEF' for b in 'ABCDEF'][:300]
+    groups = [choice for choice, _ in Bottle._meta.get_field('borrower_group').choices]
+    bottles = []
+    for i in range(n_rows):
+        code = rng.choice(codes)
+        status = rng.choices(['in', 'out', 'empty'], weights=[90, 8, 2])[0]
+        borrowed = status != 'in' or rng.random() < 0.3
+        bottles.append(Bottle(
+            id=str(100000 + i),
+            supplier='Sial',
+            price='50.00',
+            description=f'chemical {rng.randrange(5000)}',
+            quantity='100 mL',
+            owner=f'User {code}',
+            location=f'F{rng.randrange(300, 330)}-SHELF{rng.randrange(10)}',
+            code=code,
+            owner_group=code[:4],
+            status=status,
+            checkout_date=today - datetime.timedelta(days=rng.randrange(28)) if status == 'out' else None,
+            borrower_full_name='Test Guy' if borrowed else None,
+            borrower_email='testguy@ethz.ch' if borrowed else None,
+            borrower_group=rng.choice(groups) if borrowed else None,
+        ))
+    Bottle.objects.bulk_create(bottles, batch_size=1000)
+
+
+def query_paths():
+    """
+    The access paths of the app (name, callable that runs the query)
+    """
+    return [
+        ('owner listing (UserChemicalsView)',
+         lambda: list(Bottle.objects.filter(code='GBODAA').order_by('description', 'id')[:101])),
+        ('owner listing, checked out only',
+         lambda: list(Bottle.objects.filter(code='GBODAA', status='out').order_by('description', 'id')[:101])),
+        ('owner code exists (CheckUserChemicals)',
+         lambda: Bottle.objects.filter(code='GYAMCC').exists()),
+        ('admin filter by status',
+         lambda: list(Bottle.objects.filter(status='out').order_by('-pk')[:100])),
+        ('admin filter by borrower_group',
+         lambda: list(Bottle.objects.filter(borrower_group='Bode').order_by('-pk')[:100])),
+        ('admin filter by owner_group',
+         lambda: list(Bottle.objects.filter(owner_group='GZEN').order_by('-pk')[:100])),
+        ('checked out for more than 2 weeks',
+         lambda: list(Bottle.objects.overdue().order_by('checkout_date').values_list('id', flat=True))),
+        ('count checked out',
+         lambda: Bottle.objects.filter(status='out').count()),
+    ]
+
+
+def time_query(query, repeat):
+    """Return the median run time of <query> over <repeat> runs in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Compares query times of the app\'s access paths with and without the Bottle indexes. ' \
+           'Runs on a temporary test database, the real database is not touched.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=100000,
+            help='Number of bottles to seed (default: 100000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of runs per query, the median is reported (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f'Seeding {options["rows"]} bottles...')
+            seed_bottles(options['rows'])
+            indexes = Bottle._meta.indexes
+
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Bottle, index)
+            before = [time_query(query, options['repeat']) for _, query in query_paths()]
+
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Bottle, index)
+            after = [time_query(query, options['repeat']) for _, query in query_paths()]
+
+            self.stdout.write(f'{"query":<45}{"before [ms]":>14}{"after [ms]":>14}')
+            for (name, _), time_before, time_after in zip(query_paths(), before, after):
+                self.stdout.write(f'{name:<45}{time_before:>14.3f}{time_after:>14.3f}')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
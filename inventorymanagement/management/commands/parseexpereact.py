@@ -1,48 +1,146 @@
 import datetime
+import glob
+import hashlib
+import os
+import re
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 
 import lxml.html as lh
+from lxml import etree
+import numpy as np
 import pandas as pd
 import requests
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
 
-from inventorymanagement.models import Bottle
+from inventorymanagement.archive import copy_to_archive
+from inventorymanagement.chemnames import compound_key, synonym_file_digest
+from inventorymanagement.models import ArchivedBottle, Bottle, BottleEvent, LocationCount, ParticipatingGroup, \
+    StagedBottle, SyncState
+from inventorymanagement.search import index_bottles, unindex_bottles
 
 
-def parse_expereact(local):
+EXPEREACT_SOURCE = 'inventorymanagement/expereact_source.dat'
+"""Local copy of the Expereact export (downloaded by this command or by utilities/download_expereact_data.py)"""
+
+EXPEREACT_COLUMN_COUNT = 14
+"""Number of cells in a row of the Expereact table. Rows of any other length do not belong to the table."""
+
+STREAM_CHUNK_SIZE = 5000
+"""Number of rows collected before they are turned into a DataFrame chunk in the streaming parser"""
+
+PARALLEL_CHUNKS_PER_WORKER = 4
+"""Number of byte ranges per worker process in the parallel parser (more ranges even out differences in speed)"""
+
+ROW_START = re.compile(rb'<tr[\s>]', re.IGNORECASE)
+"""Start tag of a table row in the raw export"""
+
+try:
+    import pyarrow  # noqa: F401 (needed by pandas for Feather files)
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+SNAPSHOT_SUFFIX = '.snapshot-'
+"""The snapshot of a parsed export is stored next to it, as <export><SNAPSHOT_SUFFIX><digest of the export>.<format>"""
+
+
+def download_expereact(path=EXPEREACT_SOURCE):
+    """
+    Download a list of all chemicals from expereact and save it to <path>
+    (intermediate download to local file is necessary for reliable parsing)
+    """
+    source_url = "https://expereact.ethz.ch/searchstock?for=chemexper&bl=1000000&so=Field10.15&search=+AND" \
+                 "+Field10.15%3D%2225%22&for=report&mime_type=application/vnd.ms-excel "
+    file = requests.get(source_url)
+    with open(path, 'wb') as newfile:
+        newfile.write(file.content)  # download to local file
+
+
+def parse_expereact(local, path=EXPEREACT_SOURCE):
     """
     Download a list of all chemicals from expereact,
     parse the html table inside there and return a variable holding the parsed data
     :param local: set to True to avoid reloading expereact data (takes some 20 seconds)
     :type local: bool
+    :param path: location of the local copy of the export
     """
     # fetch expereact export
     if local is False:
-        source_url = "https://expereact.ethz.ch/searchstock?for=chemexper&bl=1000000&so=Field10.15&search=+AND" \
-                     "+Field10.15%3D%2225%22&for=report&mime_type=application/vnd.ms-excel "
-        file = requests.get(source_url)  # source url from outer scope
-        with open('inventorymanagement/expereact_source.dat', 'wb') as newfile:
-            newfile.write(file.content)  # download to local file
-            # (intermediate download to local file is necessary for reliable parsing)
-    with open('inventorymanagement/expereact_source.dat', 'rb') as file:  # load local file
+        download_expereact(path)
+    with open(path, 'rb') as file:  # load local file
         # Parse html into variable doc
         doc = lh.parse(file)
     # extract table contents and return
     return doc.xpath('//tr')
 
 
-def convert_table_to_df(table):
+def iter_expereact_rows(path=EXPEREACT_SOURCE):
+    """
+    Incrementally parse the local copy of the Expereact export and yield the table rows one at a time.
+    Every row is a list of the text contents of its cells. Elements are freed as soon as a row was read,
+    so the document is never held in memory as a whole.
+    :param path: location of the local copy of the export
+    """
+    for _, tr in etree.iterparse(path, events=('end',), tag='tr', html=True):
+        yield [''.join(cell.itertext()) for cell in tr.iterchildren()]
+        # drop the row and everything parsed before it
+        tr.clear()
+        while tr.getprevious() is not None:
+            del tr.getparent()[0]
+
+
+def select_columns(header, columns):
+    """
+    Return the positions of <columns> in <header> (all positions if <columns> is None)
+    """
+    if columns is None:
+        return list(range(len(header)))
+    return [header.index(name) for name in columns]
+
+
+def convert_rows_to_df(rows, chunksize=STREAM_CHUNK_SIZE, columns=None):
+    """
+    Convert an iterable of table rows (as given by iter_expereact_rows) into a pandas dataframe.
+    The first row is the header. Rows are collected in chunks of <chunksize> that are converted to DataFrames
+    right away, so only one chunk of Python lists exists at any time.
+    Same assumptions as in convert_table_to_df() apply (number of columns == 14).
+    :param columns: header names of the columns to keep (default: all)
+    :return: pandas.DataFrame
+    """
+    rows = iter(rows)
+    header = next(rows)
+    positions = select_columns(header, columns)
+    names = [header[i] for i in positions]
+    chunks = []
+    chunk = []
+    for row in rows:
+        # If row is not of size 14, the //tr data is not from our table
+        if len(row) != EXPEREACT_COLUMN_COUNT:
+            break
+        chunk.append([row[i] for i in positions])
+        if len(chunk) == chunksize:
+            chunks.append(pd.DataFrame.from_records(chunk, columns=names))
+            chunk = []
+    chunks.append(pd.DataFrame.from_records(chunk, columns=names))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def convert_table_to_df(table, columns=None):
     """
     Convert the parsed html table into a pandas dataframe.
     Some assumptions specific to the data are made. (e.g. number of columns == 14)
+    :param columns: header names of the columns to keep (default: all). The text of other cells is never extracted.
     :return: pandas.DataFrame
     """
-    # Create empty list
-    col = []
-    i = 0  # For each row, store each first element (header) and an empty list
-    for t in table[0]:
-        i += 1
-        name = t.text_content()
-        col.append((name, []))
+    header = [t.text_content() for t in table[0]]
+    positions = select_columns(header, columns)
+    # For each selected column, store the header and an empty list
+    col = [(header[i], []) for i in positions]
 
     # Since out first row is the header, data is stored on the second row onwards
     for j in range(1, len(table)):
@@ -50,73 +148,724 @@ def convert_table_to_df(table):
         T = table[j]
 
         # If row is not of size 14, the //tr data is not from our table
-        if len(T) != 14:
+        if len(T) != EXPEREACT_COLUMN_COUNT:
             break
 
-        # i is the index of our column
-        i = 0
-
-        # Iterate through each element of the row
-        for t in T.iterchildren():
-            data = t.text_content()
-            # Append the data to the empty list of the i'th column
-            col[i][1].append(data)
-            # Increment i for the next column
-            i += 1
+        # Append the data of each selected cell to the list of its column
+        for (title, column), i in zip(col, positions):
+            column.append(T[i].text_content())
 
     Dict = {title: column for (title, column) in col}
     df = pd.DataFrame(Dict)
     return df
 
 
+def find_row_start(file, offset, block_size=2 ** 16):
+    """
+    Return the position of the first table row start tag (<tr>) at or after <offset> in the binary <file>,
+    or the size of the file if there is none
+    """
+    file.seek(offset)
+    buffer = b''
+    buffer_start = offset
+    while True:
+        block = file.read(block_size)
+        if not block:
+            return buffer_start + len(buffer)
+        buffer += block
+        match = ROW_START.search(buffer)
+        if match:
+            return buffer_start + match.start()
+        # keep the end of the buffer, it could be the beginning of a tag that continues in the next block
+        buffer_start += len(buffer) - 3
+        buffer = buffer[-3:]
+
+
+def read_header(path):
+    """
+    Parse the first row of the export at <path>.
+    :return: tuple (header, encoding of the document, position of the second row, where the data starts)
+    """
+    with open(path, 'rb') as file:
+        first_row = find_row_start(file, 0)
+        data_start = find_row_start(file, first_row + 1)
+        file.seek(0)
+        head = file.read(data_start)
+    doc = lh.parse(BytesIO(head))
+    header = [cell.text_content() for cell in doc.xpath('//tr')[0]]
+    return header, doc.docinfo.encoding, data_start
+
+
+def split_row_ranges(path, start, n_ranges):
+    """
+    Split the file at <path> from <start> to its end into at most <n_ranges> byte ranges of similar size that each
+    begin with a table row.
+    :return: list of tuples (start, end)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        boundaries = sorted({find_row_start(file, start + (size - start) * i // n_ranges) for i in range(1, n_ranges)})
+    starts = [start] + boundaries
+    ends = boundaries + [size]
+    return [(range_start, range_end) for range_start, range_end in zip(starts, ends) if range_end > range_start]
+
+
+def parse_row_range(path, start, end, encoding, positions):
+    """
+    Parse the table rows in the bytes <start> to <end> of the export at <path> (worker of the parallel parser).
+    :param encoding: encoding of the document (the byte range has no declaration of its own)
+    :param positions: positions of the cells to extract
+    :return: tuple (list of the extracted columns, False if the range contains the end of the table)
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        content = file.read(end - start)
+    doc = lh.document_fromstring(b'<table>' + content + b'</table>', parser=lh.HTMLParser(encoding=encoding))
+    columns = [[] for _ in positions]
+    for row in doc.xpath('//tr'):
+        # If row is not of size 14, the //tr data is not from our table
+        if len(row) != EXPEREACT_COLUMN_COUNT:
+            return columns, False
+        for column, i in zip(columns, positions):
+            column.append(row[i].text_content())
+    return columns, True
+
+
+def convert_file_to_df_parallel(path=EXPEREACT_SOURCE, workers=None, columns=None, n_ranges=None):
+    """
+    Parse the export at <path> into a pandas dataframe in parallel. The file is split into byte ranges that begin with
+    a table row, which are parsed in <workers> processes (default: one per CPU). The result is identical to
+    convert_table_to_df(parse_expereact(local=True, path=path), columns).
+    :param columns: header names of the columns to keep (default: all)
+    :param n_ranges: number of byte ranges (default: PARALLEL_CHUNKS_PER_WORKER per worker)
+    :return: pandas.DataFrame
+    """
+    workers = workers or os.cpu_count()
+    header, encoding, data_start = read_header(path)
+    positions = select_columns(header, columns)
+    ranges = split_row_ranges(path, data_start, n_ranges or workers * PARALLEL_CHUNKS_PER_WORKER)
+    col = [(header[i], []) for i in positions]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_row_range, path, start, end, encoding, positions) for start, end in ranges]
+        for future in futures:
+            range_columns, complete = future.result()
+            for (title, column), range_column in zip(col, range_columns):
+                column.extend(range_column)
+            if not complete:
+                # the table ended in this range, the rest of the file does not belong to it
+                for remaining in futures:
+                    remaining.cancel()
+                break
+    return pd.DataFrame({title: column for (title, column) in col})
+
+
+EXPEREACT_COLUMNS = {
+    'Supplier':            'supplier',
+    'Product Description': 'description',
+    'Group Code':          'code',
+    'User Name':           'owner',
+    'Location':            'location',
+    'Bottle Nr':           'id',
+    'Quantity':            'quantity',
+    'Price (CHF)':         'price',
+}
+"""Columns of the Expereact export that are used, mapped to their machine-readable names"""
+
+
 def cleanup(df):
     """
-    Drop unneeded columns of DataFrame and rename the remaining ones to machine-readable strings
+    Select the needed columns of DataFrame and rename them to machine-readable strings.
+    The DataFrame may already be restricted to these columns (by passing columns=list(EXPEREACT_COLUMNS) to the parser).
+    Adds the column compound_key, the normalised compound of the description (see chemnames.py). Every distinct
+    description is normalised only once.
+    Adds the columns room and shelf, parsed from the location (vectorised version of Bottle.parse_location).
     :param df: pandas.DataFrame
     :return: pandas.DataFrame
     """
-    df.drop(labels=['Status',
-                    'Comment',
-                    'Order Date',
-                    'Reception Date',
-                    'Catalogue Nr',
-                    'Order Nr'
-                    ],
-            axis=1, inplace=True
-            )
-    df.rename(columns={'Supplier':            'supplier',
-                       'Product Description': 'description',
-                       'Group Code':          'code',
-                       'User Name':           'owner',
-                       'Location':            'location',
-                       'Bottle Nr':           'id',
-                       'Quantity':            'quantity',
-                       'Price (CHF)':         'price'
-                       },
-              inplace=True
-              )
+    df = df[list(EXPEREACT_COLUMNS)].rename(columns=EXPEREACT_COLUMNS)
+    descriptions = df['description']
+    df['compound_key'] = descriptions.map({description: compound_key(description)
+                                           for description in descriptions.unique()})
+    location_parts = df['location'].str.strip().str.partition('-')
+    df['room'] = location_parts[0].str.strip()
+    df['shelf'] = location_parts[2].str.strip()
     return df
 
 
-def filter_groups(df):
+BOTTLE_ID_PATTERN = '[1-9][0-9]{0,8}'
+"""Bottle numbers as issued by Expereact (no leading zeros, at most 9 digits like Bottle.id)"""
+
+CATEGORY_COLUMNS = ['supplier', 'description', 'quantity', 'owner', 'location', 'code', 'compound_key', 'room', 'shelf']
+"""Columns with few distinct values, stored as pandas categoricals by apply_schema()"""
+
+MAX_REPORTED_REJECTS = 20
+"""Maximum number of rejected rows that are listed individually in the output of the command"""
+
+
+def parse_prices(prices):
+    """
+    Convert the price strings of the export to floats (NaN for an empty price). Swiss thousands separators (') are
+    ignored.
+    :param prices: pandas.Series of str
+    :return: tuple (pandas.Series of float, boolean pandas.Series that is True for prices that are not numbers)
+    """
+    prices = prices.str.strip().str.replace("'", '', regex=False)
+    values = pd.to_numeric(prices.where(prices != ''), errors='coerce')
+    return values.astype('float64'), values.isna() & (prices != '')
+
+
+def format_price(price):
+    """Return the price as stored in Bottle.price (two decimals, empty if the price is unknown)"""
+    return '' if pd.isna(price) else f'{price:.2f}'
+
+
+def is_bottle_id(bottle_ids):
+    """Return a boolean pandas.Series that is True for the elements of the pandas.Series <bottle_ids> that are bottle
+    numbers (see BOTTLE_ID_PATTERN)"""
+    return bottle_ids.str.fullmatch(BOTTLE_ID_PATTERN).fillna(False).astype(bool)
+
+
+def bottle_keys(bottle_ids):
+    """
+    Return the integer keys (as used by apply_schema) of the bottle ids <bottle_ids> as a numpy array,
+    -1 for ids that cannot come from the export (e.g. entered in the admin)
+    """
+    bottle_ids = pd.Series(list(bottle_ids), dtype=object)
+    return bottle_ids.where(is_bottle_id(bottle_ids), '-1').astype('int64').to_numpy()
+
+
+def apply_schema(df):
+    """
+    Convert a cleaned DataFrame (all columns str) to compact dtypes: the bottle ids to int64, the prices to float64
+    and the columns in CATEGORY_COLUMNS to categoricals. The row digests and the diff against the database are then
+    computed on these arrays instead of Python strings.
+    Rows that cannot be converted or would not fit into the Bottle table are rejected: ids that are not bottle
+    numbers, prices that are not numbers and values longer than the Bottle field. Their bottles must be kept as they
+    are by the sync (pass the rejected ids as <rejected_ids> to update_records and friends), a malformed cell in
+    Expereact must not remove a bottle.
+    :param df: pandas.DataFrame (see cleanup())
+    :return: tuple (typed pandas.DataFrame without the rejected rows,
+        pandas.DataFrame with the columns id and reason for each rejected row)
+    """
+    ids = df['id'].str.strip()
+    prices, bad_prices = parse_prices(df['price'])
+    checks = [(~is_bottle_id(ids), 'invalid bottle number'), (bad_prices, 'invalid price')]
+    for column in ['supplier', 'description', 'quantity', 'owner', 'location', 'code']:
+        max_length = Bottle._meta.get_field(column).max_length
+        checks.append((df[column].str.len() > max_length, f'{column} longer than {max_length} characters'))
+
+    reasons = pd.Series('', index=df.index, dtype=object)
+    for is_bad, reason in checks:
+        reasons[is_bad] += '; ' + reason
+    is_rejected = reasons != ''
+    rejected = pd.DataFrame({'id': ids[is_rejected], 'reason': reasons[is_rejected].str[2:]})
+
+    is_valid = ~is_rejected
+    typed = {'id': ids[is_valid].astype('int64'), 'price': prices[is_valid]}
+    typed.update({column: df.loc[is_valid, column].astype('category')
+                  for column in CATEGORY_COLUMNS if column in df})
+    return pd.DataFrame(typed, columns=df.columns), rejected.reset_index(drop=True)
+
+
+def participating_prefixes():
+    """
+    Return the sorted list of group prefixes (first 4 letters of the owner code) of the participating groups
+    """
+    return sorted(ParticipatingGroup.objects.values_list('prefix', flat=True))
+
+
+def filter_groups(df, prefixes=None):
     """
     Take the DataFrame parsed from Expereact that holds data for all groups' chemicals
-    and filter for the groups that want to use the system
+    and filter for the groups that want to use the system.
+    Owner codes consist of the group prefix + two caps (e.g. GBODDU). The prefix is looked up in the set of participating
+    groups in one vectorised pass, so the cost does not depend on the number of groups.
     :param df: pandas.DataFrame
+    :param prefixes: group prefixes to keep (default: all groups in the ParticipatingGroup table)
+    :return: pandas.DataFrame
+    """
+    if prefixes is None:
+        prefixes = participating_prefixes()
+    codes = df['code']
+    is_participating = codes.str[:4].astype('category').isin(prefixes) & (codes.str.len() == 6)
+    # only the remaining candidates are checked for the two trailing caps
+    is_participating[is_participating] = codes[is_participating].str[4:].str.fullmatch('[A-Z]{2}')
+    return df.loc[is_participating]
+
+
+SYNC_BATCH_SIZE = 500
+"""Maximum number of rows per bulk INSERT/UPDATE/DELETE (keeps us below SQLite's host parameter limit)"""
+
+SYNC_CHUNK_SIZE = 5000
+"""Number of export rows that are committed per transaction by update_records_in_chunks()"""
+
+SYNC_FIELDS = ['owner', 'location', 'code']
+"""Bottle fields that are expected to change in Expereact and are therefore compared and updated by the sync"""
+
+SYNC_SOURCE = 'expereact'
+"""Key of the SyncState entry of this command"""
+
+SyncResult = namedtuple('SyncResult', ['inserted', 'updated', 'unchanged', 'deleted'])
+SyncResult.__doc__ = """
+Outcome of update_records().
+inserted, updated and deleted are lists of bottle ids, unchanged is the number of rows that were left untouched.
+"""
+
+
+def batched(items, batch_size):
+    """
+    Yield consecutive slices of at most <batch_size> elements from the list <items>
+    """
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def file_digest(path=EXPEREACT_SOURCE, chunksize=2 ** 20):
+    """
+    Return the SHA-256 hex digest of the file at <path>, read in chunks of <chunksize> bytes
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunksize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_digest(path=EXPEREACT_SOURCE, prefixes=(), raw_digest=None):
+    """
+    Return a digest of everything that determines the outcome of a sync:
+    the content of the export at <path>, the participating group <prefixes> and the synonym table (compound keys)
+    :param raw_digest: file_digest(path), if it is already known
+    """
+    content = (raw_digest or file_digest(path)) + ',' + synonym_file_digest() + ',' + ','.join(prefixes)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def snapshot_path(path, raw_digest):
+    """
+    Return the path of the snapshot of the export at <path> with the content <raw_digest> (see file_digest).
+    Snapshots are Feather files if pyarrow is installed, NumPy .npz files otherwise.
+    """
+    return f'{path}{SNAPSHOT_SUFFIX}{raw_digest}.{"feather" if HAS_PYARROW else "npz"}'
+
+
+def write_snapshot(df, path, raw_digest):
+    """
+    Save the parsed export <df> as columnar snapshot next to the export at <path> (with the content <raw_digest>),
+    replacing the snapshots of earlier exports. The snapshot is written to a temporary file first, so that an
+    interrupted run never leaves a broken snapshot behind.
+    """
+    for old_snapshot in glob.glob(glob.escape(path + SNAPSHOT_SUFFIX) + '*'):
+        os.remove(old_snapshot)
+    target = snapshot_path(path, raw_digest)
+    temporary = target + '.tmp'
+    if HAS_PYARROW:
+        df.to_feather(temporary)
+    else:
+        with open(temporary, 'wb') as file:
+            np.savez(file, **{column: df[column].to_numpy(dtype=str) for column in df.columns})
+    os.replace(temporary, target)
+
+
+def read_snapshot(path, raw_digest, columns=None):
+    """
+    Return the parsed export at <path> from its snapshot, or None if there is no snapshot of the content
+    <raw_digest> (see file_digest) with the <columns> (default: all columns of the snapshot)
+    :return: pandas.DataFrame (same as convert_table_to_df) or None
+    """
+    target = snapshot_path(path, raw_digest)
+    if not os.path.exists(target):
+        return None
+    if HAS_PYARROW:
+        df = pd.read_feather(target)
+    else:
+        with np.load(target, allow_pickle=False) as snapshot:
+            df = pd.DataFrame({column: snapshot[column].astype(object) for column in snapshot.files})
+    if columns is None:
+        return df
+    if not set(columns) <= set(df.columns):
+        return None
+    return df[columns]
+
+
+def load_export(path=EXPEREACT_SOURCE, columns=None, workers=1, stream=False, use_snapshot=True, raw_digest=None):
+    """
+    Return the export at <path> parsed into a pandas dataframe (same as convert_table_to_df).
+    The result is saved as a snapshot next to the export, and loaded from there as long as the content of the export
+    does not change (parsing takes some seconds, loading the snapshot a fraction of a second).
+    :param columns: header names of the columns to keep (default: all)
+    :param workers: number of processes that parse the export (see convert_file_to_df_parallel)
+    :param stream: True to parse the export incrementally (see iter_expereact_rows)
+    :param use_snapshot: False to always parse the export (and not write a snapshot)
+    :param raw_digest: file_digest(path), if it is already known
     :return: pandas.DataFrame
     """
-    # the regex matches group base names + two caps
-    # regex for different groups are chained with | (<-- bitwise OR)
-    regex = 'GBOD[A-Z]{2,2}|' \
-            'GYAM[A-Z]{2,2}|' \
-            'LEHR[A-Z]{2,2}|' \
-            'GZEN[A-Z]{2,2}'
-    return df.loc[df['code'].str.fullmatch(regex)]
+    if use_snapshot:
+        raw_digest = raw_digest or file_digest(path)
+        df = read_snapshot(path, raw_digest, columns)
+        if df is not None:
+            return df
+    if workers > 1:
+        df = convert_file_to_df_parallel(path, workers=workers, columns=columns)
+    elif stream:
+        df = convert_rows_to_df(iter_expereact_rows(path), columns=columns)
+    else:
+        df = convert_table_to_df(parse_expereact(local=True, path=path), columns=columns)
+    if use_snapshot:
+        write_snapshot(df, path, raw_digest)
+    return df
+
+
+def row_digests(df):
+    """
+    Return the row digests (see Bottle.compute_row_digest) of a typed Expereact DataFrame as a pandas.Series
+    """
+    return pd.Series(
+        [Bottle.compute_row_digest(*fields)
+         for fields in zip(df['owner'], df['location'], df['code'], df['compound_key'])],
+        index=df.index,
+        dtype=object,
+    )
+
+
+def diff_records(df_expereact, rejected_ids=(), batch_size=SYNC_BATCH_SIZE):
+    """
+    Compare a typed Expereact DataFrame (see apply_schema) against the current content of the Bottle table.
+    Only the ids and row digests are read from the table (in one query), a bottle counts as changed if the digest
+    of its owner, location, code and compound key differs from the one stored in the database. The ids are compared
+    as integer arrays.
+    Bottles that were archived as empty (see archive.py) are usually still in Expereact until the borrower removes
+    them there, they are left in the archive instead of being added again (and count as unchanged). Only the new
+    ids are looked up in the archive, <batch_size> ids per query.
+    :param df_expereact: pandas.DataFrame
+    :param rejected_ids: ids of the export rows rejected by apply_schema, these bottles are not deleted
+    :param batch_size: number of ids per query to the archive
+    :return: tuple (new rows, changed rows, number of unchanged rows, ids to delete), the rows are indexed by the
+        integer bottle id, the ids to delete are the ids in the Bottle table (str)
+    """
+    # if a bottle appears twice, the last occurrence wins (same as the former row-by-row update)
+    df_expereact = df_expereact.drop_duplicates(subset='id', keep='last').set_index('id')
+    df_expereact['row_digest'] = row_digests(df_expereact)
+    db_rows = list(Bottle.objects.values_list('id', 'row_digest'))
+    db_ids = [bottle_id for bottle_id, _ in db_rows]
+    db_keys = bottle_keys(db_ids)
+
+    is_deleted = ~np.isin(db_keys, df_expereact.index.to_numpy())
+    rejected_ids = set(rejected_ids)
+    deleted_ids = [bottle_id for bottle_id, deleted in zip(db_ids, is_deleted)
+                   if deleted and bottle_id not in rejected_ids]
+    db_digests = pd.Series([digest for _, digest in db_rows], index=db_keys, dtype=object)[db_keys >= 0]
+    is_new = ~df_expereact.index.isin(db_digests.index)
+    new_ids = [str(key) for key in df_expereact.index[is_new]]
+    archived_ids = [bottle_id for ids in batched(new_ids, batch_size)
+                    for bottle_id in ArchivedBottle.objects.filter(reason='empty', id__in=ids)
+                    .values_list('id', flat=True)]
+    is_archived = is_new & df_expereact.index.isin(bottle_keys(archived_ids))
+    df_new = df_expereact.loc[is_new & ~is_archived]
+
+    known_digests = df_expereact.loc[~is_new, 'row_digest']
+    is_changed = known_digests != db_digests.loc[known_digests.index]
+    df_changed = df_expereact.loc[is_changed.index[is_changed]]
+
+    return df_new, df_changed, int((~is_changed).sum() + is_archived.sum()), deleted_ids
+
+
+def apply_changes(df_new, df_changed, deleted_ids, batch_size=SYNC_BATCH_SIZE):
+    """
+    Write the changes found by diff_records() to the Bottle table in a single transaction (see update_records)
+    :return: SyncResult (unchanged is 0)
+    """
+    new_bottles = [
+        Bottle(
+            id=str(bottle_id),
+            supplier=row.supplier,
+            price=format_price(row.price),
+            description=row.description,
+            quantity=row.quantity,
+            owner=row.owner,
+            location=row.location,
+            code=row.code,
+            owner_group=row.code[:4],  # bulk_create does not call Bottle.save()
+            compound_key=row.compound_key,
+            room=row.room,
+            shelf=row.shelf,
+            row_digest=row.row_digest,
+        )
+        for bottle_id, row in zip(df_new.index, df_new.itertuples(index=False))
+    ]
+    changed_bottles = [
+        Bottle(id=str(bottle_id), owner=row.owner, location=row.location, code=row.code, owner_group=row.code[:4],
+               compound_key=row.compound_key, room=row.room, shelf=row.shelf, row_digest=row.row_digest)
+        for bottle_id, row in zip(df_changed.index, df_changed.itertuples(index=False))
+    ]
+    new_counts = Counter((bottle.room, bottle.shelf, bottle.status) for bottle in new_bottles)
+
+    timestamp = timezone.now()
+    events = [BottleEvent(bottle_id=bottle_id, action='deleted', source='sync', timestamp=timestamp)
+              for bottle_id in deleted_ids]
+    events += [BottleEvent(bottle_id=bottle.id, action=action, source='sync', timestamp=timestamp,
+                           code=bottle.code, location=bottle.location)
+               for action, bottles in [('created', new_bottles), ('updated', changed_bottles)]
+               for bottle in bottles]
+
+    with transaction.atomic(), LocationCount.objects.tracking(deleted_ids + [bottle.id for bottle in changed_bottles]):
+        for ids in batched(deleted_ids, batch_size):
+            copy_to_archive(ids, 'deleted')
+            bottles_for_deletion = Bottle.objects.filter(id__in=ids)
+            bottles_for_deletion._raw_delete(bottles_for_deletion.db)
+            # ^ faster than .delete (we don't need cascading)
+            unindex_bottles(ids)
+        Bottle.objects.bulk_create(new_bottles, batch_size=batch_size)
+        for bottles in batched(new_bottles, batch_size):
+            # new bottles are not in the index (removed bottles are taken out of it)
+            index_bottles([(bottle.id, bottle.description, bottle.supplier) for bottle in bottles], replace=False)
+        LocationCount.objects.apply(new_counts)
+        Bottle.objects.bulk_update(changed_bottles,
+                                   SYNC_FIELDS + ['owner_group', 'compound_key', 'room', 'shelf', 'row_digest'],
+                                   batch_size=batch_size)
+        BottleEvent.objects.bulk_create(events, batch_size=batch_size)
+
+    return SyncResult(
+        inserted=[bottle.id for bottle in new_bottles],
+        updated=[bottle.id for bottle in changed_bottles],
+        unchanged=0,
+        deleted=list(deleted_ids),
+    )
+
+
+def update_records(df_expereact, batch_size=SYNC_BATCH_SIZE, rejected_ids=()):
+    """
+    Commit a typed pandas.DataFrame (see apply_schema) to database through the Bottle model:
+    - Add items with 'id' that is not present in the database.
+    - Remove items from the database where 'id' is not present in the supplied DataFrame (they are moved to the
+        archive, see archive.py), except the ones in <rejected_ids> (rows of the export rejected by apply_schema)
+    - Update items where the id is already in database and owner, location or code differ (i.e. the row digest
+        changed). Only these are expected to change, supplier, price, description and quantity are only written on
+        creation. The compound key is updated as well, in case the synonym table changed.
+    Every change is logged as a BottleEvent, and the search index is updated for the added and removed bottles
+    (description and supplier of the updated bottles do not change). The location counts are updated by the
+    difference before and after the sync for removed and updated bottles, new bottles are counted as checked in.
+    All changes are written with bulk queries of at most <batch_size> rows inside a single transaction.
+    :param df_expereact: pandas.DataFrame
+    :param batch_size: maximum number of rows per query
+    :param rejected_ids: ids of the bottles that are kept as they are
+    :return: SyncResult
+    """
+    df_new, df_changed, unchanged, deleted_ids = diff_records(df_expereact, rejected_ids, batch_size)
+    return apply_changes(df_new, df_changed, deleted_ids, batch_size)._replace(unchanged=unchanged)
+
+
+def chunk_bounds(df_expereact, chunk_size):
+    """
+    Split the bottle ids of a typed Expereact DataFrame into chunks of <chunk_size> rows (in the order of the ids).
+    The chunks only depend on the export and <chunk_size>, so that an interrupted sync can be resumed chunk by chunk.
+    :return: numpy array with the largest id of every chunk but the last (see chunk_of)
+    """
+    ids = np.unique(df_expereact['id'].to_numpy())
+    return ids[chunk_size - 1:-1:chunk_size]
+
+
+def chunk_of(keys, bounds):
+    """
+    Return the chunk numbers of the bottles with the integer ids <keys> (see bottle_keys). Every chunk covers a range
+    of ids, so that bottles that are only in the database (and will be deleted) fall into a chunk as well.
+    """
+    return np.searchsorted(bounds, keys, side='left')
+
+
+def update_records_in_chunks(df_expereact, digest, chunk_size=SYNC_CHUNK_SIZE, batch_size=SYNC_BATCH_SIZE,
+                             resume=False, progress=None, rejected_ids=()):
+    """
+    Commit a typed pandas.DataFrame to database like update_records(), but in chunks of <chunk_size> export rows
+    with a transaction each, so that no lock is held for the whole sync. After every chunk, a checkpoint (the digest
+    of the export and the number of committed chunks) is committed to the SyncState of the sync as well. Once all
+    chunks are committed, <digest> is stored as the applied export and the checkpoint is cleared.
+    :param digest: digest of the export (see export_digest)
+    :param resume: continue after the last committed chunk of the checkpoint if it is for the same export and
+        chunk size (otherwise all chunks are written, which gives the same result since committed changes are no
+        longer found by diff_records)
+    :param progress: function that is called with the number of committed chunks and the number of chunks after
+        every chunk
+    :param rejected_ids: ids of the bottles that are kept as they are (see update_records)
+    :return: tuple (SyncResult of the chunks written by this call, number of chunks skipped because they were
+        committed before)
+    """
+    sync_state, _ = SyncState.objects.get_or_create(source=SYNC_SOURCE)
+    bounds = chunk_bounds(df_expereact, chunk_size)
+    n_chunks = len(bounds) + 1
+    skipped = 0
+    if resume and sync_state.checkpoint_digest == digest and sync_state.chunk_size == chunk_size:
+        skipped = min(sync_state.committed_chunks, n_chunks)
+    SyncState.objects.filter(source=SYNC_SOURCE).update(checkpoint_digest=digest, chunk_size=chunk_size,
+                                                        committed_chunks=skipped)
+
+    df_expereact = df_expereact.loc[chunk_of(df_expereact['id'].to_numpy(), bounds) >= skipped]
+    df_new, df_changed, unchanged, deleted_ids = diff_records(df_expereact, rejected_ids, batch_size)
+    # bottles of committed chunks are not in the DataFrame any more, but must not be deleted
+    deleted_ids = np.array(deleted_ids, dtype=object)
+    deleted_chunks = chunk_of(bottle_keys(deleted_ids), bounds)
+    deleted_ids = deleted_ids[deleted_chunks >= skipped]
+    deleted_chunks = deleted_chunks[deleted_chunks >= skipped]
+    new_chunks = chunk_of(df_new.index.to_numpy(), bounds)
+    changed_chunks = chunk_of(df_changed.index.to_numpy(), bounds)
+
+    result = SyncResult(inserted=[], updated=[], unchanged=unchanged, deleted=[])
+    for chunk in range(skipped, n_chunks):
+        with transaction.atomic():
+            chunk_result = apply_changes(df_new.loc[new_chunks == chunk], df_changed.loc[changed_chunks == chunk],
+                                         deleted_ids[deleted_chunks == chunk].tolist(), batch_size)
+            SyncState.objects.filter(source=SYNC_SOURCE).update(committed_chunks=chunk + 1)
+        result.inserted.extend(chunk_result.inserted)
+        result.updated.extend(chunk_result.updated)
+        result.deleted.extend(chunk_result.deleted)
+        if progress is not None:
+            progress(chunk + 1, n_chunks)
+
+    SyncState.objects.filter(source=SYNC_SOURCE).update(export_digest=digest, applied_at=timezone.now(),
+                                                        checkpoint_digest='', chunk_size=0, committed_chunks=0)
+    return result, skipped
+
+
+STAGED_FIELDS = [field.name for field in StagedBottle._meta.get_fields()]
+"""Bottle fields that are written to the staging table (see update_records_staged)"""
+
+
+def stage_export(df_expereact, batch_size=SYNC_BATCH_SIZE):
+    """
+    Replace the content of the staging table (StagedBottle) by a typed Expereact DataFrame, with one (short)
+    transaction per <batch_size> rows.
+    :return: number of staged bottles
+    """
+    staged = StagedBottle.objects.all()
+    staged._raw_delete(staged.db)
+    # if a bottle appears twice, the last occurrence wins (see diff_records)
+    df_expereact = df_expereact.drop_duplicates(subset='id', keep='last')
+    bottles = [
+        StagedBottle(id=str(row.id), supplier=row.supplier, price=format_price(row.price),
+                     description=row.description, quantity=row.quantity, owner=row.owner, location=row.location,
+                     code=row.code, owner_group=row.code[:4], compound_key=row.compound_key, room=row.room,
+                     shelf=row.shelf, row_digest=row_digest)
+        for row, row_digest in zip(df_expereact.itertuples(index=False), row_digests(df_expereact))
+    ]
+    for batch in batched(bottles, batch_size):
+        StagedBottle.objects.bulk_create(batch)
+    return len(bottles)
+
+
+def insert_staged_bottles():
+    """
+    Copy the staged bottles that are not in the Bottle table yet (nor archived as empty, see diff_records) to it with
+    one INSERT ... SELECT (checked in, without borrower)
+    """
+    quote = connection.ops.quote_name
+    defaults = {field.column: field.get_default() for field in Bottle._meta.concrete_fields
+                if field.name not in STAGED_FIELDS and not field.null}
+    columns = [Bottle._meta.get_field(name).column for name in STAGED_FIELDS] + list(defaults)
+    staged_columns = [f'staged.{quote(StagedBottle._meta.get_field(name).column)}' for name in STAGED_FIELDS]
+    bottle_table, bottle_pk = quote(Bottle._meta.db_table), quote(Bottle._meta.pk.column)
+    staged_pk = f'staged.{quote(StagedBottle._meta.pk.column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {bottle_table} ({", ".join(quote(column) for column in columns)}) '
+            f'SELECT {", ".join(staged_columns + ["%s"] * len(defaults))} '
+            f'FROM {quote(StagedBottle._meta.db_table)} staged '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {bottle_table} bottle WHERE bottle.{bottle_pk} = {staged_pk}) '
+            f'AND NOT EXISTS (SELECT 1 FROM {quote(ArchivedBottle._meta.db_table)} archived '
+            f'WHERE archived.{quote(ArchivedBottle._meta.pk.column)} = {staged_pk} '
+            f'AND archived.{quote(ArchivedBottle._meta.get_field("reason").column)} = %s)',
+            list(defaults.values()) + ['empty'],
+        )
+
+
+def swap_in_staged(batch_size=SYNC_BATCH_SIZE, rejected_ids=()):
+    """
+    Apply the staged export (see stage_export) to the Bottle table in a single transaction, with the same outcome as
+    update_records(): bottles that are not staged are archived, new bottles are inserted and changed bottles
+    (different row digest) get the owner, location and code of the staged bottle, with events, search index and
+    location counts updated accordingly. The bottles are inserted and updated with set-based queries from the
+    staging table, the rows are not sent from Python. The staging table is emptied afterwards.
+    :param rejected_ids: ids of the bottles that are kept as they are (see update_records)
+    :return: SyncResult
+    """
+    staged = StagedBottle.objects.filter(id=OuterRef('id'))
+    bottles = Bottle.objects.filter(id=OuterRef('id'))
+    archived_empty = ArchivedBottle.objects.filter(id=OuterRef('id'), reason='empty')
+    update_fields = SYNC_FIELDS + ['owner_group', 'compound_key', 'room', 'shelf', 'row_digest']
+
+    with transaction.atomic():
+        rejected_ids = set(rejected_ids)
+        deleted_ids = [bottle_id for bottle_id in Bottle.objects.exclude(Exists(staged)).values_list('id', flat=True)
+                       if bottle_id not in rejected_ids]
+        new_bottles = list(StagedBottle.objects.exclude(Exists(bottles)).exclude(Exists(archived_empty))
+                           .values_list('id', 'description', 'supplier', 'code', 'location', 'room', 'shelf'))
+        changed_bottles = list(StagedBottle.objects.filter(Exists(bottles.exclude(row_digest=OuterRef('row_digest'))))
+                               .values_list('id', 'code', 'location'))
+        changed_ids = [bottle_id for bottle_id, _, _ in changed_bottles]
+        unchanged = StagedBottle.objects.count() - len(new_bottles) - len(changed_bottles)
+
+        timestamp = timezone.now()
+        events = [BottleEvent(bottle_id=bottle_id, action='deleted', source='sync', timestamp=timestamp)
+                  for bottle_id in deleted_ids]
+        events += [BottleEvent(bottle_id=bottle_id, action='created', source='sync', timestamp=timestamp, code=code,
+                               location=location)
+                   for bottle_id, _, _, code, location, _, _ in new_bottles]
+        events += [BottleEvent(bottle_id=bottle_id, action='updated', source='sync', timestamp=timestamp, code=code,
+                               location=location)
+                   for bottle_id, code, location in changed_bottles]
+
+        with LocationCount.objects.tracking(deleted_ids + changed_ids):
+            for ids in batched(deleted_ids, batch_size):
+                copy_to_archive(ids, 'deleted')
+                bottles_for_deletion = Bottle.objects.filter(id__in=ids)
+                bottles_for_deletion._raw_delete(bottles_for_deletion.db)
+                unindex_bottles(ids)
+            insert_staged_bottles()
+            for batch in batched(new_bottles, batch_size):
+                index_bottles([(bottle_id, description, supplier)
+                               for bottle_id, description, supplier, *_ in batch], replace=False)
+            LocationCount.objects.apply(Counter((room, shelf, 'in') for *_, room, shelf in new_bottles))
+            Bottle.objects.filter(Exists(staged.exclude(row_digest=OuterRef('row_digest')))).update(
+                **{field: Subquery(staged.values(field)[:1]) for field in update_fields})
+        BottleEvent.objects.bulk_create(events, batch_size=batch_size)
+
+    staged = StagedBottle.objects.all()
+    staged._raw_delete(staged.db)
+    return SyncResult(
+        inserted=[bottle_id for bottle_id, *_ in new_bottles],
+        updated=changed_ids,
+        unchanged=unchanged,
+        deleted=deleted_ids,
+    )
+
+
+def update_records_staged(df_expereact, batch_size=SYNC_BATCH_SIZE, rejected_ids=()):
+    """
+    Commit a typed pandas.DataFrame to database like update_records(), but through the staging table: the export is
+    written to StagedBottle in short transactions, then swapped in with a single short transaction (see
+    swap_in_staged). The Bottle table is therefore only locked for the swap.
+    :param rejected_ids: ids of the bottles that are kept as they are (see update_records)
+    :return: SyncResult
+    """
+    stage_export(df_expereact, batch_size)
+    return swap_in_staged(batch_size, rejected_ids)
 
 
 class Command(BaseCommand):
     help = 'Parses Expereact and updates DB entries and locations.'
 
+    def report_progress(self, committed_chunks, n_chunks):
+        """Write the progress of update_records_in_chunks() to stdout"""
+        self.stdout.write(f'Committed chunk {committed_chunks}/{n_chunks}')
+
+    def report_rejected(self, rejected):
+        """Write the rows rejected by apply_schema (at most MAX_REPORTED_REJECTS of them) to stdout"""
+        self.stdout.write(self.style.WARNING(f'WARNING: Skipped {len(rejected)} malformed rows of the Expereact data '
+                                             f'(their bottles are left unchanged):'))
+        for row in rejected.head(MAX_REPORTED_REJECTS).itertuples(index=False):
+            self.stdout.write(f'  bottle {row.id!r}: {row.reason}')
+        if len(rejected) > MAX_REPORTED_REJECTS:
+            self.stdout.write(f'  ... and {len(rejected) - MAX_REPORTED_REJECTS} more')
+
     def add_arguments(self, parser):
 
         parser.add_argument(
@@ -124,72 +873,109 @@ class Command(BaseCommand):
             action='store_true',
             help='Use the local copy of Expereact data as data source',
         )
+        parser.add_argument(
+            '--source',
+            default=EXPEREACT_SOURCE,
+            help=f'Path of the local copy of Expereact data (default: {EXPEREACT_SOURCE})',
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parse the Expereact data incrementally (constant memory use regardless of the export size)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes that parse the Expereact data in parallel (default: 1, i.e. no parallel parsing)',
+        )
+        parser.add_argument(
+            '--no-snapshot',
+            action='store_true',
+            help='Always parse the Expereact data (by default, the parsed data is saved next to it and reused as '
+                 'long as the data does not change)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Update the database even if the Expereact data did not change since the last update',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=SYNC_CHUNK_SIZE,
+            help=f'Number of rows of the Expereact data committed per transaction (default: {SYNC_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted update after the last committed chunk (if the Expereact data and the '
+                 'chunk size did not change)',
+        )
+        parser.add_argument(
+            '--staging',
+            action='store_true',
+            help='Write the Expereact data to a staging table first and apply it with a single short transaction '
+                 '(the web app is only blocked for that transaction)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=SYNC_BATCH_SIZE,
+            help=f'Number of rows written per bulk query (default: {SYNC_BATCH_SIZE})',
+        )
 
     def handle(self, *args, **options):
 
-        def update_records(df_expereact):
-            """
-            Commit a pandas.DataFrame to database through the Bottle model:
-            - Add items with 'id' that is not present in the database.
-            - Remove items from the database where 'id' is not present in the supplied DataFrame
-            - Update items where the id is already in database. Only location and owner (and consequently code) are
-                expected to change. The implementation would however allow for overwriting supplier, price, description,
-                and quantity as well.
-            :param df_expereact: pandas.DataFrame
-            """
-            ids_in_db = set(Bottle.objects.all().values_list('id', flat=True))
-            ids_in_expereact = set(df_expereact['id'])
-            deleted_ids = list(ids_in_db - ids_in_expereact)
-            bottles_for_deletion = Bottle.objects.filter(id__in=deleted_ids)
-            bottles_for_deletion._raw_delete(bottles_for_deletion.db)
-            # ^ faster than .delete (we don't need cascading)
-            new_ids = []
-
-            for i, row in df_expereact.iterrows():
-                try:
-                    bottle = Bottle.objects.get(id=row['id'])
-                    bottle.owner = row['owner']
-                    bottle.location = row['location']
-                    bottle.code = row['code']
-                    bottle.save()
-
-                except Bottle.DoesNotExist:
-                    Bottle.objects.create(
-                        id=row['id'],
-                        supplier=row['supplier'],
-                        price=row['price'],
-                        description=row['description'],
-                        quantity=row['quantity'],
-                        owner=row['owner'],
-                        location=row['location'],
-                        code=row['code'],
-                    )
-                    new_ids.append(row['id'])
-
-            return (deleted_ids, new_ids)
-
         self.stdout.write('####################################################\n'
                           'Running database update from updateFromExpereact.py\n'
                           '####################################################')
         self.stdout.write(f'Date: {datetime.date.today().strftime("%d.%m.%Y")}')
         self.stdout.write(f'Time: {datetime.datetime.now().strftime("%H:%M:%S")}')
 
-        table = parse_expereact(local=options['local'])
         if options['local'] is True:
             self.stdout.write(self.style.WARNING('WARNING: Using local copy of Expereact data.'))
         else:
+            download_expereact(options['source'])
             self.stdout.write(f'Finished Expereact download at: {datetime.datetime.now().strftime("%H:%M:%S")}')
 
-        initial_id_in_db = list(Bottle.objects.only('id'))
-        df_parsed = convert_table_to_df(table)
-        df_clean = cleanup(df_parsed)
-        df_filtered = filter_groups(df_clean)
-        deleted_ids, new_ids = update_records(df_filtered)
-        final_id_in_db = list(Bottle.objects.only('id'))
-
-        self.stdout.write(f'Deleted records: {deleted_ids}')
-        self.stdout.write(f'Deleted records (by comparing state before and after): {list(set(initial_id_in_db) - set(final_id_in_db))}')
-        self.stdout.write(f'New records: {new_ids}')
-        self.stdout.write(f'New records(by comparing state before and after): {list(set(final_id_in_db) - set(initial_id_in_db))}')
+        prefixes = participating_prefixes()
+        raw_digest = file_digest(options['source'])
+        digest = export_digest(options['source'], prefixes, raw_digest)
+        sync_state, _ = SyncState.objects.get_or_create(source=SYNC_SOURCE)
+        if options['force'] is False and sync_state.export_digest == digest:
+            self.stdout.write(self.style.SUCCESS('SUCCESS: Expereact data unchanged since the last update, '
+                                                 'nothing to do\n'))
+            return
+
+        if options['staging'] is True and options['resume'] is True:
+            raise CommandError('--staging and --resume cannot be combined')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['stream'] is True and options['workers'] > 1:
+            raise CommandError('--stream and --workers cannot be combined')
+        df_parsed = load_export(options['source'], columns=list(EXPEREACT_COLUMNS), workers=options['workers'],
+                                stream=options['stream'], use_snapshot=not options['no_snapshot'],
+                                raw_digest=raw_digest)
+        # only the rows of the participating groups are checked (and reported)
+        df_filtered, rejected = apply_schema(filter_groups(cleanup(df_parsed), prefixes))
+        del df_parsed
+        if len(rejected):
+            self.report_rejected(rejected)
+        rejected_ids = rejected['id'].to_list()
+        if options['staging'] is True:
+            result = update_records_staged(df_filtered, batch_size=options['batch_size'], rejected_ids=rejected_ids)
+            SyncState.objects.filter(source=SYNC_SOURCE).update(export_digest=digest, applied_at=timezone.now())
+        else:
+            result, skipped = update_records_in_chunks(df_filtered, digest, chunk_size=options['chunk_size'],
+                                                       batch_size=options['batch_size'], resume=options['resume'],
+                                                       progress=self.report_progress, rejected_ids=rejected_ids)
+            if skipped:
+                self.stdout.write(f'Resumed after {skipped} committed chunks')
+
+        self.stdout.write(f'Deleted records: {result.deleted}')
+        self.stdout.write(f'New records: {result.inserted}')
+        self.stdout.write(f'Inserted: {len(result.inserted)}, updated: {len(result.updated)}, '
+                          f'unchanged: {result.unchanged}, deleted: {len(result.deleted)}')
         self.stdout.write(self.style.SUCCESS(f'SUCCESS: updateFromExpereact.py finished at '
                                              f'{datetime.datetime.now().strftime("%H:%M:%S")}\n'))
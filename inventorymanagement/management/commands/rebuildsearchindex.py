@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventorymanagement.models import Bottle
+from inventorymanagement.search import get_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the chemicals from scratch. ' \
+           'Only needed if the index got out of sync (e.g. after restoring a backup) or the database was changed.'
+
+    def handle(self, *args, **options):
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS: Indexed {Bottle.objects.count()} bottles '
+                                             f'({type(get_backend()).__name__})'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventorymanagement.models import LocationCount
+
+
+class Command(BaseCommand):
+    help = 'Recounts the bottles per location (room and shelf) and status from scratch. ' \
+           'Only needed if the counts got out of sync (e.g. after restoring a backup or editing the database by hand).'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            LocationCount.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS: Counted bottles at {LocationCount.objects.count()} locations'))
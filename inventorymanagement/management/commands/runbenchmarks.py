@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from inventorymanagement.benchmarks import benchmark_sync, benchmark_urls, environment, missing_url_cases, \
+    reset_data, url_cases, write_synthetic_export
+
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'inventorymanagement-benchmarks'}}
+"""The benchmarks use a cache of their own, so that no benchmark page ends up in the real cache"""
+
+
+class Command(BaseCommand):
+    help = 'Times the stages of the Expereact sync on synthetic exports and the requests to every URL of the app, ' \
+           'and writes the results as JSON. Runs on a temporary test database, the real database is not touched.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Sizes of the synthetic exports (default: 1000 10000 100000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of requests per URL, the median is reported (default: 5)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of processes of the parallel parser (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark_results.json',
+            help='Path of the JSON file the results are written to (default: benchmark_results.json)',
+        )
+
+    def handle(self, *args, **options):
+        results = {'environment': environment(), 'runs': []}
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES), tempfile.TemporaryDirectory() as directory:
+                for n_rows in options['rows']:
+                    results['runs'].append(self.run_benchmarks(directory, n_rows, options['repeat'], options['workers']))
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS: Results written to {options["output"]}'))
+
+    def run_benchmarks(self, directory, n_rows, repeat, workers):
+        """Run the sync and URL benchmarks on a synthetic export with <n_rows> rows and print a summary"""
+        reset_data()
+        path = os.path.join(directory, f'expereact_{n_rows}.dat')
+        write_synthetic_export(path, n_rows)
+
+        self.stdout.write(f'\n{n_rows} rows: sync')
+        sync = benchmark_sync(path, workers)
+        self.stdout.write(f'{"stage":<35}{"time [s]":>12}{"queries":>10}')
+        for stage, stats in sync.items():
+            self.stdout.write(f'{stage:<35}{stats["seconds"]:>12.3f}{stats["queries"]:>10}')
+
+        try:
+            cases = url_cases(repeat)
+        except ValueError as error:
+            raise CommandError(str(error))
+        missing = missing_url_cases(cases)
+        if missing:
+            raise CommandError(f'No benchmark for the URLs {", ".join(missing)}')
+        self.stdout.write(f'\n{n_rows} rows: requests')
+        requests = benchmark_urls(cases, repeat)
+        self.stdout.write(f'{"url":<20}{"median [ms]":>14}{"queries":>10}{"status":>8}')
+        for name, stats in requests.items():
+            self.stdout.write(f'{name:<20}{stats["median_ms"]:>14.3f}{stats["queries"]:>10}{stats["status_code"]:>8}')
+        return {'rows': n_rows, 'sync': sync, 'urls': requests}
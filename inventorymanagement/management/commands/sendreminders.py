@@ -0,0 +1,89 @@
+import datetime
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+
+from inventorymanagement.models import Bottle
+
+REMINDER_FIELDS = ['borrower_email', 'borrower_full_name', 'id', 'description', 'code', 'checkout_date']
+"""Bottle fields needed to write the reminders"""
+
+REMINDER_SUBJECT = 'Chemical Borrowing System: please return your borrowed bottles'
+
+
+def iter_overdue_by_borrower(today=None, chunk_size=2000):
+    """
+    Yield (borrower_email, list of overdue bottles) for every borrower with overdue bottles.
+    The bottles are streamed from the database in chunks (ordered by borrower), so the overdue bottles are never all
+    held in memory. Every bottle is a dict of REMINDER_FIELDS.
+    """
+    overdue = (Bottle.objects.overdue(today)
+               .exclude(borrower_email__isnull=True).exclude(borrower_email='')
+               .order_by('borrower_email', 'checkout_date', 'id')
+               .values(*REMINDER_FIELDS)
+               .iterator(chunk_size=chunk_size))
+    for borrower_email, bottles in groupby(overdue, key=lambda bottle: bottle['borrower_email']):
+        yield borrower_email, list(bottles)
+
+
+def reminder_message(borrower_email, bottles):
+    """
+    Return the reminder email (not yet sent) for <borrower_email> listing the overdue <bottles>
+    """
+    lines = [f'- {bottle["id"]} ({bottle["description"]}, owner {bottle["code"]}), '
+             f'borrowed on {bottle["checkout_date"]:%d.%m.%Y}'
+             for bottle in bottles]
+    body = (f'Dear {bottles[0]["borrower_full_name"] or "borrower"},\n\n'
+            f'according to the Chemical Borrowing System, you have borrowed the following bottles '
+            f'more than two weeks ago:\n\n'
+            + '\n'.join(lines) +
+            '\n\nPlease return them to their owners and check them in, '
+            'or mark them as empty if they are used up.\n')
+    return EmailMessage(
+        subject=REMINDER_SUBJECT,
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[borrower_email],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Sends one reminder email per borrower listing all of their overdue bottles (borrowed more than 2 weeks ago).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report which reminders would be sent',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of emails handed to the email backend at once (default: 100)',
+        )
+
+    def handle(self, *args, **options):
+        n_messages = 0
+        n_bottles = 0
+        batch = []
+        # all batches are sent over a single connection to the mail server
+        with get_connection() as connection:
+            for borrower_email, bottles in iter_overdue_by_borrower():
+                n_messages += 1
+                n_bottles += len(bottles)
+                if options['dry_run'] is True:
+                    self.stdout.write(f'{borrower_email}: {", ".join(bottle["id"] for bottle in bottles)}')
+                    continue
+                batch.append(reminder_message(borrower_email, bottles))
+                if len(batch) == options['batch_size']:
+                    connection.send_messages(batch)
+                    batch = []
+            if batch:
+                connection.send_messages(batch)
+
+        action = 'Would send' if options['dry_run'] is True else 'Sent'
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS: {action} {n_messages} reminders for {n_bottles} overdue '
+                                             f'bottles on {datetime.date.today().strftime("%d.%m.%Y")}'))
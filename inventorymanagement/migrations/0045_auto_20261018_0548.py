@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:48
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_row_digest(apps, schema_editor):
+    """Calculate the row digest of existing bottles (same as Bottle.compute_row_digest)"""
+    Bottle = apps.get_model('inventorymanagement', 'Bottle')
+    bottles = list(Bottle.objects.only('id', 'owner', 'location', 'code'))
+    for bottle in bottles:
+        content = '\x1f'.join((bottle.owner, bottle.location, bottle.code)).encode()
+        bottle.row_digest = hashlib.blake2b(content, digest_size=8).hexdigest()
+    Bottle.objects.bulk_update(bottles, ['row_digest'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0044_auto_20210719_1510'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('source', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('export_digest', models.CharField(blank=True, default='', max_length=64)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bottle',
+            name='row_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.RunPython(fill_row_digest, migrations.RunPython.noop),
+    ]
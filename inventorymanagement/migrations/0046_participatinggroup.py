@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:49
+
+from django.db import migrations, models
+import inventorymanagement.validators
+
+
+def add_initial_groups(apps, schema_editor):
+    """Register the groups that were hard-coded in the parseexpereact command before"""
+    ParticipatingGroup = apps.get_model('inventorymanagement', 'ParticipatingGroup')
+    ParticipatingGroup.objects.bulk_create([
+        ParticipatingGroup(prefix='GBOD', name='Bode'),
+        ParticipatingGroup(prefix='GYAM', name='Yamakoshi'),
+        ParticipatingGroup(prefix='LEHR', name='Lehrlabor'),
+        ParticipatingGroup(prefix='GZEN', name='Zenobi'),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0045_auto_20261018_0548'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipatingGroup',
+            fields=[
+                ('prefix', models.CharField(help_text='First 4 letters of the Expereact owner codes of the group (e.g. GBOD)', max_length=4, primary_key=True, serialize=False, validators=[inventorymanagement.validators.validate_group_prefix])),
+                ('name', models.CharField(blank=True, max_length=100)),
+            ],
+        ),
+        migrations.RunPython(add_initial_groups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0046_participatinggroup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['code', 'description', 'id'], name='bottle_code_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['code', 'status', 'description', 'id'], name='bottle_code_status_desc_idx'),
+        ),
+    ]
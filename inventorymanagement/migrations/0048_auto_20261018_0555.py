@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0047_auto_20261018_0554'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['status', 'id'], name='bottle_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['borrower_group', 'id'], name='bottle_borrower_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['owner_group', 'id'], name='bottle_owner_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(condition=models.Q(('status', 'out')), fields=['checkout_date'], name='bottle_out_checkout_date_idx'),
+        ),
+    ]
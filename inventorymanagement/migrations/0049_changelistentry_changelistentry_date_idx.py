@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0048_auto_20261018_0555'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='changelistentry',
+            index=models.Index(fields=['date'], name='changelistentry_date_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0049_changelistentry_changelistentry_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BottleEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('bottle_id', models.CharField(max_length=9, verbose_name='Bottle code')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('action', models.CharField(choices=[('checkout', 'checked out'), ('checkin', 'checked in'), ('empty', 'marked empty'), ('created', 'added'), ('updated', 'owner or location changed'), ('deleted', 'removed')], max_length=10)),
+                ('source', models.CharField(choices=[('user', 'user (website or API)'), ('admin', 'admin'), ('sync', 'Expereact sync')], default='user', max_length=10)),
+                ('borrower_full_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('borrower_email', models.EmailField(blank=True, max_length=100, null=True)),
+                ('borrower_group', models.CharField(blank=True, max_length=20, null=True)),
+                ('code', models.CharField(blank=True, max_length=200, null=True)),
+                ('location', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bottleevent',
+            index=models.Index(fields=['bottle_id', 'timestamp'], name='bottleevent_bottle_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bottleevent',
+            index=models.Index(fields=['borrower_email', 'timestamp'], name='bottleevent_borrower_time_idx'),
+        ),
+    ]
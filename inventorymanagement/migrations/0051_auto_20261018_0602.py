@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0050_auto_20261018_0600'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DescriptionRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('loans', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LoanRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('owner_group', models.CharField(blank=True, max_length=4)),
+                ('borrower_group', models.CharField(blank=True, max_length=20)),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('loan_days', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bottleevent',
+            index=models.Index(fields=['timestamp'], name='bottleevent_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='loanrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'owner_group', 'borrower_group'), name='loanrollup_unique_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='descriptionrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'description'), name='descriptionrollup_unique_day'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:04
+
+import re
+
+from django.db import migrations, models
+
+SEARCH_TABLE = 'inventorymanagement_bottlesearch'
+
+BATCH_SIZE = 1000
+
+
+def trigrams(text):
+    """Return the set of trigrams of the lower-case words in <text> (padded as in search.trigrams)"""
+    result = set()
+    for word in re.findall(r'\w+', text.lower()):
+        padded = '  ' + word + ' '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def has_fts5(cursor):
+    """Return True if the SQLite library has the FTS5 extension"""
+    cursor.execute('PRAGMA compile_options')
+    return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def build_search_index(apps, schema_editor):
+    """
+    Create the full-text search index of the database (see search.py) and add the description and supplier of all
+    bottles. The synonyms of the compounds are added by `manage.py rebuildsearchindex`.
+    """
+    connection = schema_editor.connection
+    Bottle = apps.get_model('inventorymanagement', 'Bottle')
+    BottleTrigram = apps.get_model('inventorymanagement', 'BottleTrigram')
+    bottles = list(Bottle.objects.using(connection.alias).values_list('id', 'description', 'supplier').order_by('id'))
+    batches = [bottles[start:start + BATCH_SIZE] for start in range(0, len(bottles), BATCH_SIZE)]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} '
+                           f'(bottle_id varchar(9) PRIMARY KEY, document tsvector NOT NULL)')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} '
+                           f'USING gin (document)')
+            for batch in batches:
+                cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (bottle_id, document) "
+                                   f"VALUES (%s, setweight(to_tsvector('simple', %s), 'A') || "
+                                   f"setweight(to_tsvector('simple', %s), 'B'))",
+                                   batch)
+        elif connection.vendor == 'sqlite' and has_fts5(cursor):
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                           f"USING fts5(bottle_id, description, supplier, prefix='2 3')")
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) "
+                           f"VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')")
+            for batch in batches:
+                cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (bottle_id, description, supplier) '
+                                   f'VALUES (%s, %s, %s)',
+                                   batch)
+        else:
+            for batch in batches:
+                BottleTrigram.objects.using(connection.alias).bulk_create(
+                    [BottleTrigram(bottle_id=bottle_id, trigram=trigram)
+                     for bottle_id, description, supplier in batch
+                     for trigram in trigrams(f'{description} {supplier}')],
+                    batch_size=BATCH_SIZE,
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the full-text search index (the BottleTrigram table is dropped by reversing its CreateModel)"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0051_auto_20261018_0602'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BottleTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bottle_id', models.CharField(max_length=9)),
+                ('trigram', models.CharField(max_length=3)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bottletrigram',
+            index=models.Index(fields=['trigram', 'bottle_id'], name='bottletrigram_trigram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bottletrigram',
+            index=models.Index(fields=['bottle_id'], name='bottletrigram_bottle_idx'),
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
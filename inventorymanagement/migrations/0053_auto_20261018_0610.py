@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:10
+
+from django.db import migrations, models
+from django.db.models.functions import Lower, Substr
+
+
+def fill_compound_key(apps, schema_editor):
+    """
+    Use the lower-case description as preliminary compound key of existing bottles and clear their row digest and
+    the digest of the last Expereact export, so that the next Expereact update re-applies every bottle with its
+    normalised compound key (see chemnames.py)
+    """
+    Bottle = apps.get_model('inventorymanagement', 'Bottle')
+    SyncState = apps.get_model('inventorymanagement', 'SyncState')
+    Bottle.objects.update(compound_key=Lower(Substr('description', 1, 200)), row_digest='')
+    SyncState.objects.filter(source='expereact').update(export_digest='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0052_auto_20261018_0604'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bottle',
+            name='compound_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['compound_key', 'id'], name='bottle_compound_key_idx'),
+        ),
+        migrations.RunPython(fill_compound_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:14
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+
+
+def fill_locations(apps, schema_editor):
+    """
+    Parse room and shelf of existing bottles (same as Bottle.parse_location) and count the bottles per location and
+    status (same as LocationCount.objects.rebuild)
+    """
+    Bottle = apps.get_model('inventorymanagement', 'Bottle')
+    LocationCount = apps.get_model('inventorymanagement', 'LocationCount')
+    bottles = list(Bottle.objects.only('id', 'location', 'status'))
+    counts = defaultdict(Counter)
+    for bottle in bottles:
+        room, _, shelf = (bottle.location or '').strip().partition('-')
+        bottle.room, bottle.shelf = room.strip(), shelf.strip()
+        counts[bottle.room, bottle.shelf][{'in': 'checked_in', 'out': 'checked_out', 'empty': 'empty'}[bottle.status]] += 1
+    Bottle.objects.bulk_update(bottles, ['room', 'shelf'], batch_size=500)
+    LocationCount.objects.bulk_create([LocationCount(room=room, shelf=shelf, **fields)
+                                       for (room, shelf), fields in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0053_auto_20261018_0610'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room', models.CharField(blank=True, max_length=50)),
+                ('shelf', models.CharField(blank=True, max_length=50)),
+                ('checked_in', models.IntegerField(default=0)),
+                ('checked_out', models.IntegerField(default=0)),
+                ('empty', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bottle',
+            name='room',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='bottle',
+            name='shelf',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='bottle',
+            index=models.Index(fields=['room', 'shelf', 'id'], name='bottle_room_shelf_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='locationcount',
+            constraint=models.UniqueConstraint(fields=('room', 'shelf'), name='locationcount_unique_location'),
+        ),
+        migrations.RunPython(fill_locations, migrations.RunPython.noop),
+    ]
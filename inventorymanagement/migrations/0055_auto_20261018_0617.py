@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0054_auto_20261018_0614'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBottle',
+            fields=[
+                ('id', models.CharField(max_length=9, primary_key=True, serialize=False, verbose_name='Bottle code')),
+                ('supplier', models.CharField(max_length=100)),
+                ('price', models.CharField(max_length=20)),
+                ('description', models.CharField(max_length=200)),
+                ('quantity', models.CharField(max_length=20)),
+                ('owner', models.CharField(max_length=100)),
+                ('location', models.CharField(max_length=50)),
+                ('code', models.CharField(max_length=200, verbose_name='owner code')),
+                ('owner_group', models.CharField(max_length=4)),
+                ('compound_key', models.CharField(blank=True, default='', max_length=200)),
+                ('status', models.CharField(choices=[('out', 'checked out'), ('in', 'checked in'), ('empty', 'EMPTY')], max_length=5)),
+                ('checkout_date', models.DateField(blank=True, null=True)),
+                ('borrower_full_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('borrower_email', models.EmailField(blank=True, max_length=100, null=True)),
+                ('borrower_group', models.CharField(blank=True, max_length=20, null=True)),
+                ('reason', models.CharField(choices=[('empty', 'empty'), ('deleted', 'removed from Expereact')], max_length=10)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bottleevent',
+            name='action',
+            field=models.CharField(choices=[('checkout', 'checked out'), ('checkin', 'checked in'), ('empty', 'marked empty'), ('created', 'added'), ('updated', 'owner or location changed'), ('deleted', 'removed'), ('archived', 'archived')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='bottleevent',
+            name='source',
+            field=models.CharField(choices=[('user', 'user (website or API)'), ('admin', 'admin'), ('sync', 'Expereact sync'), ('command', 'management command')], default='user', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbottle',
+            index=models.Index(fields=['archived_at'], name='archivedbottle_archived_idx'),
+        ),
+    ]
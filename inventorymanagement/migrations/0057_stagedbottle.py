@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0056_auto_20261018_0628'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedBottle',
+            fields=[
+                ('id', models.CharField(max_length=9, primary_key=True, serialize=False)),
+                ('supplier', models.CharField(max_length=100)),
+                ('price', models.CharField(max_length=20)),
+                ('description', models.CharField(max_length=200)),
+                ('quantity', models.CharField(max_length=20)),
+                ('owner', models.CharField(max_length=100)),
+                ('location', models.CharField(max_length=50)),
+                ('code', models.CharField(max_length=200)),
+                ('owner_group', models.CharField(max_length=4)),
+                ('compound_key', models.CharField(max_length=200)),
+                ('room', models.CharField(max_length=50)),
+                ('shelf', models.CharField(max_length=50)),
+                ('row_digest', models.CharField(max_length=16)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventorymanagement', '0057_stagedbottle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncstate',
+            name='aggregated_until',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
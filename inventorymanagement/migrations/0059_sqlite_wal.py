@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:45
+
+from django.db import migrations
+
+
+def set_journal_mode(mode):
+    """
+    Return a migration function that sets the journal mode of an SQLite database to <mode>. The journal mode is stored
+    in the database file, so it only has to be set once.
+    """
+    def migrate(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {mode}')
+    return migrate
+
+
+class Migration(migrations.Migration):
+    # the journal mode cannot be changed inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('inventorymanagement', '0058_syncstate_aggregated_until'),
+    ]
+
+    operations = [
+        # WAL: readers and the writer do not block each other (see https://sqlite.org/wal.html)
+        migrations.RunPython(set_journal_mode('WAL'), set_journal_mode('DELETE')),
+    ]
@@ -1,8 +1,133 @@
 from django.urls import reverse
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
+from . import chemnames
 from .validators import *
+from collections import Counter, defaultdict
+from contextlib import contextmanager
 import datetime
+import hashlib
+
+
+LOAN_PERIOD = datetime.timedelta(weeks=2)
+"""Bottles checked out for longer than this are overdue"""
+
+
+class BottleQuerySet(models.QuerySet):
+    """
+    Queries on bottles. The state transitions (check out, check in) are implemented as conditional UPDATEs,
+    so that of two concurrent requests for the same bottle exactly one succeeds, without locking the table.
+    """
+
+    def overdue(self, today=None):
+        """
+        Returns the bottles that are checked out for longer than the loan period (2 weeks).
+        This is the SQL equivalent of Bottle.borrowed_two_weeks() and a range query on the index
+        of checkout_date for checked-out bottles.
+        """
+        return self.filter(self.overdue_condition(today))
+
+    def with_overdue(self, today=None):
+        """
+        Annotates every bottle with is_overdue (True if it is checked out for longer than the loan period),
+        so that the flag can be filtered and sorted on in SQL.
+        """
+        return self.annotate(is_overdue=models.Case(
+            models.When(self.overdue_condition(today), then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ))
+
+    @staticmethod
+    def overdue_condition(today=None):
+        """Returns the Q object matching overdue bottles on <today> (default: today)"""
+        today = today or timezone.now().date()
+        return models.Q(status='out', checkout_date__lt=today - LOAN_PERIOD)
+
+    def check_out(self, bottle_id, borrower_full_name, borrower_email, borrower_group, checkout_date):
+        """
+        Check out the bottle with id <bottle_id> if (and only if) it is currently checked in.
+        The checkout is logged as a BottleEvent in the same transaction.
+        Returns True if the bottle was checked out, False if it was not checked in.
+        """
+        borrower = {
+            'borrower_full_name': borrower_full_name,
+            'borrower_email': borrower_email,
+            'borrower_group': borrower_group,
+        }
+        with transaction.atomic():
+            if self.filter(id=bottle_id, status='in').update(status='out', checkout_date=checkout_date, **borrower) != 1:
+                return False
+            LocationCount.objects.shift(bottle_id, 'in', 'out')
+            BottleEvent.objects.record([bottle_id], 'checkout', **borrower)
+        return True
+
+    def check_out_many(self, bottle_ids, borrower_full_name, borrower_email, borrower_group, checkout_date):
+        """
+        Check out all bottles in <bottle_ids> that are currently checked in, with a single UPDATE.
+        The bottles are selected (and locked, where the backend supports it) first, so that exactly the changed
+        bottles are logged as BottleEvents (one INSERT) and counted at their locations, in the same transaction.
+        Returns the list of ids of the bottles that were checked out.
+        """
+        borrower = {
+            'borrower_full_name': borrower_full_name,
+            'borrower_email': borrower_email,
+            'borrower_group': borrower_group,
+        }
+        with transaction.atomic():
+            selected = list(self.select_for_update().filter(id__in=bottle_ids, status='in')
+                            .values_list('id', 'room', 'shelf'))
+            checked_out = [bottle_id for bottle_id, _, _ in selected]
+            self.filter(id__in=checked_out).update(status='out', checkout_date=checkout_date, **borrower)
+            deltas = Counter()
+            for _, room, shelf in selected:
+                deltas[room, shelf, 'in'] -= 1
+                deltas[room, shelf, 'out'] += 1
+            LocationCount.objects.apply(deltas)
+            BottleEvent.objects.record(checked_out, 'checkout', **borrower)
+        return checked_out
+
+    def check_in(self, bottle_id, empty=False):
+        """
+        Return the bottle with id <bottle_id> if (and only if) it is currently checked out.
+        With empty=True, the bottle is marked as empty instead. This is also possible for bottles that are checked in.
+        The last borrower information is kept. The change is logged as a BottleEvent in the same transaction.
+        Returns True if the bottle was returned (or marked empty), False otherwise.
+        """
+        new_status = 'empty' if empty else 'in'
+        with transaction.atomic():
+            # one conditional UPDATE per allowed status, so that the location counts know where the bottle came from
+            for old_status in (['out', 'in'] if empty else ['out']):
+                if self.filter(id=bottle_id, status=old_status).update(status=new_status, checkout_date=None) == 1:
+                    LocationCount.objects.shift(bottle_id, old_status, new_status)
+                    BottleEvent.objects.record([bottle_id], 'empty' if empty else 'checkin')
+                    return True
+        return False
+
+    def check_in_many(self, bottle_ids, empty=False):
+        """
+        Return (or with empty=True, mark as empty) all bottles in <bottle_ids> that are in a suitable status
+        (see check_in), with a single UPDATE. The bottles are selected (and locked, where the backend supports it)
+        first, so that exactly the changed bottles are logged as BottleEvents.
+        Returns the list of ids of the bottles that were returned (or marked empty).
+        """
+        allowed_status = ['in', 'out'] if empty else ['out']
+        new_status = 'empty' if empty else 'in'
+        with transaction.atomic():
+            selected = list(self.select_for_update().filter(id__in=bottle_ids, status__in=allowed_status)
+                            .values_list('id', 'room', 'shelf', 'status'))
+            returned = [bottle_id for bottle_id, _, _, _ in selected]
+            self.filter(id__in=returned).update(
+                status=new_status,
+                checkout_date=None,
+            )
+            deltas = Counter()
+            for _, room, shelf, old_status in selected:
+                deltas[room, shelf, old_status] -= 1
+                deltas[room, shelf, new_status] += 1
+            LocationCount.objects.apply(deltas)
+            BottleEvent.objects.record(returned, 'empty' if empty else 'checkin')
+        return returned
 
 
 class Bottle(models.Model):
@@ -34,9 +159,33 @@ class Bottle(models.Model):
     - borrowed_two_weeks: True if checkout_date is more than 2 weeks in the past
     - is_checked_out: True if status == 'out'
     - owner_group
+    - row_digest
+    - compound_key
+    - room, shelf (parsed from the location)
     """
 
 
+    objects = BottleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # listing of an owner code (UserChemicalsView), ordered by description (and id for keyset pagination)
+            # also serves lookups by code alone (CheckUserChemicals.clean_user_code)
+            models.Index(fields=['code', 'description', 'id'], name='bottle_code_desc_idx'),
+            # same, only checked-out bottles
+            models.Index(fields=['code', 'status', 'description', 'id'], name='bottle_code_status_desc_idx'),
+            # admin filters (with id, since the admin changelist is ordered by -pk)
+            models.Index(fields=['status', 'id'], name='bottle_status_idx'),
+            models.Index(fields=['borrower_group', 'id'], name='bottle_borrower_group_idx'),
+            models.Index(fields=['owner_group', 'id'], name='bottle_owner_group_idx'),
+            # checked-out bottles by checkout date (borrowed_two_weeks), partial where the backend supports it
+            models.Index(fields=['checkout_date'], name='bottle_out_checkout_date_idx', condition=models.Q(status='out')),
+            # all bottles of a compound
+            models.Index(fields=['compound_key', 'id'], name='bottle_compound_key_idx'),
+            # bottles on a shelf (LocationView)
+            models.Index(fields=['room', 'shelf', 'id'], name='bottle_room_shelf_idx'),
+        ]
+
     # primary key
 
     id = models.CharField(
@@ -136,16 +285,71 @@ class Bottle(models.Model):
     )
     """The owner group is given by the first 4 letters of the (owner) code"""
 
+    row_digest = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        editable=False,
+    )
+    """Digest of the variable properties, used by the Expereact sync to skip unchanged bottles"""
+
+    compound_key = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        editable=False,
+    )
+    """Canonical key of the compound, derived from the description (see chemnames.py)"""
+
+    room = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        editable=False,
+    )
+    """The part of the location before the first '-' (e.g. F312 for F312-SHELF1)"""
+
+    shelf = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        editable=False,
+    )
+    """The part of the location after the first '-' (e.g. SHELF1 for F312-SHELF1), empty if there is none"""
+
     def __str__(self):
         return str(self.id)
 
     def save(self, *args, **kwargs):
         """
-        We modify the save method to calculate the owner_group field at save time.
-        (This way, it can be used in querysets and thus for filtering in the Django admin).
+        We modify the save method to calculate the owner_group, compound_key, room, shelf and row_digest fields at save
+        time. (This way, they can be used in querysets and thus for filtering in the Django admin).
+        The location counts are updated in the same transaction.
         """
         self.owner_group = self.code[:4]
-        super().save(*args, **kwargs)
+        self.compound_key = chemnames.compound_key(self.description)
+        self.room, self.shelf = self.parse_location(self.location)
+        self.row_digest = self.compute_row_digest(self.owner, self.location, self.code, self.compound_key)
+        with transaction.atomic(), LocationCount.objects.tracking([self.pk]):
+            super().save(*args, **kwargs)
+
+    @staticmethod
+    def parse_location(location):
+        """
+        Returns the room and the shelf of <location>, which are separated by the first '-' (F312-SHELF1 is on shelf
+        SHELF1 in room F312). A location without '-' is a room, the shelf is empty then.
+        """
+        room, _, shelf = (location or '').strip().partition('-')
+        return room.strip(), shelf.strip()
+
+    @staticmethod
+    def compute_row_digest(owner, location, code, compound_key):
+        """
+        Returns a short digest of the properties that the sync updates (owner, location, code and compound key).
+        Two bottles have the same digest if and only if (barring collisions) these properties are equal.
+        """
+        content = '\x1f'.join((owner, location, code, compound_key)).encode()
+        return hashlib.blake2b(content, digest_size=8).hexdigest()
 
     def get_absolute_url(self):
         """Returns the url to access a particular instance of the model."""
@@ -156,7 +360,7 @@ class Bottle(models.Model):
         # only evaluate object if checkout_date is set (otherwise datetime.date - NoneType raises error)
         if type(self.checkout_date) is datetime.date:
             current_date = timezone.now().date()
-            return (current_date - self.checkout_date) > datetime.timedelta(weeks=2)
+            return (current_date - self.checkout_date) > LOAN_PERIOD
         else:
             return False
 
@@ -171,6 +375,625 @@ class Bottle(models.Model):
     is_checked_out.description = 'Checked out?'
 
 
+STATUS_COUNT_FIELDS = {'in': 'checked_in', 'out': 'checked_out', 'empty': 'empty'}
+"""The LocationCount field that counts the bottles with a given status"""
+
+
+class LocationCountQuerySet(models.QuerySet):
+    """
+    The location counts are updated incrementally by everything that changes the status or the location of bottles:
+    the state transitions of BottleQuerySet, Bottle.save, the Bottle post_delete signal, the admin actions and the
+    Expereact sync. The changes are given as deltas {(room, shelf, status): change in the number of bottles}.
+    """
+
+    def apply(self, deltas):
+        """
+        Add <deltas> to the counts. Changes of 0 are skipped.
+        The changes of a single location (a checkout or checkin) are made with one UPDATE (a location that has no
+        counts yet is created). The changes of several locations (e.g. by the sync) are made by locking and reading
+        the counts of their rooms and writing them back with a bulk UPDATE and INSERT.
+        """
+        by_location = defaultdict(Counter)
+        for (room, shelf, status), change in deltas.items():
+            if change:
+                by_location[room, shelf][STATUS_COUNT_FIELDS[status]] += change
+        by_location = {location: changes for location, changes in by_location.items() if any(changes.values())}
+        if len(by_location) > 1:
+            self.apply_bulk(by_location)
+            return
+        for (room, shelf), changes in by_location.items():
+            if not self.filter(room=room, shelf=shelf).update(
+                    **{field: models.F(field) + change for field, change in changes.items()}):
+                self.create(room=room, shelf=shelf, **changes)
+
+    def apply_bulk(self, by_location, batch_size=500):
+        """
+        Add the changes <by_location> {(room, shelf): {field: change}} to the counts with bulk queries.
+        The counts are locked (where the backend supports it) while they are read, so run this in a transaction.
+        """
+        rooms = {room for room, _ in by_location}
+        existing = {(location.room, location.shelf): location
+                    for location in self.select_for_update().filter(room__in=rooms)}
+        to_update, to_create = [], []
+        for (room, shelf), changes in by_location.items():
+            location = existing.get((room, shelf))
+            if location is None:
+                to_create.append(LocationCount(room=room, shelf=shelf, **changes))
+                continue
+            for field, change in changes.items():
+                setattr(location, field, getattr(location, field) + change)
+            to_update.append(location)
+        self.bulk_update(to_update, list(STATUS_COUNT_FIELDS.values()), batch_size=batch_size)
+        self.bulk_create(to_create, batch_size=batch_size)
+
+    def shift(self, bottle_id, old_status, new_status):
+        """
+        Move the bottle with id <bottle_id> from the <old_status> to the <new_status> count of its location,
+        with a single UPDATE (the location of the bottle is looked up in a subquery).
+        """
+        bottle = Bottle.objects.filter(id=bottle_id)
+        old_field, new_field = STATUS_COUNT_FIELDS[old_status], STATUS_COUNT_FIELDS[new_status]
+        self.filter(
+            room=models.Subquery(bottle.values('room')[:1]),
+            shelf=models.Subquery(bottle.values('shelf')[:1]),
+        ).update(**{old_field: models.F(old_field) - 1, new_field: models.F(new_field) + 1})
+
+    @staticmethod
+    def bottle_counts(bottle_ids, batch_size=500):
+        """
+        Returns the number of bottles in <bottle_ids> per (room, shelf, status), with one grouped query per
+        <batch_size> ids.
+        """
+        bottle_ids = list(bottle_ids)
+        counts = Counter()
+        for start in range(0, len(bottle_ids), batch_size):
+            rows = (Bottle.objects
+                    .filter(id__in=bottle_ids[start:start + batch_size])
+                    .values_list('room', 'shelf', 'status')
+                    .annotate(n=models.Count('id'))
+                    .order_by())
+            for room, shelf, status, n in rows:
+                counts[room, shelf, status] += n
+        return counts
+
+    @contextmanager
+    def tracking(self, bottle_ids):
+        """
+        Context manager that updates the counts for the changes made to the bottles in <bottle_ids> inside the block
+        (including bottles that are created or deleted). Run it in a transaction.
+        """
+        before = self.bottle_counts(bottle_ids)
+        yield
+        deltas = self.bottle_counts(bottle_ids)
+        deltas.subtract(before)
+        self.apply(deltas)
+
+    def rebuild(self):
+        """Recompute all counts from the Bottle table (with a single grouped query)"""
+        self.all().delete()
+        counts = defaultdict(Counter)
+        for room, shelf, status, n in (Bottle.objects.values_list('room', 'shelf', 'status')
+                                       .annotate(n=models.Count('id')).order_by()):
+            counts[room, shelf][STATUS_COUNT_FIELDS[status]] += n
+        self.bulk_create([LocationCount(room=room, shelf=shelf, **fields) for (room, shelf), fields in counts.items()])
+
+
+class LocationCount(models.Model):
+    """
+    Precomputed number of bottles per location (room and shelf, see Bottle.parse_location) and status, so that the
+    location pages do not have to group the whole Bottle table. A room is the sum of its shelves.
+    A location count consists of
+        - room
+        - shelf
+        - checked_in, checked_out, empty (number of bottles with that status)
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'shelf'], name='locationcount_unique_location'),
+        ]
+
+    objects = LocationCountQuerySet.as_manager()
+
+    room = models.CharField(
+        max_length=50,
+        blank=True,
+    )
+
+    shelf = models.CharField(
+        max_length=50,
+        blank=True,
+    )
+
+    checked_in = models.IntegerField(
+        default=0,
+    )
+
+    checked_out = models.IntegerField(
+        default=0,
+    )
+
+    empty = models.IntegerField(
+        default=0,
+    )
+
+    def total(self):
+        """Returns the number of bottles at this location"""
+        return self.checked_in + self.checked_out + self.empty
+
+    def __str__(self):
+        return f'{self.room}-{self.shelf}' if self.shelf else self.room
+
+
+class ArchivedBottle(models.Model):
+    """
+    A bottle that was removed from the Bottle table: an empty bottle after the retention period (see archive.py) or a
+    bottle that disappeared from Expereact. The archive keeps the last state of the bottle, including the last
+    borrower, so that the status page still finds it, while the queries on the Bottle table only see live bottles.
+    An archived bottle consists of
+        - the fields of Bottle (see there), except the ones only used for querying live bottles
+        - reason (why the bottle was archived, see REASONS)
+        - archived_at
+    A bottle that is archived again (e.g. it came back in Expereact and was removed again) replaces the earlier entry,
+    the full history of a bottle is in the BottleEvents.
+    """
+    REASONS = [
+        ('empty', 'empty'),
+        ('deleted', 'removed from Expereact'),
+    ]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['archived_at'], name='archivedbottle_archived_idx'),
+        ]
+
+    id = models.CharField(
+        primary_key=True,
+        max_length=9,
+        verbose_name='Bottle code',
+    )
+
+    supplier = models.CharField(
+        max_length=100,
+    )
+
+    price = models.CharField(
+        max_length=20,
+    )
+
+    description = models.CharField(
+        max_length=200,
+    )
+
+    quantity = models.CharField(
+        max_length=20,
+    )
+
+    owner = models.CharField(
+        max_length=100,
+    )
+
+    location = models.CharField(
+        max_length=50,
+    )
+
+    code = models.CharField(
+        max_length=200,
+        verbose_name='owner code'
+    )
+
+    owner_group = models.CharField(
+        max_length=4,
+    )
+
+    compound_key = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+    )
+
+    status = models.CharField(
+        choices=Bottle._meta.get_field('status').choices,
+        max_length=5,
+    )
+
+    checkout_date = models.DateField(
+        null=True,
+        blank=True,
+    )
+
+    borrower_full_name = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+    )
+
+    borrower_email = models.EmailField(
+        max_length=100,
+        null=True,
+        blank=True,
+    )
+
+    borrower_group = models.CharField(
+        max_length=20,
+        null=True,
+        blank=True,
+    )
+
+    reason = models.CharField(
+        choices=REASONS,
+        max_length=10,
+    )
+
+    archived_at = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    def __str__(self):
+        return str(self.id)
+
+
+class StagedBottle(models.Model):
+    """
+    A bottle of the Expereact export, written by the staging mode of the sync (see
+    parseexpereact.update_records_staged). The export is written to this table in many short transactions, then the
+    Bottle table is updated from it with a few set-based queries in a single short transaction, so that the web app
+    is only blocked for that long. The table is empty outside of a sync.
+    A staged bottle consists of the fields of Bottle that are taken from Expereact (or derived from them).
+    """
+    id = models.CharField(
+        primary_key=True,
+        max_length=9,
+    )
+
+    supplier = models.CharField(
+        max_length=100,
+    )
+
+    price = models.CharField(
+        max_length=20,
+    )
+
+    description = models.CharField(
+        max_length=200,
+    )
+
+    quantity = models.CharField(
+        max_length=20,
+    )
+
+    owner = models.CharField(
+        max_length=100,
+    )
+
+    location = models.CharField(
+        max_length=50,
+    )
+
+    code = models.CharField(
+        max_length=200,
+    )
+
+    owner_group = models.CharField(
+        max_length=4,
+    )
+
+    compound_key = models.CharField(
+        max_length=200,
+    )
+
+    room = models.CharField(
+        max_length=50,
+    )
+
+    shelf = models.CharField(
+        max_length=50,
+    )
+
+    row_digest = models.CharField(
+        max_length=16,
+    )
+
+    def __str__(self):
+        return str(self.id)
+
+
+class BottleTrigram(models.Model):
+    """
+    Trigram of a word in the description or supplier of a bottle. This is the search index on databases without
+    full-text search (see search.py), on the other databases the table stays empty.
+    """
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram', 'bottle_id'], name='bottletrigram_trigram_idx'),
+            models.Index(fields=['bottle_id'], name='bottletrigram_bottle_idx'),
+        ]
+
+    bottle_id = models.CharField(
+        max_length=9,
+    )
+
+    trigram = models.CharField(
+        max_length=3,
+    )
+
+    def __str__(self):
+        return f'{self.bottle_id}: {self.trigram}'
+
+
+class ParticipatingGroup(models.Model):
+    """
+    A model for the groups that use the system.
+    Only bottles with an owner code starting with the prefix of a participating group are imported from Expereact.
+    A participating group consists of
+        - prefix (the first 4 letters of the owner codes of the group, e.g. GBOD for GBODDU)
+        - name
+    """
+    prefix = models.CharField(
+        primary_key=True,
+        max_length=4,
+        validators=[validate_group_prefix],
+        help_text='First 4 letters of the Expereact owner codes of the group (e.g. GBOD)',
+    )
+
+    name = models.CharField(
+        max_length=100,
+        blank=True,
+    )
+
+    def __str__(self):
+        return self.prefix
+
+
+class SyncState(models.Model):
+    """
+    Bookkeeping for the jobs that bring the database up to date: the update from Expereact (source 'expereact',
+    management command parseexpereact) and the analytics rollups (source 'analytics', management command
+    aggregateanalytics).
+    A sync state consists of
+        - source (the name of the data source)
+        - export_digest (SHA-256 of the last export that was applied to the database)
+        - applied_at (time at which this export was applied)
+        - checkpoint of a sync in progress (it is committed in chunks, see parseexpereact.update_records_in_chunks):
+            - checkpoint_digest (SHA-256 of the export being applied, empty if no sync is in progress)
+            - chunk_size (number of export rows per chunk)
+            - committed_chunks (number of chunks that are committed)
+        - aggregated_until (last day whose events are aggregated into the rollups, see analytics.py)
+    """
+    source = models.CharField(
+        primary_key=True,
+        max_length=50,
+    )
+
+    export_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+    )
+
+    applied_at = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    checkpoint_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+    )
+
+    chunk_size = models.PositiveIntegerField(
+        default=0,
+    )
+
+    committed_chunks = models.PositiveIntegerField(
+        default=0,
+    )
+
+    aggregated_until = models.DateField(
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return self.source
+
+
+class BottleEventQuerySet(models.QuerySet):
+
+    def record(self, bottle_ids, action, source='user', batch_size=500, **fields):
+        """
+        Append one event with <action> for every bottle in <bottle_ids>, with a single INSERT per <batch_size> events.
+        All events get the same timestamp. <fields> are further BottleEvent fields (e.g. the borrower information).
+        """
+        timestamp = timezone.now()
+        return self.bulk_create(
+            [BottleEvent(bottle_id=bottle_id, action=action, source=source, timestamp=timestamp, **fields)
+             for bottle_id in bottle_ids],
+            batch_size=batch_size,
+        )
+
+
+class BottleEvent(models.Model):
+    """
+    Append-only log of the state changes of bottles (checkout, checkin, marked empty and the changes made by the
+    Expereact sync). Events are only ever inserted, never updated or deleted.
+    The bottle is referenced by its id only (not with a foreign key), so that the history of a bottle survives its
+    removal by the sync and the table can be archived or partitioned by timestamp.
+    An event consists of
+        - bottle_id
+        - timestamp
+        - action (see ACTIONS)
+        - source (who made the change, see SOURCES)
+        - borrower_full_name, borrower_email, borrower_group (for checkouts)
+        - code, location (for bottles added or updated by the sync)
+    """
+    ACTIONS = [
+        ('checkout', 'checked out'),
+        ('checkin', 'checked in'),
+        ('empty', 'marked empty'),
+        ('created', 'added'),
+        ('updated', 'owner or location changed'),
+        ('deleted', 'removed'),
+        ('archived', 'archived'),
+    ]
+
+    SOURCES = [
+        ('user', 'user (website or API)'),
+        ('admin', 'admin'),
+        ('sync', 'Expereact sync'),
+        ('command', 'management command'),
+    ]
+
+    class Meta:
+        indexes = [
+            # history of a bottle
+            models.Index(fields=['bottle_id', 'timestamp'], name='bottleevent_bottle_time_idx'),
+            # everything a person borrowed
+            models.Index(fields=['borrower_email', 'timestamp'], name='bottleevent_borrower_time_idx'),
+            # the events of a day (analytics rollups)
+            models.Index(fields=['timestamp'], name='bottleevent_time_idx'),
+        ]
+
+    objects = BottleEventQuerySet.as_manager()
+
+    id = models.BigAutoField(
+        primary_key=True,
+    )
+
+    bottle_id = models.CharField(
+        max_length=9,
+        verbose_name='Bottle code',
+    )
+
+    timestamp = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    action = models.CharField(
+        choices=ACTIONS,
+        max_length=10,
+    )
+
+    source = models.CharField(
+        choices=SOURCES,
+        default='user',
+        max_length=10,
+    )
+
+    borrower_full_name = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+    )
+
+    borrower_email = models.EmailField(
+        max_length=100,
+        null=True,
+        blank=True,
+    )
+
+    borrower_group = models.CharField(
+        max_length=20,
+        null=True,
+        blank=True,
+    )
+
+    code = models.CharField(
+        max_length=200,
+        null=True,
+        blank=True,
+    )
+
+    location = models.CharField(
+        max_length=50,
+        null=True,
+        blank=True,
+    )
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Bottle events are append-only and cannot be changed.')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.bottle_id} {self.action} ({self.timestamp:%d.%m.%Y %H:%M})'
+
+
+class LoanRollup(models.Model):
+    """
+    Daily usage statistics per owner group and borrower group, aggregated from the BottleEvents (see analytics.py).
+    A loan rollup consists of
+        - date
+        - owner_group (empty if the bottle no longer exists)
+        - borrower_group (empty if unknown, e.g. for checkouts by an admin)
+        - loans (number of checkouts on that day)
+        - returns (number of loans that ended on that day, by a checkin or by marking the bottle empty)
+        - loan_days (total duration of these loans in days, divide by returns for the mean)
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'owner_group', 'borrower_group'], name='loanrollup_unique_day'),
+        ]
+
+    date = models.DateField()
+
+    owner_group = models.CharField(
+        max_length=4,
+        blank=True,
+    )
+
+    borrower_group = models.CharField(
+        max_length=20,
+        blank=True,
+    )
+
+    loans = models.PositiveIntegerField(
+        default=0,
+    )
+
+    returns = models.PositiveIntegerField(
+        default=0,
+    )
+
+    loan_days = models.FloatField(
+        default=0,
+    )
+
+    def __str__(self):
+        return f'{self.date}: {self.owner_group} / {self.borrower_group}'
+
+
+class DescriptionRollup(models.Model):
+    """
+    Daily number of checkouts per chemical (bottle description), aggregated from the BottleEvents (see analytics.py).
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'description'], name='descriptionrollup_unique_day'),
+        ]
+
+    date = models.DateField()
+
+    description = models.CharField(
+        max_length=200,
+        blank=True,
+    )
+
+    loans = models.PositiveIntegerField(
+        default=0,
+    )
+
+    def __str__(self):
+        return f'{self.date}: {self.description}'
+
+
+class ChangeListEntryQuerySet(models.QuerySet):
+
+    def recent(self):
+        """Returns the recent entries (at most ChangeListEntry.RECENT_DAYS days old)"""
+        return self.filter(date__gte=datetime.date.today() - datetime.timedelta(days=ChangeListEntry.RECENT_DAYS))
+
+
 class ChangeListEntry(models.Model):
     """
     A model for entries in the changelist.
@@ -183,6 +1006,14 @@ class ChangeListEntry(models.Model):
     class Meta:
         verbose_name = 'changelist entry'
         verbose_name_plural = 'changelist entries'  # this fixes the plural error on the admin page
+        indexes = [
+            models.Index(fields=['date'], name='changelistentry_date_idx'),
+        ]
+
+    RECENT_DAYS = 30
+    """Entries are shown on the index page for this many days"""
+
+    objects = ChangeListEntryQuerySet.as_manager()
 
     entry_id = models.AutoField(
         primary_key=True
@@ -199,6 +1030,6 @@ class ChangeListEntry(models.Model):
 
     def is_recent(self):
         """Recent changes are at most 30 days old"""
-        return self.date >= datetime.date.today() - datetime.timedelta(days=30)
+        return self.date >= datetime.date.today() - datetime.timedelta(days=self.RECENT_DAYS)
 
     is_recent.boolean = True
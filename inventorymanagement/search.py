@@ -0,0 +1,241 @@
+"""
+Full-text search over the chemicals (bottle description and supplier).
+
+The search index is kept in a table of its own, which is updated incrementally: by the Expereact sync in bulk (see
+parseexpereact) and by the Bottle signals for bottles saved one by one (see signals.py). Depending on the database,
+the index is
+    - an FTS5 virtual table (SQLite with FTS5)
+    - a tsvector column with a GIN index (PostgreSQL)
+    - the BottleTrigram table (fallback for all other databases, e.g. SQLite builds without FTS5)
+Every word of a query has to match the beginning of a word in the description or supplier ("dry thf" finds
+"Tetrahydrofuran (THF), dry"). The synonyms of the compound (see chemnames.py) are indexed with the description, so
+"oxolane" finds it as well. Results are ranked by relevance (matches in the description count more) where the
+backend supports it.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Count
+
+from .chemnames import compound_key, synonyms_of
+from .models import Bottle, BottleTrigram
+
+SEARCH_TABLE = 'inventorymanagement_bottlesearch'
+
+MAX_TERMS = 10
+"""Maximum number of words of a query that are used"""
+
+
+def words(text):
+    """Return the lower-case words in <text>"""
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def search_terms(query):
+    """Return the words of <query> that are searched for (at most MAX_TERMS)"""
+    return words(query)[:MAX_TERMS]
+
+
+def search_text(description):
+    """Return the text that is indexed for <description>: the description and the synonyms of its compound"""
+    return ' '.join((description,) + synonyms_of(compound_key(description)))
+
+
+def trigrams(text, prefix=False):
+    """
+    Return the set of trigrams of the words in <text>. Words are padded with two spaces at the beginning and, unless
+    <prefix> is True (for search terms that match the beginning of words), one space at the end.
+    """
+    result = set()
+    for word in words(text):
+        padded = '  ' + word + ('' if prefix else ' ')
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class FTS5Backend:
+    """
+    Search index in an FTS5 virtual table (SQLite).
+    The bottle id is a full-text column as well, so that bottles can be removed from the index through a MATCH on
+    the id (instead of scanning the table), while the search queries are restricted to description and supplier.
+    """
+
+    def create(self, cursor):
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                       f"USING fts5(bottle_id, description, supplier, prefix='2 3')")
+        # rank by bm25 with weights per column (bottle_id, description, supplier)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')")
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def index(self, cursor, bottles, replace=True):
+        if replace:
+            self.unindex(cursor, [bottle_id for bottle_id, _, _ in bottles])
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (bottle_id, description, supplier) VALUES (%s, %s, %s)',
+                           bottles)
+
+    def unindex(self, cursor, bottle_ids):
+        match = 'bottle_id : (' + ' OR '.join('"' + bottle_id.replace('"', '""') + '"' for bottle_id in bottle_ids) + ')'
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN '
+                       f'(SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s)',
+                       [match])
+
+    def search(self, cursor, terms, offset, limit):
+        match = '{description supplier} : (' + ' AND '.join(f'"{term}"*' for term in terms) + ')'
+        cursor.execute(f'SELECT bottle_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                       f'ORDER BY rank LIMIT %s OFFSET %s',
+                       [match, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend:
+    """Search index in a tsvector column with a GIN index (PostgreSQL)"""
+
+    def create(self, cursor):
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} '
+                       f'(bottle_id varchar(9) PRIMARY KEY, document tsvector NOT NULL)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def index(self, cursor, bottles, replace=True):
+        cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (bottle_id, document) "
+                           f"VALUES (%s, setweight(to_tsvector('simple', %s), 'A') || "
+                           f"setweight(to_tsvector('simple', %s), 'B')) "
+                           f"ON CONFLICT (bottle_id) DO UPDATE SET document = EXCLUDED.document",
+                           bottles)
+
+    def unindex(self, cursor, bottle_ids):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE bottle_id = ANY(%s)', [list(bottle_ids)])
+
+    def search(self, cursor, terms, offset, limit):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        cursor.execute(f"SELECT bottle_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+                       f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC, bottle_id "
+                       f"LIMIT %s OFFSET %s",
+                       [query, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class TrigramBackend:
+    """
+    Search index in the BottleTrigram table (any database).
+    A bottle matches if it has all trigrams of the query, which (almost always) means that every search term is the
+    beginning of one of its words. The results are not ranked.
+    """
+
+    def create(self, cursor):
+        pass  # BottleTrigram is created by the migrations
+
+    def drop(self, cursor):
+        pass
+
+    def index(self, cursor, bottles, replace=True):
+        if replace:
+            self.unindex(cursor, [bottle_id for bottle_id, _, _ in bottles])
+        BottleTrigram.objects.bulk_create(
+            [BottleTrigram(bottle_id=bottle_id, trigram=trigram)
+             for bottle_id, description, supplier in bottles
+             for trigram in trigrams(f'{description} {supplier}')],
+            batch_size=1000,
+        )
+
+    def unindex(self, cursor, bottle_ids):
+        BottleTrigram.objects.filter(bottle_id__in=bottle_ids).delete()
+
+    def search(self, cursor, terms, offset, limit):
+        query_trigrams = trigrams(' '.join(terms), prefix=True)
+        return list(BottleTrigram.objects
+                    .filter(trigram__in=query_trigrams)
+                    .values('bottle_id')
+                    .annotate(matches=Count('trigram'))
+                    .filter(matches=len(query_trigrams))
+                    .order_by('bottle_id')
+                    .values_list('bottle_id', flat=True)[offset:offset + limit])
+
+
+def has_fts5(db_connection):
+    """Return True if the SQLite library of <db_connection> has the FTS5 extension"""
+    with db_connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+_backends = {}
+
+
+def get_backend(db_connection=connection):
+    """
+    Return the search backend for <db_connection> (determined once per database)
+    """
+    alias = db_connection.alias
+    if alias not in _backends:
+        if db_connection.vendor == 'postgresql':
+            _backends[alias] = PostgresBackend()
+        elif db_connection.vendor == 'sqlite' and has_fts5(db_connection):
+            _backends[alias] = FTS5Backend()
+        else:
+            _backends[alias] = TrigramBackend()
+    return _backends[alias]
+
+
+def index_bottles(bottles, replace=True, db_connection=connection):
+    """
+    Add (or replace) <bottles> in the search index.
+    :param bottles: list of tuples (id, description, supplier)
+    :param replace: False if the bottles are known not to be in the index yet (saves removing them first)
+    """
+    bottles = [(bottle_id, search_text(description), supplier) for bottle_id, description, supplier in bottles]
+    if not bottles:
+        return
+    with db_connection.cursor() as cursor:
+        get_backend(db_connection).index(cursor, bottles, replace)
+
+
+def unindex_bottles(bottle_ids, db_connection=connection):
+    """
+    Remove the bottles with ids <bottle_ids> from the search index
+    """
+    bottle_ids = list(bottle_ids)
+    if not bottle_ids:
+        return
+    with db_connection.cursor() as cursor:
+        get_backend(db_connection).unindex(cursor, bottle_ids)
+
+
+def rebuild_index(db_connection=connection, batch_size=1000):
+    """
+    Create the search index (if needed) and fill it with all bottles
+    """
+    backend = get_backend(db_connection)
+    with db_connection.cursor() as cursor:
+        backend.drop(cursor)
+        backend.create(cursor)
+    BottleTrigram.objects.using(db_connection.alias).all().delete()
+    bottles = Bottle.objects.using(db_connection.alias).values_list('id', 'description', 'supplier').order_by('id')
+    batch = []
+    for bottle in bottles.iterator(chunk_size=batch_size):
+        batch.append(bottle)
+        if len(batch) == batch_size:
+            index_bottles(batch, replace=False, db_connection=db_connection)
+            batch = []
+    index_bottles(batch, replace=False, db_connection=db_connection)
+
+
+def search_bottles(query, offset=0, limit=25):
+    """
+    Return the bottles matching <query>, best match first.
+    :param query: the search query (words separated by spaces or punctuation)
+    :param offset: number of results to skip
+    :param limit: maximum number of bottles returned
+    :return: list of Bottle
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    with connection.cursor() as cursor:
+        bottle_ids = get_backend().search(cursor, terms, offset, limit)
+    bottles = Bottle.objects.in_bulk(bottle_ids)
+    return [bottles[bottle_id] for bottle_id in bottle_ids if bottle_id in bottles]
@@ -0,0 +1,48 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import CHANGELIST_PAGES, invalidate_pages
+from .models import Bottle, ChangeListEntry, LocationCount
+from .search import index_bottles, unindex_bottles
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    SQLite databases are in WAL mode (set once by a migration, the journal mode is stored in the database file), in
+    which synchronous=NORMAL is still safe against corruption and commits much faster than the default FULL. Unlike
+    the journal mode, this is a setting of the connection. Databases in any other journal mode (e.g. in-memory test
+    databases) keep the default FULL.
+    The time a connection waits for a lock is the sqlite3 connect argument timeout (DATABASES OPTIONS, see README).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        if cursor.fetchone()[0] == 'wal':
+            cursor.execute('PRAGMA synchronous = NORMAL')
+
+
+@receiver([post_save, post_delete], sender=ChangeListEntry)
+def invalidate_changelist_pages(sender, **kwargs):
+    """Remove the pages showing the changelist from the cache when an entry is saved or deleted"""
+    invalidate_pages(CHANGELIST_PAGES)
+
+
+@receiver(post_save, sender=Bottle)
+def index_bottle(sender, instance, **kwargs):
+    """Add a saved bottle to the search index (bulk changes by the sync update the index themselves)"""
+    index_bottles([(instance.id, instance.description, instance.supplier)])
+
+
+@receiver(post_delete, sender=Bottle)
+def unindex_bottle(sender, instance, **kwargs):
+    """Remove a deleted bottle from the search index"""
+    unindex_bottles([instance.id])
+
+
+@receiver(post_delete, sender=Bottle)
+def uncount_bottle(sender, instance, **kwargs):
+    """Remove a deleted bottle from the location counts"""
+    LocationCount.objects.apply({(instance.room, instance.shelf, instance.status): -1})
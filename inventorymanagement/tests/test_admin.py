@@ -0,0 +1,75 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from ..models import Bottle, BottleEvent
+
+
+class BottleAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser('admin', 'admin@ethz.ch', 'password')
+        long_ago = datetime.date.today() - datetime.timedelta(days=20)
+        for bottle_id, status, checkout_date in [('1001', 'in', None),
+                                                 ('1002', 'out', long_ago),
+                                                 ('1103', 'out', datetime.date.today())]:
+            Bottle.objects.create(id=bottle_id,
+                                  supplier='Sial',
+                                  price=50.50,
+                                  description='acetone',
+                                  owner='Django User',
+                                  location='F312-SHELF1',
+                                  code='GBODDU',
+                                  quantity='1000 mL',
+                                  status=status,
+                                  checkout_date=checkout_date,
+                                  )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(self.superuser)
+        self.url = reverse('admin:inventorymanagement_bottle_changelist')
+
+    def result_ids(self, response):
+        return [bottle.id for bottle in response.context['cl'].result_list]
+
+    def test_search_matches_bottle_number_prefix(self):
+        response = self.client.get(self.url, {'q': '100'})
+        self.assertEqual(sorted(self.result_ids(response)), ['1001', '1002'])
+
+    def test_search_does_not_match_inside_bottle_number(self):
+        response = self.client.get(self.url, {'q': '03'})
+        self.assertEqual(self.result_ids(response), [])
+
+    def test_changelist_can_be_sorted_by_overdue(self):
+        # list_display index 6 is the overdue column
+        response = self.client.get(self.url, {'o': '-6'})
+        self.assertEqual(self.result_ids(response)[0], '1002')
+
+    def test_owner_group_filter_choices_come_from_registry(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, '?owner_group=GBOD')
+
+    def test_changelist_count_is_reused(self):
+        self.client.get(self.url)
+        Bottle.objects.filter(id='1001').delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_admin_action_logs_events(self):
+        self.client.post(self.url, {'action': 'mark_checked_in', '_selected_action': ['1002', '1103']})
+        self.assertEqual(Bottle.objects.filter(status='in').count(), 3)
+        self.assertEqual(sorted(BottleEvent.objects.filter(action='checkin', source='admin')
+                                .values_list('bottle_id', flat=True)), ['1002', '1103'])
+
+    def test_admin_action_only_logs_bottles_that_changed(self):
+        for action, status in [('mark_checked_in', 'in'), ('mark_checked_out', 'out')]:
+            with self.subTest(action=action):
+                BottleEvent.objects.all().delete()
+                self.client.post(self.url, {'action': action, '_selected_action': ['1001', '1002']})
+                self.assertEqual(Bottle.objects.filter(id__in=['1001', '1002'], status=status).count(), 2)
+                self.assertEqual(sorted(BottleEvent.objects.values_list('bottle_id', flat=True)),
+                                 ['1002'] if status == 'in' else ['1001', '1002'])
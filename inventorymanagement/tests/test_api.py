@@ -0,0 +1,78 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from ..models import Bottle
+
+
+class BottleApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id, status in [('1', 'in'), ('2', 'out'), ('3', 'in')]:
+            Bottle.objects.create(id=bottle_id,
+                                  supplier='Sial',
+                                  price=50.50,
+                                  description=f'acetone {bottle_id}',
+                                  owner='Django User',
+                                  location='F312-SHELF1',
+                                  code='GBODDU',
+                                  quantity='1000 mL',
+                                  status=status,
+                                  )
+
+    def post_json(self, name, data):
+        return self.client.post(reverse(f'inventorymanagement:{name}'), json.dumps(data),
+                                content_type='application/json')
+
+    def test_bottle_detail_returns_bottle_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('inventorymanagement:api_bottle_detail', args=['1']))
+        self.assertEqual(response.json()['description'], 'acetone 1')
+        self.assertEqual(response.json()['status'], 'in')
+
+    def test_bottle_detail_of_unknown_bottle_is_404(self):
+        response = self.client.get(reverse('inventorymanagement:api_bottle_detail', args=['99']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_bottle_list_reports_missing_bottles(self):
+        response = self.client.get(reverse('inventorymanagement:api_bottle_list'), {'ids': '1,2,99'})
+        self.assertEqual([bottle['id'] for bottle in response.json()['bottles']], ['1', '2'])
+        self.assertEqual(response.json()['missing'], ['99'])
+
+    def test_owner_bottles_only_checked_out(self):
+        response = self.client.get(reverse('inventorymanagement:api_owner_bottles', args=['gboddu']),
+                                   {'only_checked_out': 'true'})
+        self.assertEqual([bottle['id'] for bottle in response.json()['bottles']], ['2'])
+
+    def test_checkout_reports_result_per_bottle(self):
+        response = self.post_json('api_checkout', {
+            'ids': ['1', '2'],
+            'borrower_full_name': 'Test Guy',
+            'borrower_email': 'testguy@ethz.ch',
+            'borrower_group': 'Bode',
+        })
+        results = response.json()['results']
+        self.assertTrue(results[0]['ok'])
+        self.assertFalse(results[1]['ok'])
+        self.assertEqual(Bottle.objects.get(id='1').borrower_full_name, 'Test Guy')
+
+    def test_checkout_with_invalid_email_is_rejected(self):
+        response = self.post_json('api_checkout', {
+            'ids': ['1'],
+            'borrower_full_name': 'Test Guy',
+            'borrower_email': 'testguy@example.com',
+            'borrower_group': 'Bode',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('borrower_email', response.json()['errors'])
+
+    def test_checkin_and_mark_empty(self):
+        self.assertTrue(self.post_json('api_checkin', {'ids': ['2']}).json()['results'][0]['ok'])
+        self.assertTrue(self.post_json('api_empty', {'ids': ['3']}).json()['results'][0]['ok'])
+        self.assertEqual(Bottle.objects.get(id='2').status, 'in')
+        self.assertEqual(Bottle.objects.get(id='3').status, 'empty')
+
+    def test_transition_requires_json_body(self):
+        response = self.client.post(reverse('inventorymanagement:api_checkin'), {'ids': '2'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,102 @@
+import datetime
+from io import StringIO
+
+import pandas as pd
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from ..archive import archive_empty_bottles, expired_empty_bottles
+from ..management.commands.parseexpereact import apply_schema, diff_records, update_records, \
+    update_records_staged
+from ..models import ArchivedBottle, Bottle, BottleEvent, LocationCount
+from ..search import search_bottles
+
+
+class ArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id in ['1', '2', '3']:
+            Bottle.objects.create(id=bottle_id,
+                                  supplier='Sial',
+                                  price=50.50,
+                                  description='acetone',
+                                  owner='Django User',
+                                  location='F312-SHELF1',
+                                  code='GBODDU',
+                                  quantity='1000 mL',
+                                  status='out',
+                                  borrower_full_name='Test Guy',
+                                  )
+        Bottle.objects.check_in('1', empty=True)
+        Bottle.objects.check_in('2', empty=True)
+        # bottle 1 was marked empty long ago
+        BottleEvent.objects.filter(bottle_id='1').update(timestamp=timezone.now() - datetime.timedelta(days=40))
+
+    def test_only_bottles_empty_for_longer_than_retention_expire(self):
+        self.assertEqual(list(expired_empty_bottles(30).values_list('id', flat=True)), ['1'])
+        self.assertEqual(sorted(expired_empty_bottles(0).values_list('id', flat=True)), ['1', '2'])
+
+    def test_archive_moves_bottles_with_last_borrower(self):
+        self.assertEqual(archive_empty_bottles(0, batch_size=1), ['1', '2'])
+        self.assertEqual(list(Bottle.objects.values_list('id', flat=True)), ['3'])
+        archived = ArchivedBottle.objects.get(id='1')
+        self.assertEqual((archived.status, archived.reason, archived.borrower_full_name), ('empty', 'empty', 'Test Guy'))
+        self.assertEqual(BottleEvent.objects.filter(action='archived').count(), 2)
+
+    def test_archive_updates_search_index_and_location_counts(self):
+        archive_empty_bottles(0)
+        self.assertEqual([bottle.id for bottle in search_bottles('acetone')], ['3'])
+        counts = LocationCount.objects.get(room='F312', shelf='SHELF1')
+        self.assertEqual((counts.checked_out, counts.empty), (1, 0))
+
+    def test_archivebottles_command(self):
+        out = StringIO()
+        call_command('archivebottles', '--dry-run', stdout=out)
+        self.assertIn('1 empty bottles would be archived', out.getvalue())
+        self.assertEqual(ArchivedBottle.objects.count(), 0)
+        call_command('archivebottles', '--days', '0', stdout=out)
+        self.assertIn('Archived 2 empty bottles', out.getvalue())
+
+    def test_status_page_shows_archived_bottle(self):
+        archive_empty_bottles(30)
+        response = self.client.post(reverse('inventorymanagement:status'), {'bottle_code': '1'})
+        self.assertRedirects(response, reverse('inventorymanagement:detail', args=['1']))
+        response = self.client.get(reverse('inventorymanagement:detail', args=['1']))
+        self.assertContains(response, 'archived on')
+        self.assertContains(response, 'Test Guy')
+
+    def test_status_page_of_unknown_bottle(self):
+        response = self.client.get(reverse('inventorymanagement:detail', args=['99']))
+        self.assertEqual(response.status_code, 404)
+
+    def export(self, bottle_ids=('1', '2', '3')):
+        """The typed export DataFrame, still listing all three bottles (the empty ones are not removed yet)"""
+        df, _ = apply_schema(pd.DataFrame([{'supplier': 'Sial', 'description': 'acetone', 'price': '50.50',
+                                            'quantity': '1000 mL', 'owner': 'Django User', 'location': 'F312-SHELF1',
+                                            'code': 'GBODDU', 'id': bottle_id, 'compound_key': 'acetone',
+                                            'room': 'F312', 'shelf': 'SHELF1'}
+                                           for bottle_id in bottle_ids]))
+        return df
+
+    def test_sync_does_not_add_archived_empty_bottles_again(self):
+        for update in [update_records, update_records_staged]:
+            with self.subTest(update=update.__name__):
+                archive_empty_bottles(0)
+                result = update(self.export())
+                self.assertEqual((result.inserted, result.unchanged, result.deleted), ([], 3, []))
+                self.assertEqual(list(Bottle.objects.values_list('id', flat=True)), ['3'])
+                self.assertEqual(ArchivedBottle.objects.get(id='1').status, 'empty')
+
+    def test_sync_looks_up_only_new_bottles_in_archive(self):
+        archive_empty_bottles(0)
+        with CaptureQueriesContext(connection) as queries:
+            df_new, _, unchanged, _ = diff_records(self.export(['1', '2', '3', '4', '5']), batch_size=2)
+        self.assertEqual((list(df_new.index), unchanged), ([4, 5], 3))
+        archive_queries = [query['sql'] for query in queries if 'archivedbottle' in query['sql']]
+        # new ids 1, 2, 4 and 5 in batches of two, bottle 3 is known
+        self.assertEqual(len(archive_queries), 2)
+        self.assertFalse(any("'3'" in sql for sql in archive_queries))
@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+from django.test import TestCase
+from .. import benchmarks
+from ..management.commands.parseexpereact import convert_table_to_df, parse_expereact
+from ..models import Bottle
+
+
+class BenchmarkTests(TestCase):
+    """The benchmark suite itself is not timed here, only checked to run every stage and URL"""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'expereact_source.dat')
+        benchmarks.write_synthetic_export(self.path, n_rows=300)
+
+    def test_synthetic_export_has_expereact_format(self):
+        df = convert_table_to_df(parse_expereact(local=True, path=self.path))
+        self.assertEqual(len(df), 300)
+        self.assertEqual(df.columns.to_list(), benchmarks.EXPEREACT_HEADER)
+        self.assertNotIn('<b>', ''.join(df['Product Description']))
+
+    def test_benchmark_sync_times_every_stage(self):
+        stages = benchmarks.benchmark_sync(self.path)
+        for stage in ['parse', 'convert_table_to_df', 'cleanup', 'filter_groups', 'apply_schema', 'update_records',
+                      'swap_in_staged (1% moved)']:
+            self.assertIn('seconds', stages[stage])
+        self.assertEqual(stages['convert_table_to_df']['rows'], 300)
+        self.assertLess(stages['apply_schema']['bytes'], stages['filter_groups']['bytes'])
+        self.assertEqual(Bottle.objects.count(), stages['filter_groups']['rows'])
+
+    def test_benchmark_urls_covers_every_url(self):
+        benchmarks.benchmark_sync(self.path)
+        cases = benchmarks.url_cases(repeat=2)
+        self.assertEqual(benchmarks.missing_url_cases(cases), [])
+        results = benchmarks.benchmark_urls(cases, repeat=2)
+        self.assertEqual({name: stats['status_code'] for name, stats in results.items() if stats['status_code'] >= 400},
+                         {})
+        # the state transitions did change the bottles (checked out through 'borrow', the others were returned)
+        self.assertEqual(Bottle.objects.filter(status='out').count(), 2)
+        self.assertEqual(Bottle.objects.filter(status='empty').count(), 2)
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+from ..chemnames import compound_key, normalize_name
+
+
+class NormalizeNameTests(SimpleTestCase):
+
+    def test_purity_and_grade_are_removed(self):
+        self.assertEqual(normalize_name('Tetrahydrofuran, anhydrous, >=99.9%, inhibitor-free'), 'tetrahydrofuran')
+        self.assertEqual(normalize_name('Acetone puriss. p.a., ACS reagent, >=99.5% (GC)'), 'acetone')
+
+    def test_locants_and_oxidation_states_are_kept(self):
+        self.assertEqual(normalize_name('2,4-Dinitrophenol, 97%'), '2,4-dinitrophenol')
+        self.assertEqual(normalize_name('Palladium(II) acetate, 98%'), 'palladium(ii) acetate')
+
+
+class CompoundKeyTests(SimpleTestCase):
+
+    def test_synonyms_have_the_same_key(self):
+        for description in ['THF, anhydrous', 'Tetrahydrofuran 99.9%', 'Oxolane', 'Tetrahydrofuran (THF), dry']:
+            with self.subTest(description=description):
+                self.assertEqual(compound_key(description), 'tetrahydrofuran')
+
+    def test_synonym_in_parentheses_is_found(self):
+        self.assertEqual(compound_key('Dimethylformamide (DMF)'), 'n,n-dimethylformamide')
+
+    def test_unknown_compound_is_its_own_key(self):
+        self.assertEqual(compound_key('2-(Trimethylsilyl)ethanol, 99%'), '2-(trimethylsilyl)ethanol')
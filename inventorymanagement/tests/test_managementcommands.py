@@ -1,8 +1,40 @@
+import datetime
+import os
+import tempfile
 from io import StringIO
+from unittest import mock
+
+import pandas as pd
+from django.core import mail
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
+from django.utils import timezone
+
+from inventorymanagement.analytics import dashboard, local_date
+from inventorymanagement.management.commands.parseexpereact import parse_expereact, convert_table_to_df, \
+    update_records, iter_expereact_rows, convert_rows_to_df, cleanup, filter_groups, EXPEREACT_COLUMNS, \
+    convert_file_to_df_parallel, split_row_ranges, load_export, SNAPSHOT_SUFFIX, apply_schema, \
+    update_records_in_chunks, update_records_staged
+from inventorymanagement.models import ArchivedBottle, Bottle, BottleEvent, DescriptionRollup, LoanRollup, \
+    LocationCount, ParticipatingGroup, StagedBottle, SyncState
+from inventorymanagement.search import search_bottles
+
+EXPEREACT_HEADER = ['Supplier', 'Catalogue Nr', 'Product Description', 'Group Code', 'User Name', 'Location',
+                    'Bottle Nr', 'Order Nr', 'Quantity', 'Price (CHF)', 'Order Date', 'Reception Date', 'Status',
+                    'Comment']
 
-from inventorymanagement.management.commands.parseexpereact import parse_expereact, convert_table_to_df
+
+def write_sample_export(path, n_rows):
+    """Write a small export in the Expereact HTML table format to <path>"""
+    with open(path, 'w') as file:
+        file.write('<html><body><table>\n')
+        file.write('<tr>' + ''.join(f'<th>{name}</th>' for name in EXPEREACT_HEADER) + '</tr>\n')
+        for i in range(n_rows):
+            cells = ['Sial', '123', f'acetone <b>{i}</b>', 'GBODDU', 'Django User', 'F312-SHELF1', str(1000 + i),
+                     '1', '1000 mL', '50.50', '2021-01-01', '2021-01-02', '', '']
+            file.write('<tr>' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>\n')
+        # trailing row that is not part of the table
+        file.write('<tr><td>Total</td></tr>\n</table></body></html>')
 
 
 class ParseExpereactTest(TestCase):
@@ -14,7 +46,8 @@ class ParseExpereactTest(TestCase):
 
     def test_parseexpereact_runs_successfully(self):
         out = StringIO()
-        call_command('parseexpereact', '--local', stdout=out)
+        # no snapshot, so that the test does not leave one next to the export in the repository
+        call_command('parseexpereact', '--local', '--no-snapshot', stdout=out)
         self.assertIn('SUCCESS', out.getvalue())
 
     def test_parseexpereact_parse_returns_list(self):
@@ -35,3 +68,495 @@ class ParseExpereactTest(TestCase):
                                                 'User Name', 'Location', 'Bottle Nr', 'Order Nr', 'Quantity',
                                                 'Price (CHF)', 'Order Date', 'Reception Date', 'Status', 'Comment'])
 
+
+class SampleExportMixin:
+    """Writes a sample export with <n_rows> rows to self.path in a temporary directory (self.directory)"""
+    n_rows = 25
+
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(directory.name, 'expereact_source.dat')
+        write_sample_export(self.path, n_rows=self.n_rows)
+
+
+class StreamingParserTest(SampleExportMixin, SimpleTestCase):
+    def test_streaming_parser_gives_same_dataframe_as_dom_parser(self):
+        df_dom = convert_table_to_df(parse_expereact(local=True, path=self.path))
+        df_stream = convert_rows_to_df(iter_expereact_rows(self.path), chunksize=10)
+        pd.testing.assert_frame_equal(df_stream, df_dom)
+
+    def test_streaming_parser_stops_at_rows_not_of_length_14(self):
+        df = convert_rows_to_df(iter_expereact_rows(self.path))
+        self.assertEqual(len(df), 25)
+        self.assertEqual(df.columns.to_list(), EXPEREACT_HEADER)
+
+    def test_cleanup_adds_compound_key(self):
+        df = convert_rows_to_df(iter_expereact_rows(self.path)).head(2)
+        df['Product Description'] = ['THF, anhydrous', 'Oxolane']
+        self.assertEqual(cleanup(df)['compound_key'].to_list(), ['tetrahydrofuran', 'tetrahydrofuran'])
+
+    def test_parsers_only_return_selected_columns(self):
+        columns = list(EXPEREACT_COLUMNS)
+        df_dom = convert_table_to_df(parse_expereact(local=True, path=self.path), columns=columns)
+        df_stream = convert_rows_to_df(iter_expereact_rows(self.path), columns=columns)
+        self.assertEqual(df_dom.columns.to_list(), columns)
+        pd.testing.assert_frame_equal(df_stream, df_dom)
+        pd.testing.assert_frame_equal(cleanup(df_dom), cleanup(convert_table_to_df(parse_expereact(local=True,
+                                                                                                   path=self.path))))
+
+
+class ParallelParserTest(SampleExportMixin, SimpleTestCase):
+    def test_row_ranges_begin_with_a_row(self):
+        with open(self.path, 'rb') as file:
+            content = file.read()
+        ranges = split_row_ranges(self.path, content.index(b'<tr'), 7)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(ranges[-1][1], len(content))
+        for start, end in ranges:
+            self.assertTrue(content[start:end].startswith(b'<tr>'))
+
+    def test_parallel_parser_gives_same_dataframe_as_dom_parser(self):
+        df_dom = convert_table_to_df(parse_expereact(local=True, path=self.path))
+        for n_ranges in [1, 4, 30]:
+            with self.subTest(n_ranges=n_ranges):
+                df_parallel = convert_file_to_df_parallel(self.path, workers=2, n_ranges=n_ranges)
+                pd.testing.assert_frame_equal(df_parallel, df_dom)
+
+    def test_parallel_parser_only_returns_selected_columns(self):
+        columns = list(EXPEREACT_COLUMNS)
+        pd.testing.assert_frame_equal(convert_file_to_df_parallel(self.path, workers=2, columns=columns),
+                                      convert_table_to_df(parse_expereact(local=True, path=self.path), columns))
+
+
+class SnapshotTest(SampleExportMixin, SimpleTestCase):
+    def snapshots(self):
+        return [name for name in os.listdir(self.directory) if SNAPSHOT_SUFFIX in name]
+
+    def test_snapshot_gives_same_dataframe_as_parser(self):
+        df_parsed = load_export(self.path, columns=list(EXPEREACT_COLUMNS))
+        self.assertEqual(len(self.snapshots()), 1)
+        with mock.patch(f'{load_export.__module__}.parse_expereact') as parse:
+            df_snapshot = load_export(self.path, columns=list(EXPEREACT_COLUMNS))
+        parse.assert_not_called()
+        pd.testing.assert_frame_equal(df_snapshot, df_parsed)
+        pd.testing.assert_frame_equal(df_snapshot, convert_table_to_df(parse_expereact(local=True, path=self.path),
+                                                                       columns=list(EXPEREACT_COLUMNS)))
+
+    def test_snapshot_is_replaced_when_export_changes(self):
+        load_export(self.path)
+        old_snapshots = self.snapshots()
+        write_sample_export(self.path, n_rows=3)
+        self.assertEqual(len(load_export(self.path)), 3)
+        self.assertEqual(len(self.snapshots()), 1)
+        self.assertNotEqual(self.snapshots(), old_snapshots)
+
+    def test_no_snapshot(self):
+        load_export(self.path, use_snapshot=False)
+        self.assertEqual(self.snapshots(), [])
+
+
+class ApplySchemaTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.df = pd.DataFrame({'supplier': 'Sial', 'description': 'acetone', 'quantity': '1000 mL',
+                                'owner': 'Django User', 'location': 'F312-SHELF1', 'code': 'GBODDU',
+                                'compound_key': 'acetone', 'room': 'F312', 'shelf': 'SHELF1',
+                                'id': ['1000', ' 1001 ', '0123', 'A1002', '1003', '1004', '1005'],
+                                'price': ['50.50', '7', '1.00', '1.00', "1'200.00", '', 'n/a']})
+
+    def test_apply_schema_converts_to_compact_dtypes(self):
+        df, _ = apply_schema(self.df)
+        self.assertEqual(df.columns.to_list(), self.df.columns.to_list())
+        self.assertEqual(df['id'].to_list(), [1000, 1001, 1003, 1004])
+        self.assertEqual(df['price'].to_list()[:3], [50.5, 7.0, 1200.0])
+        self.assertTrue(pd.isna(df['price'].iloc[3]))
+        for column in ['supplier', 'description', 'quantity', 'owner', 'location', 'code', 'room', 'shelf']:
+            self.assertEqual(df[column].dtype, 'category')
+        self.assertLess(df.memory_usage(deep=True).sum(), self.df.memory_usage(deep=True).sum())
+
+    def test_apply_schema_rejects_malformed_rows(self):
+        self.df.loc[0, 'location'] = 'F312-' + 'X' * 50
+        _, rejected = apply_schema(self.df)
+        self.assertEqual(rejected.to_dict('records'), [
+            {'id': '1000', 'reason': 'location longer than 50 characters'},
+            {'id': '0123', 'reason': 'invalid bottle number'},
+            {'id': 'A1002', 'reason': 'invalid bottle number'},
+            {'id': '1005', 'reason': 'invalid price'},
+        ])
+
+
+class FilterGroupsTest(TestCase):
+    def setUp(self) -> None:
+        self.df = pd.DataFrame({'code': ['GBODDU', 'GYAMAB', 'GCARXY', 'GBODD', 'GBODDUX', 'GBODd1', 'LEHRZZ']})
+
+    def test_filter_groups_keeps_registered_groups(self):
+        df = filter_groups(self.df)
+        self.assertEqual(df['code'].to_list(), ['GBODDU', 'GYAMAB', 'LEHRZZ'])
+
+    def test_filter_groups_with_explicit_prefixes(self):
+        df = filter_groups(self.df, prefixes=['GCAR'])
+        self.assertEqual(df['code'].to_list(), ['GCARXY'])
+
+    def test_filter_groups_includes_newly_registered_group(self):
+        ParticipatingGroup.objects.create(prefix='GCAR', name='Carreira')
+        self.assertIn('GCARXY', filter_groups(self.df)['code'].to_list())
+
+
+class SyncTestCase(TestCase):
+    """Three bottles in the database and a helper to build the typed export DataFrame"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id, location in [('1', 'F312-SHELF1'), ('2', 'F312-SHELF2'), ('3', 'F312-SHELF3')]:
+            Bottle.objects.create(id=bottle_id,
+                                  supplier='Sial',
+                                  price='50.50',
+                                  description='acetone',
+                                  owner='Django User',
+                                  location=location,
+                                  code='GBODDU',
+                                  quantity='1000 mL',
+                                  )
+
+    @staticmethod
+    def make_df(rows):
+        df, _ = apply_schema(pd.DataFrame([{'supplier': 'Sial', 'description': 'acetone', 'price': '50.50',
+                                            'quantity': '1000 mL', 'owner': 'Django User', 'location': location,
+                                            'code': code, 'id': bottle_id, 'compound_key': 'acetone',
+                                            'room': location.split('-')[0], 'shelf': location.split('-')[1]}
+                                           for bottle_id, location, code in rows]))
+        return df
+
+
+class UpdateRecordsTest(SyncTestCase):
+    def test_update_records_reports_inserted_updated_unchanged_and_deleted(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF9', 'GBODDU'), ('4', 'F312-SHELF4', 'GYAMXY')])
+        result = update_records(df)
+        self.assertEqual(result.inserted, ['4'])
+        self.assertEqual(result.updated, ['2'])
+        self.assertEqual(result.unchanged, 1)
+        self.assertEqual(result.deleted, ['3'])
+
+    def test_update_records_writes_changes_to_db(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF9', 'GYAMXY'), ('4', 'F312-SHELF4', 'GYAMXY')])
+        update_records(df, batch_size=1)
+        self.assertFalse(Bottle.objects.filter(id='3').exists())
+        self.assertEqual(Bottle.objects.get(id='2').location, 'F312-SHELF9')
+        self.assertEqual(Bottle.objects.get(id='4').description, 'acetone')
+        # owner_group must be kept in sync even though bulk queries bypass Bottle.save()
+        self.assertEqual(Bottle.objects.filter(owner_group='GYAM').count(), 2)
+
+    def test_update_records_archives_removed_bottles(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF2', 'GBODDU')])
+        update_records(df)
+        archived = ArchivedBottle.objects.get()
+        self.assertEqual((archived.id, archived.reason, archived.location), ('3', 'deleted', 'F312-SHELF3'))
+
+    def test_update_records_logs_changes_as_events(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF9', 'GBODDU'), ('4', 'F312-SHELF4', 'GYAMXY')])
+        update_records(df)
+        self.assertEqual(sorted(BottleEvent.objects.values_list('bottle_id', 'action', 'location')),
+                         [('2', 'updated', 'F312-SHELF9'), ('3', 'deleted', None), ('4', 'created', 'F312-SHELF4')])
+
+    def test_update_records_updates_search_index(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF2', 'GBODDU'), ('4', 'F312-SHELF4', 'GYAMXY')])
+        df['description'] = 'benzene'
+        update_records(df)
+        # bottle 3 was removed, bottle 4 added (descriptions of existing bottles are not changed by the sync)
+        self.assertEqual([bottle.id for bottle in search_bottles('benzene')], ['4'])
+        self.assertEqual(sorted(bottle.id for bottle in search_bottles('acetone')), ['1', '2'])
+
+    def test_update_records_updates_location_counts(self):
+        Bottle.objects.check_in('2', empty=True)
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF9', 'GBODDU'), ('4', 'F312-SHELF1', 'GYAMXY')])
+        update_records(df)
+        self.assertEqual(sorted(LocationCount.objects.values_list('shelf', 'checked_in', 'empty')),
+                         [('SHELF1', 2, 0), ('SHELF2', 0, 0), ('SHELF3', 0, 0), ('SHELF9', 0, 1)])
+
+    def test_update_records_keeps_bottles_of_rejected_rows(self):
+        Bottle.objects.check_out('2', 'Test Guy', 'testguy@ethz.ch', 'Bode', datetime.date.today())
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('3', 'F312-SHELF3', 'GBODDU')])
+        for update in [update_records, update_records_staged,
+                       lambda df, rejected_ids: update_records_in_chunks(df, 'digest', chunk_size=1,
+                                                                         rejected_ids=rejected_ids)[0]]:
+            with self.subTest(update=update):
+                result = update(df, rejected_ids=['2'])
+                self.assertEqual(result.deleted, [])
+                self.assertEqual(Bottle.objects.get(id='2').status, 'out')
+
+    def test_update_records_does_not_write_unchanged_rows(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF2', 'GBODDU'), ('3', 'F312-SHELF3', 'GBODDU')])
+        # one query to read the table, the other two are the savepoint of the (empty) transaction
+        with self.assertNumQueries(3):
+            result = update_records(df)
+        self.assertEqual(result.unchanged, 3)
+
+
+class UpdateRecordsInChunksTest(SyncTestCase):
+    rows = [('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF9', 'GBODDU'), ('4', 'F312-SHELF4', 'GYAMXY'),
+            ('5', 'F312-SHELF5', 'GYAMXY')]
+
+    def test_chunks_give_same_result_as_single_transaction(self):
+        committed = []
+        result, skipped = update_records_in_chunks(self.make_df(self.rows), 'digest', chunk_size=1,
+                                                   progress=lambda chunk, n_chunks: committed.append((chunk, n_chunks)))
+        self.assertEqual(committed, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.deleted, skipped),
+                         (['4', '5'], ['2'], 1, ['3'], 0))
+        self.assertEqual(sorted(Bottle.objects.values_list('id', 'location')),
+                         [('1', 'F312-SHELF1'), ('2', 'F312-SHELF9'), ('4', 'F312-SHELF4'), ('5', 'F312-SHELF5')])
+        sync_state = SyncState.objects.get(source='expereact')
+        self.assertEqual((sync_state.export_digest, sync_state.checkpoint_digest, sync_state.committed_chunks),
+                         ('digest', '', 0))
+
+    def interrupt_after_chunk(self, chunk):
+        """Run a sync that fails while writing chunk <chunk> + 1"""
+        def progress(committed_chunks, n_chunks):
+            if committed_chunks == chunk:
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            update_records_in_chunks(self.make_df(self.rows), 'digest', chunk_size=1, progress=progress)
+
+    def test_interrupted_sync_keeps_committed_chunks(self):
+        self.interrupt_after_chunk(2)
+        sync_state = SyncState.objects.get(source='expereact')
+        self.assertEqual((sync_state.export_digest, sync_state.checkpoint_digest, sync_state.committed_chunks),
+                         ('', 'digest', 2))
+        self.assertEqual(Bottle.objects.get(id='2').location, 'F312-SHELF9')
+        self.assertFalse(Bottle.objects.filter(id='4').exists())
+
+    def test_resume_skips_committed_chunks(self):
+        self.interrupt_after_chunk(2)
+        result, skipped = update_records_in_chunks(self.make_df(self.rows), 'digest', chunk_size=1, resume=True)
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.deleted, skipped),
+                         (['4', '5'], [], 0, ['3'], 2))
+        self.assertEqual(BottleEvent.objects.filter(bottle_id='2', action='updated').count(), 1)
+        self.assertEqual(SyncState.objects.get(source='expereact').export_digest, 'digest')
+
+    def test_resume_ignores_checkpoint_of_other_export(self):
+        self.interrupt_after_chunk(2)
+        result, skipped = update_records_in_chunks(self.make_df(self.rows), 'other digest', chunk_size=1,
+                                                   resume=True)
+        self.assertEqual(skipped, 0)
+        self.assertEqual((result.inserted, result.unchanged, result.deleted), (['4', '5'], 2, ['3']))
+
+
+class UpdateRecordsStagedTest(SyncTestCase):
+    rows = [('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF9', 'GYAMXY'), ('4', 'F312-SHELF1', 'GYAMXY')]
+
+    def test_staged_sync_gives_same_result_as_update_records(self):
+        Bottle.objects.check_out('2', 'Test Guy', 'testguy@ethz.ch', 'Bode', datetime.date.today())
+        result = update_records_staged(self.make_df(self.rows), batch_size=1)
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.deleted), (['4'], ['2'], 1, ['3']))
+        self.assertEqual(sorted(Bottle.objects.values_list('id', 'location', 'owner_group', 'room', 'shelf', 'status')),
+                         [('1', 'F312-SHELF1', 'GBOD', 'F312', 'SHELF1', 'in'),
+                          ('2', 'F312-SHELF9', 'GYAM', 'F312', 'SHELF9', 'out'),
+                          ('4', 'F312-SHELF1', 'GYAM', 'F312', 'SHELF1', 'in')])
+        new_bottle = Bottle.objects.get(id='4')
+        self.assertEqual((new_bottle.price, new_bottle.description, new_bottle.borrower_email), ('50.50', 'acetone', None))
+        self.assertEqual(Bottle.objects.get(id='2').borrower_email, 'testguy@ethz.ch')
+        self.assertEqual(ArchivedBottle.objects.get().id, '3')
+        self.assertEqual(sorted(BottleEvent.objects.filter(source='sync').values_list('bottle_id', 'action')),
+                         [('2', 'updated'), ('3', 'deleted'), ('4', 'created')])
+        self.assertEqual([bottle.id for bottle in search_bottles('acetone', limit=10)], ['1', '2', '4'])
+        self.assertEqual(sorted(LocationCount.objects.values_list('shelf', 'checked_in', 'checked_out')),
+                         [('SHELF1', 2, 0), ('SHELF2', 0, 0), ('SHELF3', 0, 0), ('SHELF9', 0, 1)])
+        self.assertFalse(StagedBottle.objects.exists())
+
+    def test_staged_sync_of_unchanged_export_does_not_write_bottles(self):
+        df = self.make_df([('1', 'F312-SHELF1', 'GBODDU'), ('2', 'F312-SHELF2', 'GBODDU'), ('3', 'F312-SHELF3', 'GBODDU')])
+        result = update_records_staged(df)
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.deleted), ([], [], 3, []))
+        self.assertFalse(BottleEvent.objects.exists())
+
+
+class UnchangedExportTest(SampleExportMixin, TestCase):
+    n_rows = 5
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('parseexpereact', '--local', '--source', self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_parseexpereact_stores_digest_of_applied_export(self):
+        self.run_command()
+        self.assertEqual(len(SyncState.objects.get(source='expereact').export_digest), 64)
+        self.assertEqual(Bottle.objects.count(), 5)
+
+    def test_parseexpereact_skips_identical_export(self):
+        self.run_command()
+        Bottle.objects.filter(id='1000').delete()
+        self.assertIn('nothing to do', self.run_command())
+        self.assertFalse(Bottle.objects.filter(id='1000').exists())
+
+    def test_parseexpereact_applies_identical_export_after_group_registration(self):
+        self.run_command()
+        ParticipatingGroup.objects.create(prefix='GCAR', name='Carreira')
+        self.assertNotIn('nothing to do', self.run_command())
+
+    def test_parseexpereact_with_parallel_parser(self):
+        self.assertIn('Inserted: 5, updated: 0, unchanged: 0, deleted: 0', self.run_command('--workers', '2'))
+
+    def test_parseexpereact_reports_malformed_rows(self):
+        write_sample_export(self.path, n_rows=5)
+        with open(self.path) as file:
+            content = file.read()
+        with open(self.path, 'w') as file:
+            file.write(content.replace('<td>1002</td>', '<td>10O2</td>'))
+        out = self.run_command()
+        self.assertIn("Skipped 1 malformed rows", out)
+        self.assertIn("bottle '10O2': invalid bottle number", out)
+        self.assertIn('Inserted: 4, updated: 0, unchanged: 0, deleted: 0', out)
+
+    def test_parseexpereact_keeps_bottles_of_malformed_rows(self):
+        self.run_command()
+        Bottle.objects.check_out('1002', 'Test Guy', 'testguy@ethz.ch', 'Bode', datetime.date.today())
+        with open(self.path) as file:
+            content = file.read()
+        with open(self.path, 'w') as file:
+            file.write(content.replace('<td>1002</td><td>1</td><td>1000 mL</td><td>50.50</td>',
+                                       '<td>1002</td><td>1</td><td>1000 mL</td><td>on request</td>'))
+        for args in [(), ('--staging',)]:
+            with self.subTest(args=args):
+                out = self.run_command('--force', *args)
+                self.assertIn("bottle '1002': invalid price", out)
+                self.assertIn('Inserted: 0, updated: 0, unchanged: 4, deleted: 0', out)
+                bottle = Bottle.objects.get(id='1002')
+                self.assertEqual((bottle.status, bottle.borrower_email), ('out', 'testguy@ethz.ch'))
+                self.assertFalse(ArchivedBottle.objects.exists())
+
+    def test_parseexpereact_only_reports_malformed_rows_of_participating_groups(self):
+        with open(self.path) as file:
+            content = file.read()
+        with open(self.path, 'w') as file:
+            file.write(content.replace('<td>GBODDU</td><td>Django User</td><td>F312-SHELF1</td><td>1002</td>',
+                                       '<td>GXYZDU</td><td>Django User</td><td>F312-SHELF1</td><td>10O2</td>'))
+        out = self.run_command()
+        self.assertNotIn('malformed', out)
+        self.assertIn('Inserted: 4, updated: 0, unchanged: 0, deleted: 0', out)
+
+    def test_parseexpereact_commits_in_chunks(self):
+        out = self.run_command('--chunk-size', '2')
+        self.assertIn('Committed chunk 3/3', out)
+        self.assertIn('Inserted: 5, updated: 0, unchanged: 0, deleted: 0', out)
+
+    def test_parseexpereact_resumes_interrupted_update(self):
+        self.run_command()
+        write_sample_export(self.path, n_rows=7)
+        with mock.patch(f'{update_records_in_chunks.__module__}.Command.report_progress',
+                        side_effect=[None, KeyboardInterrupt]):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_command('--chunk-size', '2')
+        self.assertEqual(Bottle.objects.count(), 5)
+        out = self.run_command('--chunk-size', '2', '--resume')
+        self.assertIn('Resumed after 2 committed chunks', out)
+        self.assertIn('Inserted: 2, updated: 0, unchanged: 1, deleted: 0', out)
+        self.assertEqual(Bottle.objects.count(), 7)
+
+    def test_parseexpereact_with_staging_table(self):
+        self.run_command()
+        write_sample_export(self.path, n_rows=7)
+        self.assertIn('Inserted: 2, updated: 0, unchanged: 5, deleted: 0', self.run_command('--staging'))
+        self.assertEqual(Bottle.objects.count(), 7)
+        self.assertIn('nothing to do', self.run_command('--staging'))
+
+    def test_parseexpereact_applies_identical_export_with_force(self):
+        self.run_command()
+        Bottle.objects.filter(id='1000').delete()
+        self.assertIn('Inserted: 1, updated: 0, unchanged: 4, deleted: 0', self.run_command('--force'))
+
+
+class SendRemindersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        long_ago = datetime.date.today() - datetime.timedelta(days=20)
+        for i, (email, checkout_date) in enumerate([('a@ethz.ch', long_ago),
+                                                    ('a@ethz.ch', long_ago),
+                                                    ('b@ethz.ch', long_ago),
+                                                    ('c@ethz.ch', datetime.date.today())]):
+            Bottle.objects.create(id=str(i), description=f'chemical {i}', code='GBODDU', owner='Django User',
+                                  location='F312-SHELF1', status='out', checkout_date=checkout_date,
+                                  borrower_full_name='Test Guy', borrower_email=email, borrower_group='Bode')
+
+    def test_sendreminders_sends_one_email_per_borrower_with_overdue_bottles(self):
+        out = StringIO()
+        call_command('sendreminders', stdout=out)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@ethz.ch', 'b@ethz.ch'])
+        self.assertIn('Sent 2 reminders for 3 overdue bottles', out.getvalue())
+
+    def test_sendreminders_lists_all_overdue_bottles_of_borrower(self):
+        call_command('sendreminders', stdout=StringIO())
+        message = next(message for message in mail.outbox if message.to == ['a@ethz.ch'])
+        self.assertIn('- 0 (chemical 0', message.body)
+        self.assertIn('- 1 (chemical 1', message.body)
+
+    def test_sendreminders_dry_run_sends_nothing(self):
+        out = StringIO()
+        call_command('sendreminders', '--dry-run', stdout=out)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertIn('a@ethz.ch: 0, 1', out.getvalue())
+
+
+class AggregateAnalyticsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Bottle.objects.create(id='1', description='acetone', code='GBODDU', owner='Django User',
+                              location='F312-SHELF1')
+        Bottle.objects.create(id='2', description='ethanol', code='GYAMXY', owner='Django User',
+                              location='F312-SHELF1')
+        cls.start = timezone.now() - datetime.timedelta(days=3)
+        for bottle_id, action, days, borrower_group in [('1', 'checkout', 0, 'Bode'),
+                                                        ('2', 'checkout', 0, 'Bode'),
+                                                        ('1', 'checkin', 2, None),
+                                                        ('1', 'empty', 2.01, None)]:
+            BottleEvent.objects.create(bottle_id=bottle_id, action=action, borrower_group=borrower_group,
+                                       timestamp=cls.start + datetime.timedelta(days=days))
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('aggregateanalytics', *args, stdout=out)
+        return out.getvalue()
+
+    def test_aggregateanalytics_counts_loans_per_group(self):
+        self.run_command()
+        self.assertEqual(sorted(LoanRollup.objects.values_list('owner_group', 'borrower_group', 'loans')),
+                         [('GBOD', 'Bode', 0), ('GBOD', 'Bode', 1), ('GYAM', 'Bode', 1)])
+        self.assertEqual(sorted(DescriptionRollup.objects.values_list('description', 'loans')),
+                         [('acetone', 1), ('ethanol', 1)])
+
+    def test_aggregateanalytics_measures_loan_duration(self):
+        """Marking the returned bottle empty afterwards does not end a second loan"""
+        self.run_command()
+        rollup = LoanRollup.objects.get(returns__gt=0)
+        self.assertEqual(rollup.returns, 1)
+        self.assertAlmostEqual(rollup.loan_days, 2)
+
+    def test_aggregateanalytics_only_processes_new_days(self):
+        self.run_command()
+        self.assertIn('Aggregated 0 days', self.run_command())
+
+    def test_aggregateanalytics_does_not_scan_days_without_events_again(self):
+        BottleEvent.objects.all().delete()
+        BottleEvent.objects.create(bottle_id='1', action='checkin', timestamp=self.start)
+        self.assertIn('Aggregated 3 days', self.run_command())
+        self.assertIn('Aggregated 0 days', self.run_command())
+
+    def test_dashboard_shows_trailing_days_without_events_as_aggregated(self):
+        """The only event is three days old, but the two days after it were aggregated too"""
+        BottleEvent.objects.exclude(bottle_id='2').delete()
+        self.run_command()
+        self.assertEqual(dashboard()['aggregated_until'], local_date() - datetime.timedelta(days=1))
+
+    def test_aggregateanalytics_rebuild_aggregates_whole_history(self):
+        self.run_command()
+        self.assertIn('Aggregated 3 days', self.run_command('--rebuild'))
+
+
+class RecountLocationsTest(TestCase):
+    def test_recountlocations_fixes_drifted_counts(self):
+        Bottle.objects.create(id='1', description='acetone', code='GBODDU', location='F312-SHELF1')
+        LocationCount.objects.update(checked_in=5)
+        call_command('recountlocations', stdout=StringIO())
+        self.assertEqual(LocationCount.objects.get(room='F312', shelf='SHELF1').checked_in, 1)
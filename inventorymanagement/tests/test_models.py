@@ -1,6 +1,13 @@
-from django.test import TestCase
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from unittest import skipUnless
+
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase
 import datetime
-from ..models import Bottle, ChangeListEntry
+from ..models import Bottle, BottleEvent, ChangeListEntry, LocationCount
 
 
 class BottleModelTests(TestCase):
@@ -54,6 +61,13 @@ class BottleModelTests(TestCase):
         self.assertFalse(self.bottle.borrowed_two_weeks())
 
 
+    def test_overdue_queryset_matches_borrowed_two_weeks(self):
+        Bottle.objects.filter(id='1').update(status='out', checkout_date=datetime.date.today() - datetime.timedelta(days=15))
+        self.assertTrue(Bottle.objects.overdue().filter(id='1').exists())
+        Bottle.objects.filter(id='1').update(checkout_date=datetime.date.today() - datetime.timedelta(days=14))
+        self.assertFalse(Bottle.objects.overdue().filter(id='1').exists())
+
+
 class ChangeListEntryTestCase(TestCase):
 
     @classmethod
@@ -79,3 +93,164 @@ class ChangeListEntryTestCase(TestCase):
         changelistentry = ChangeListEntry.objects.get(entry_id=1)
         changelistentry.date = datetime.date.today() - datetime.timedelta(days=31)
         self.assertFalse(changelistentry.is_recent())
+
+    def test_recent_queryset_matches_is_recent(self):
+        ChangeListEntry.objects.create(description='Old change', date=datetime.date.today() - datetime.timedelta(days=31))
+        self.assertEqual([entry.description for entry in ChangeListEntry.objects.recent()], ['Removed a bug'])
+
+
+class BottleStateTransitionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Bottle.objects.create(id='1',
+                              supplier='Sial',
+                              price=50.50,
+                              description='acetone',
+                              owner='Django User',
+                              location='F312-SHELF1',
+                              code='GBODDU',
+                              quantity='1000 mL',
+                              status='in',
+                              )
+
+    def check_out(self, full_name):
+        return Bottle.objects.check_out('1',
+                                        borrower_full_name=full_name,
+                                        borrower_email='test@ethz.ch',
+                                        borrower_group='Bode',
+                                        checkout_date=datetime.date.today(),
+                                        )
+
+    def test_only_first_of_two_checkouts_succeeds(self):
+        """Two checkouts of the same bottle (e.g. by concurrent requests): the second one must not overwrite the first"""
+        self.assertTrue(self.check_out('First Guy'))
+        self.assertFalse(self.check_out('Second Guy'))
+        self.assertEqual(Bottle.objects.get(id='1').borrower_full_name, 'First Guy')
+
+    def test_check_in_only_succeeds_for_checked_out_bottle(self):
+        self.assertFalse(Bottle.objects.check_in('1'))
+        self.check_out('First Guy')
+        self.assertTrue(Bottle.objects.check_in('1'))
+        self.assertEqual(Bottle.objects.get(id='1').status, 'in')
+
+    def test_empty_bottle_cannot_be_checked_out(self):
+        self.assertTrue(Bottle.objects.check_in('1', empty=True))
+        self.assertFalse(self.check_out('First Guy'))
+
+    def test_check_out_many_only_returns_bottles_checked_out_by_this_call(self):
+        Bottle.objects.create(id='2', description='ethanol', code='GBODDU', status='out',
+                              borrower_full_name='First Guy')
+        checked_out = Bottle.objects.check_out_many(['1', '2'],
+                                                    borrower_full_name='Second Guy',
+                                                    borrower_email='test@ethz.ch',
+                                                    borrower_group='Bode',
+                                                    checkout_date=datetime.date.today(),
+                                                    )
+        self.assertEqual(checked_out, ['1'])
+        self.assertEqual(Bottle.objects.get(id='2').borrower_full_name, 'First Guy')
+
+
+class BottleEventTests(BottleStateTransitionTests):
+    """Every successful state transition appends exactly one event per bottle"""
+
+    def actions(self):
+        return list(BottleEvent.objects.filter(bottle_id='1').order_by('id').values_list('action', flat=True))
+
+    def test_checkout_and_checkin_are_logged(self):
+        self.check_out('First Guy')
+        self.check_out('Second Guy')
+        Bottle.objects.check_in('1')
+        Bottle.objects.check_in('1')
+        self.assertEqual(self.actions(), ['checkout', 'checkin'])
+        self.assertEqual(BottleEvent.objects.get(action='checkout').borrower_full_name, 'First Guy')
+
+    def test_check_in_many_logs_only_changed_bottles(self):
+        Bottle.objects.create(id='2', description='ethanol', code='GBODDU', status='in')
+        self.check_out('First Guy')
+        self.assertEqual(Bottle.objects.check_in_many(['1', '2']), ['1'])
+        self.assertEqual(list(BottleEvent.objects.filter(action='checkin').values_list('bottle_id', flat=True)),
+                         ['1'])
+
+    def test_events_cannot_be_changed(self):
+        self.check_out('First Guy')
+        event = BottleEvent.objects.get()
+        event.borrower_full_name = 'Second Guy'
+        with self.assertRaises(ValueError):
+            event.save()
+
+
+class LocationCountTests(TestCase):
+    """The incrementally updated location counts always match a recount of the Bottle table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id, location in [('1', 'F312-SHELF1'), ('2', 'F312-SHELF1'), ('3', 'F312-SHELF2'), ('4', 'H209')]:
+            Bottle.objects.create(id=bottle_id, description='acetone', code='GBODDU', location=location)
+
+    def counts(self):
+        return sorted(LocationCount.objects.filter(checked_in__gt=0).values_list('room', 'shelf', 'checked_in')) + \
+               sorted(LocationCount.objects.values_list('room', 'shelf', 'checked_out', 'empty'))
+
+    def assertCountsMatchBottles(self):
+        counts = self.counts()
+        LocationCount.objects.rebuild()
+        self.assertEqual(counts, self.counts())
+
+    def test_parse_location(self):
+        self.assertEqual(Bottle.parse_location('F312-SHELF1'), ('F312', 'SHELF1'))
+        self.assertEqual(Bottle.parse_location('F312-SHELF-1 '), ('F312', 'SHELF-1'))
+        self.assertEqual(Bottle.parse_location('H209'), ('H209', ''))
+        self.assertEqual(Bottle.objects.get(id='1').shelf, 'SHELF1')
+
+    def test_save_counts_bottles(self):
+        self.assertEqual(LocationCount.objects.get(room='F312', shelf='SHELF1').checked_in, 2)
+        self.assertEqual(LocationCount.objects.get(room='H209', shelf='').checked_in, 1)
+
+    def test_save_moves_bottle_to_new_location(self):
+        bottle = Bottle.objects.get(id='1')
+        bottle.location = 'F312-SHELF2'
+        bottle.save()
+        self.assertEqual(LocationCount.objects.get(room='F312', shelf='SHELF1').checked_in, 1)
+        self.assertEqual(LocationCount.objects.get(room='F312', shelf='SHELF2').checked_in, 2)
+        self.assertCountsMatchBottles()
+
+    def test_state_transitions_update_counts(self):
+        borrower = {'borrower_full_name': 'Test Guy', 'borrower_email': 'test@ethz.ch', 'borrower_group': 'Bode',
+                    'checkout_date': datetime.date.today()}
+        Bottle.objects.check_out('1', **borrower)
+        Bottle.objects.check_out_many(['1', '2', '3'], **borrower)
+        counts = LocationCount.objects.get(room='F312', shelf='SHELF1')
+        self.assertEqual((counts.checked_in, counts.checked_out, counts.empty), (0, 2, 0))
+        Bottle.objects.check_in('1')
+        Bottle.objects.check_in('4', empty=True)
+        Bottle.objects.check_in_many(['2', '3'], empty=True)
+        self.assertCountsMatchBottles()
+
+    def test_delete_uncounts_bottle(self):
+        Bottle.objects.get(id='4').delete()
+        self.assertEqual(LocationCount.objects.get(room='H209', shelf='').checked_in, 0)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLiteConfigurationTests(SimpleTestCase):
+
+    def synchronous_of_database_in(self, journal_mode):
+        """Return the synchronous setting of a new connection to a database file in <journal_mode>"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'db.sqlite3')
+        with closing(sqlite3.connect(path)) as database:
+            database.execute(f'PRAGMA journal_mode = {journal_mode}')
+        db_connection = connections['default'].copy()
+        db_connection.settings_dict['NAME'] = path
+        self.addCleanup(db_connection.close)
+        with db_connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            return cursor.fetchone()[0]
+
+    def test_connections_to_wal_databases_use_synchronous_normal(self):
+        self.assertEqual(self.synchronous_of_database_in('WAL'), 1)  # NORMAL
+
+    def test_connections_to_other_databases_keep_synchronous_full(self):
+        self.assertEqual(self.synchronous_of_database_in('DELETE'), 2)  # FULL
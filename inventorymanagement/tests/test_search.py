@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from .. import search
+from ..models import Bottle
+
+
+def create_bottles():
+    for bottle_id, description, supplier in [('1', 'Tetrahydrofuran (THF), dry', 'Acros'),
+                                             ('2', 'Tetrahydrofuran (THF)', 'Sial'),
+                                             ('3', 'Toluene, dry', 'Sial'),
+                                             ('4', 'Sialic acid', 'TCI')]:
+        Bottle.objects.create(id=bottle_id,
+                              supplier=supplier,
+                              price=50.50,
+                              description=description,
+                              owner='Django User',
+                              location='F312-SHELF1',
+                              code='GBODDU',
+                              quantity='1000 mL',
+                              )
+
+
+class SearchTests(TestCase):
+    """The tests run against the backend of the test database (FTS5 on SQLite), see TrigramSearchTests"""
+
+    ranked = True
+
+    @classmethod
+    def setUpTestData(cls):
+        create_bottles()
+
+    def result_ids(self, query, **kwargs):
+        return [bottle.id for bottle in search.search_bottles(query, **kwargs)]
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.result_ids('dry THF'), ['1'])
+
+    def test_words_match_by_prefix(self):
+        self.assertEqual(sorted(self.result_ids('tetrahydro')), ['1', '2'])
+
+    def test_synonyms_are_searched(self):
+        self.assertEqual(sorted(self.result_ids('oxolane')), ['1', '2'])
+
+    def test_supplier_is_searched(self):
+        self.assertEqual(self.result_ids('acros'), ['1'])
+
+    def test_bottle_ids_are_not_searched(self):
+        self.assertEqual(self.result_ids('1'), [])
+
+    def test_empty_query_returns_nothing(self):
+        self.assertEqual(self.result_ids(' - '), [])
+
+    def test_results_are_paginated(self):
+        self.assertEqual(len(self.result_ids('sial', limit=2)) + len(self.result_ids('sial', offset=2, limit=2)), 3)
+
+    def test_saved_and_deleted_bottles_are_indexed(self):
+        Bottle.objects.create(id='5', description='Benzene', supplier='Sial', code='GBODDU')
+        self.assertEqual(self.result_ids('benzene'), ['5'])
+        Bottle.objects.get(id='5').delete()
+        self.assertEqual(self.result_ids('benzene'), [])
+
+    def test_description_ranks_before_supplier(self):
+        if not self.ranked:
+            self.skipTest('backend does not rank results')
+        self.assertEqual(self.result_ids('sial')[0], '4')
+
+
+class TrigramSearchTests(SearchTests):
+    ranked = False
+
+    def setUp(self) -> None:
+        patcher = mock.patch.dict(search._backends, {'default': search.TrigramBackend()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        search.rebuild_index()
+
+
+class SearchViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_bottles()
+
+    def test_search_page_shows_matching_bottles(self):
+        response = self.client.get(reverse('inventorymanagement:search'), {'q': 'toluene'})
+        self.assertEqual([bottle.id for bottle in response.context['bottle_list']], ['3'])
+        self.assertFalse(response.context['has_next'])
+
+    def test_search_page_links_next_page(self):
+        with mock.patch('inventorymanagement.views.SearchView.page_size', 1):
+            response = self.client.get(reverse('inventorymanagement:search'), {'q': 'tetrahydrofuran', 'page': '2'})
+        self.assertEqual(len(response.context['bottle_list']), 1)
+        self.assertFalse(response.context['has_next'])
+        self.assertContains(response, 'page=1')
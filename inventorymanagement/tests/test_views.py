@@ -1,2 +1,327 @@
+import datetime
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
-from ..views import get_user_code, get_status_data, get_checkin_data, get_checkout_data
\ No newline at end of file
+from django.urls import reverse
+from django.utils import timezone
+from ..views import get_user_code, get_status_data, get_checkin_data, get_checkout_data, UserChemicalsView
+from ..models import Bottle, ChangeListEntry, DescriptionRollup, LoanRollup
+
+
+class CheckoutCheckinViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Bottle.objects.create(id='1',
+                              supplier='Sial',
+                              price=50.50,
+                              description='acetone',
+                              owner='Django User',
+                              location='F312-SHELF1',
+                              code='GBODDU',
+                              quantity='1000 mL',
+                              status='in',
+                              )
+
+    def checkout(self, full_name='Test Guy', email='testguy@ethz.ch'):
+        return self.client.post(reverse('inventorymanagement:borrow'), {
+            'id':                 '1',
+            'borrower_full_name': full_name,
+            'borrower_email':     email,
+            'borrower_group':     'Bode',
+            'checkout_date':      timezone.now().date(),
+            'status':             'out',
+        })
+
+    def checkin(self, return_status='OK'):
+        return self.client.post(reverse('inventorymanagement:return'), {
+            'id':            '1',
+            'status':        'in',
+            'return_status': return_status,
+        })
+
+    def test_checkout_renders_confirmation(self):
+        response = self.checkout()
+        self.assertTemplateUsed(response, 'inventorymanagement/checkoutconfirm.html')
+        self.assertContains(response, 'F312-SHELF1')
+        self.assertEqual(response.cookies['fullname'].value, 'Test Guy')
+        bottle = Bottle.objects.get(id='1')
+        self.assertEqual(bottle.status, 'out')
+        self.assertEqual(bottle.borrower_full_name, 'Test Guy')
+
+    def test_checkout_of_checked_out_bottle_names_borrower(self):
+        self.checkout()
+        response = self.checkout(full_name='Other Guy', email='otherguy@ethz.ch')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already checked out by Test Guy')
+        self.assertEqual(Bottle.objects.get(id='1').borrower_full_name, 'Test Guy')
+
+    def test_checkin_renders_confirmation(self):
+        self.checkout()
+        response = self.checkin()
+        self.assertTemplateUsed(response, 'inventorymanagement/checkinconfirm.html')
+        self.assertEqual(Bottle.objects.get(id='1').status, 'in')
+
+    def test_checkin_of_checked_in_bottle_fails(self):
+        response = self.checkin()
+        self.assertContains(response, 'This bottle is not checked out.')
+
+    def test_checked_in_bottle_can_be_marked_empty(self):
+        response = self.checkin(return_status='EMPTY')
+        self.assertTemplateUsed(response, 'inventorymanagement/emptyconfirm.html')
+        self.assertEqual(Bottle.objects.get(id='1').status, 'empty')
+
+    def remove_bottle_during(self, transition):
+        """Patch the Bottle transition <transition> to fail because the bottle was removed (e.g. by the sync)"""
+        def remove(bottle_id, *args, **kwargs):
+            Bottle.objects.filter(id=bottle_id).delete()
+            return False
+        return mock.patch.object(Bottle.objects, transition, side_effect=remove)
+
+    def test_checkout_of_bottle_removed_in_the_meantime(self):
+        with self.remove_bottle_during('check_out'):
+            response = self.checkout()
+        self.assertContains(response, 'This bottle is not listed in the database.')
+
+    def test_checkin_of_bottle_removed_in_the_meantime(self):
+        self.checkout()
+        with self.remove_bottle_during('check_in'):
+            response = self.checkin()
+        self.assertContains(response, 'This bottle is not listed in the database.')
+
+    def test_checkout_query_budget(self):
+        """
+        A checkout costs one SELECT (shared by form validation and confirmation), one UPDATE of the bottle, one UPDATE
+        of the location counts and one INSERT of the BottleEvent (plus the savepoint around them)
+        """
+        with self.assertNumQueries(6):
+            self.checkout()
+
+    def test_checkin_query_budget(self):
+        """
+        A checkin costs one SELECT (shared by form validation and confirmation), one UPDATE of the bottle, one UPDATE
+        of the location counts and one INSERT of the BottleEvent (plus the savepoint around them)
+        """
+        self.checkout()
+        with self.assertNumQueries(6):
+            self.checkin()
+
+
+class BatchCheckoutCheckinViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id, status in [('1', 'in'), ('2', 'in'), ('3', 'out'), ('4', 'empty')]:
+            Bottle.objects.create(id=bottle_id,
+                                  supplier='Sial',
+                                  price=50.50,
+                                  description='acetone',
+                                  owner='Django User',
+                                  location='F312-SHELF1',
+                                  code='GBODDU',
+                                  quantity='1000 mL',
+                                  status=status,
+                                  borrower_full_name='Other Guy' if status == 'out' else None,
+                                  )
+
+    def batch_checkout(self, codes):
+        return self.client.post(reverse('inventorymanagement:borrow_batch'), {
+            'bottle_codes':       codes,
+            'borrower_full_name': 'Test Guy',
+            'borrower_email':     'testguy@ethz.ch',
+            'borrower_group':     'Bode',
+        })
+
+    def test_batch_checkout_reports_result_per_bottle(self):
+        response = self.batch_checkout('1\n2, 3\n4 99')
+        self.assertContains(response, 'You checked out 2 of 5 bottles')
+        self.assertContains(response, 'already checked out by Other Guy')
+        self.assertContains(response, 'marked as empty and cannot be checked out')
+        self.assertContains(response, 'not listed in the database')
+        self.assertEqual(Bottle.objects.filter(status='out', borrower_full_name='Test Guy').count(), 2)
+
+    def test_batch_checkout_query_budget(self):
+        """
+        A batch checkout costs one SELECT for all bottles (form), one SELECT of the bottles that are checked in, one
+        UPDATE, one UPDATE per shelf for the location counts and one INSERT of the BottleEvents (plus the savepoint
+        around them)
+        """
+        with self.assertNumQueries(7):
+            self.batch_checkout('1\n2\n3')
+
+    def test_batch_checkin_returns_checked_out_bottles(self):
+        response = self.client.post(reverse('inventorymanagement:return_batch'), {
+            'bottle_codes':  '1-\n3',
+            'return_status': 'OK',
+        })
+        self.assertContains(response, 'You returned 1 of 2 bottles')
+        self.assertContains(response, 'This bottle is not checked out.')
+        self.assertEqual(Bottle.objects.get(id='3').status, 'in')
+
+    def test_batch_checkin_marks_bottles_empty(self):
+        self.client.post(reverse('inventorymanagement:return_batch'), {
+            'bottle_codes':  '1\n2\n3',
+            'return_status': 'EMPTY',
+        })
+        self.assertEqual(Bottle.objects.filter(status='empty').count(), 4)
+
+
+class UserChemicalsViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i, description in enumerate(['ethanol', 'acetone', 'benzene', 'acetone', 'toluene']):
+            Bottle.objects.create(id=str(i),
+                                  supplier='Sial',
+                                  price=50.50,
+                                  description=description,
+                                  owner='Django User',
+                                  location='F312-SHELF1',
+                                  code='GBODDU',
+                                  quantity='1000 mL',
+                                  status='out' if i % 2 else 'in',
+                                  )
+
+    def get_page(self, only_checked_out='False', after=None):
+        url = reverse('inventorymanagement:list_detail', kwargs={'code': 'GBODDU', 'only_checked_out': only_checked_out})
+        return self.client.get(url, {'after': after} if after else {})
+
+    def test_listing_is_paginated_with_cursor(self):
+        with mock.patch.object(UserChemicalsView, 'page_size', 2):
+            seen = []
+            after = None
+            while True:
+                with self.assertNumQueries(1):
+                    response = self.get_page(after=after)
+                seen += [(bottle.description, bottle.id) for bottle in response.context['bottle_list']]
+                after = response.context['next_cursor']
+                if after is None:
+                    break
+        self.assertEqual(seen, [('acetone', '1'), ('acetone', '3'), ('benzene', '2'), ('ethanol', '0'),
+                                ('toluene', '4')])
+
+    def test_listing_of_checked_out_bottles(self):
+        response = self.get_page(only_checked_out='True')
+        self.assertEqual([bottle.id for bottle in response.context['bottle_list']], ['1', '3'])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class IndexViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        ChangeListEntry.objects.create(description='Added a recent feature')
+        ChangeListEntry.objects.create(description='Removed an old bug',
+                                       date=datetime.date.today() - datetime.timedelta(days=31))
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_index_only_shows_recent_entries(self):
+        response = self.client.get(reverse('inventorymanagement:index'))
+        self.assertContains(response, 'Added a recent feature')
+        self.assertNotContains(response, 'Removed an old bug')
+
+    def test_index_is_served_from_cache(self):
+        self.client.get(reverse('inventorymanagement:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('inventorymanagement:index'))
+        self.assertContains(response, 'Added a recent feature')
+
+    def test_saving_an_entry_invalidates_cached_pages(self):
+        self.client.get(reverse('inventorymanagement:index'))
+        self.client.get(reverse('inventorymanagement:changelist'))
+        ChangeListEntry.objects.create(description='Fixed the cache')
+        self.assertContains(self.client.get(reverse('inventorymanagement:index')), 'Fixed the cache')
+        self.assertContains(self.client.get(reverse('inventorymanagement:changelist')), 'Fixed the cache')
+
+
+class AnalyticsViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        for date, loans in [(yesterday, 2), (yesterday - datetime.timedelta(days=1), 3)]:
+            LoanRollup.objects.create(date=date, owner_group='GBOD', borrower_group='Bode', loans=loans, returns=2,
+                                      loan_days=5)
+            DescriptionRollup.objects.create(date=date, description='acetone', loans=loans)
+        # outside of the dashboard period
+        DescriptionRollup.objects.create(date=yesterday - datetime.timedelta(days=100), description='benzene', loans=9)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_dashboard_sums_rollups(self):
+        response = self.client.get(reverse('inventorymanagement:analytics'))
+        self.assertEqual(response.context['top_descriptions'], [{'description': 'acetone', 'loans': 5}])
+        group_loans = response.context['group_loans'][0]
+        self.assertEqual(group_loans['loans'], 5)
+        self.assertEqual(group_loans['mean_loan_days'], 2.5)
+
+    def test_dashboard_is_served_from_cache(self):
+        self.client.get(reverse('inventorymanagement:analytics'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('inventorymanagement:analytics'))
+        self.assertContains(response, 'acetone')
+
+
+class CompoundViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id, description in [('1', 'THF, anhydrous'), ('2', 'Oxolane'), ('3', 'Toluene')]:
+            Bottle.objects.create(id=bottle_id, description=description, code='GBODDU', location='F312-SHELF1')
+
+    def test_compound_lists_bottles_of_all_synonyms(self):
+        response = self.client.get(reverse('inventorymanagement:compound', args=['tetrahydrofuran']))
+        self.assertEqual([bottle.id for bottle in response.context['bottle_list']], ['1', '2'])
+
+    def test_status_page_links_compound(self):
+        response = self.client.get(reverse('inventorymanagement:detail', args=['2']))
+        self.assertContains(response, reverse('inventorymanagement:compound', args=['tetrahydrofuran']))
+
+
+class LocationViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for bottle_id, location, status in [('1', 'F312-SHELF1', 'in'), ('2', 'F312-SHELF1', 'out'),
+                                            ('3', 'F312-SHELF2', 'empty'), ('4', 'H209', 'in'),
+                                            ('5', 'H 332/334-SHELF_1/2', 'in')]:
+            Bottle.objects.create(id=bottle_id, description='acetone', code='GBODDU', location=location, status=status)
+
+    def test_locations_sum_up_rooms(self):
+        response = self.client.get(reverse('inventorymanagement:locations'))
+        self.assertEqual([(room['room'], room['checked_in_total'], room['checked_out_total'], room['empty_total'])
+                          for room in response.context['room_list']],
+                         [('F312', 1, 1, 1), ('H 332/334', 1, 0, 0), ('H209', 1, 0, 0)])
+
+    def test_room_lists_shelves_without_reading_bottles(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('inventorymanagement:room', args=['F312']))
+        self.assertEqual([location.shelf for location in response.context['shelf_list']], ['SHELF1', 'SHELF2'])
+
+    def test_shelf_lists_missing_bottles(self):
+        response = self.client.get(reverse('inventorymanagement:shelf', args=['F312', 'SHELF1']), {'status': 'out'})
+        self.assertEqual([bottle.id for bottle in response.context['bottle_list']], ['2'])
+        self.assertEqual(response.context['paginator'].count, 1)
+
+    def test_shelf_of_room_without_shelves(self):
+        response = self.client.get(reverse('inventorymanagement:shelf', args=['H209', '-']))
+        self.assertEqual([bottle.id for bottle in response.context['bottle_list']], ['4'])
+
+    def test_status_page_links_shelf(self):
+        response = self.client.get(reverse('inventorymanagement:detail', args=['1']))
+        self.assertContains(response, reverse('inventorymanagement:shelf', args=['F312', 'SHELF1']))
+
+    def test_location_pages_of_location_with_slashes(self):
+        """Slashes in the room and shelf are escaped in the URLs, so that the links do not break the pages"""
+        shelf_url = reverse('inventorymanagement:shelf', args=['H 332/334', 'SHELF_1/2'])
+        self.assertContains(self.client.get(reverse('inventorymanagement:detail', args=['5'])), shelf_url)
+        room_url = reverse('inventorymanagement:room', args=['H 332/334'])
+        self.assertContains(self.client.get(reverse('inventorymanagement:locations')), room_url)
+        self.assertContains(self.client.get(room_url), shelf_url)
+        response = self.client.get(shelf_url)
+        self.assertEqual([bottle.id for bottle in response.context['bottle_list']], ['5'])
+        self.assertContains(response, room_url)
@@ -13,21 +13,37 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from . import views
-from django.urls import path
+from . import api, converters, views
+from django.urls import path, register_converter
+
+register_converter(converters.LocationConverter, 'location')
 
 app_name = 'inventorymanagement'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
     path('take/', views.get_checkout_data, name='borrow'),
+    path('take/batch/', views.get_batch_checkout_data, name='borrow_batch'),
     path('take/confirmation/<pk>', views.CheckoutView.as_view(), name='confirmcheckout'),
     path('bring/', views.get_checkin_data, name='return'),
+    path('bring/batch/', views.get_batch_checkin_data, name='return_batch'),
     path('bring/confirmation/<pk>', views.CheckinView.as_view(), name='confirmreturn'),
     path('bring/confirmation_empty/<pk>', views.CheckinEmptyView.as_view(), name='confirmempty'),
     path('status/', views.get_status_data, name='status'),
     path('status/<pk>', views.StatusView.as_view(), name='detail'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('compound/<path:compound_key>', views.CompoundView.as_view(), name='compound'),
+    path('locations/', views.LocationListView.as_view(), name='locations'),
+    path('locations/<location:room>/', views.RoomView.as_view(), name='room'),
+    path('locations/<location:room>/<location:shelf>/', views.ShelfView.as_view(), name='shelf'),
     path('about/', views.AboutView.as_view(), name='about'),
     path('changelist/', views.ChangeListView.as_view(), name='changelist'),
+    path('analytics/', views.AnalyticsView.as_view(), name='analytics'),
     path('list/', views.get_user_code, name='list'),
     path('list/<code>/<only_checked_out>', views.UserChemicalsView.as_view(), name='list_detail'),
+    path('api/bottles/', api.bottle_list, name='api_bottle_list'),
+    path('api/bottles/<pk>/', api.bottle_detail, name='api_bottle_detail'),
+    path('api/owners/<code>/bottles/', api.owner_bottles, name='api_owner_bottles'),
+    path('api/checkout/', api.checkout, name='api_checkout'),
+    path('api/checkin/', api.checkin, name='api_checkin'),
+    path('api/empty/', api.mark_empty, name='api_empty'),
 ]
@@ -23,3 +23,10 @@ def validate_ethz_email_address(borrower_email: str):
         raise ValidationError(
             f'{borrower_email} is not an ETHZ email address'
         )
+
+
+def validate_group_prefix(prefix: str):
+    if len(prefix) != 4 or not prefix.isalpha() or not prefix.isupper():
+        raise ValidationError(
+            f'{prefix} is not a group prefix (4 capital letters)'
+        )
@@ -1,8 +1,14 @@
-from django.http import HttpResponseRedirect
-from django.shortcuts import render, redirect
+import base64
+import json
+
+from django.db.models import Q, Sum
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
 from django.views import generic
-from django.core import exceptions
+from . import analytics
+from .caching import CachedPageMixin
+from .search import search_bottles
 from .forms import *
 from .models import *
 
@@ -11,35 +17,36 @@ from .models import *
 
 def get_checkout_data(request):
     """
-    This view renders the checkout form, and sends the user-entered data back to the server
+    This view renders the checkout form, and sends the user-entered data back to the server.
+    After a successful checkout, the confirmation is rendered right away from the bottle resolved by the form
+    (the bottle is not read again after the update).
     """
     # if this is a POST request we need to process the form data
     if request.method == 'POST':
-        bottle_code = request.POST['id']  # get bottle_code from user input
-        bottle_code_clean = bottle_code.replace('-', '')  # remove dashes that people might have placed
-        try:
-            instance = Bottle.objects.get(id=bottle_code_clean)  # get the Bottle instance user requested to change
-            # create a form instance and populate it with data from the request + the Bottle instance to be changed
-            form = BottleCheckoutForm(request.POST, instance=instance)
-        except exceptions.ObjectDoesNotExist:
-            # don't call the bottle instance since it will raise another error (as the bottle does not exist)
-            # instead, let the validation method in the form handle it
-            form = BottleCheckoutForm(request.POST)
+        # create a form instance and populate it with data from the request
+        # (the form looks up the Bottle instance user requested to change)
+        form = BottleCheckoutForm(request.POST)
         # check whether it's valid:
         if form.is_valid():
-            form.cleaned_data['id'] = form.cleaned_data['id'].replace('-', '')  # remove dashes that user might have used in bottle code
-            # process the data in form.cleaned_data as required
-
-            # redirect to a new URL:
-            form.save()
-            response = HttpResponseRedirect(reverse('inventorymanagement:confirmcheckout',
-                                                    kwargs={'pk': form.cleaned_data['id']}
-                                                    ))
-            # add cookies to the response to help fill form next time (max_age is 4 weeks...in seconds)
-            response.set_cookie('email', form.cleaned_data['borrower_email'], max_age=2419200)
-            response.set_cookie('fullname', form.cleaned_data['borrower_full_name'], max_age=2419200)
-            response.set_cookie('group', form.cleaned_data['borrower_group'], max_age=2419200)
-            return response
+            bottle = form.instance
+            # the bottle is only checked out if it is still checked in (another user might have been faster)
+            checked_out = Bottle.objects.check_out(
+                bottle.id,
+                borrower_full_name=form.cleaned_data['borrower_full_name'],
+                borrower_email=form.cleaned_data['borrower_email'],
+                borrower_group=form.cleaned_data['borrower_group'],
+                checkout_date=form.cleaned_data['checkout_date'],
+            )
+            if checked_out:
+                bottle.status = 'out'
+                response = render(request, 'inventorymanagement/checkoutconfirm.html', {'bottle': bottle})
+                # add cookies to the response to help fill form next time (max_age is 4 weeks...in seconds)
+                response.set_cookie('email', form.cleaned_data['borrower_email'], max_age=2419200)
+                response.set_cookie('fullname', form.cleaned_data['borrower_full_name'], max_age=2419200)
+                response.set_cookie('group', form.cleaned_data['borrower_group'], max_age=2419200)
+                return response
+            # the bottle may also have been removed by the Expereact sync in the meantime
+            form.add_error('id', checkout_unavailable_error(Bottle.objects.filter(id=bottle.id).first()))
 
     # if a GET (or any other method) we'll create a blank form
     else:
@@ -64,36 +71,27 @@ def get_checkout_data(request):
 
 def get_checkin_data(request):
     """
-    This view renders the checkin form, and sends the user-entered data back to the server
+    This view renders the checkin form, and sends the user-entered data back to the server.
+    After a successful checkin, the confirmation is rendered right away from the bottle resolved by the form.
     """
     # if this is a POST request we need to process the form data
     if request.method == 'POST':
-        bottle_code = request.POST['id']  # get bottle_code from user input
-        bottle_code_clean = bottle_code.replace('-', '')  # remove dashes that people might have placed
-        try:
-            instance = Bottle.objects.get(id=bottle_code_clean)  # get the Bottle instance user requested to change
-            # create a form instance and populate it with data from the request + the Bottle instance to be changed
-            form = BottleCheckinForm(request.POST, instance=instance)
-        except exceptions.ObjectDoesNotExist:
-            # don't call the bottle instance since it will raise another error (as the bottle does not exist)
-            # instead, let the validation method in the form handle it
-            form = BottleCheckinForm(request.POST)
+        # create a form instance and populate it with data from the request
+        # (the form looks up the Bottle instance user requested to change)
+        form = BottleCheckinForm(request.POST)
         # check whether it's valid:
         if form.is_valid():
-            # process the data in form.cleaned_data as required
-            # remove dashes that user might have used in bottle code
-            form.cleaned_data['id'] = form.cleaned_data['id'].replace('-', '')
-            # form.cleaned_data['return_date'] = 'n/a'
-            if form.cleaned_data['return_status'] == 'EMPTY':
-                # delete the Bottle instance
-                form.save()  # not sure if this call is necessary with the instance.save() afterwards
-                instance.status = 'empty'
-                instance.save()
-                return HttpResponseRedirect(reverse('inventorymanagement:confirmempty', args=(bottle_code_clean,)))
-            else:
-                form.save()
-            # redirect to a new URL:
-            return HttpResponseRedirect(reverse('inventorymanagement:confirmreturn', args=(bottle_code_clean,)))
+            bottle = form.instance
+            empty = form.cleaned_data['return_status'] == 'EMPTY'
+            # the bottle is only returned if it is still checked out (another user might have been faster)
+            if Bottle.objects.check_in(bottle.id, empty=empty):
+                bottle.checkout_date = None
+                if empty:
+                    bottle.status = 'empty'
+                    return render(request, 'inventorymanagement/emptyconfirm.html', {'bottle': bottle})
+                bottle.status = 'in'
+                return render(request, 'inventorymanagement/checkinconfirm.html', {'bottle': bottle})
+            form.add_error('id', checkin_unavailable_error(Bottle.objects.filter(id=bottle.id).first()))
 
     # if a GET (or any other method) we'll create a blank form
     else:
@@ -101,6 +99,120 @@ def get_checkin_data(request):
     return render(request, 'inventorymanagement/checkinform.html', {'form': form})
 
 
+def batch_results(codes, bottles, succeeded, unavailable_error):
+    """
+    Build the per-bottle results of a batch checkout/checkin for the confirmation page.
+    Returns a list of (code, Bottle or None, error message or None) in the order the codes were entered.
+    """
+    results = []
+    for code in codes:
+        bottle = bottles.get(code)
+        if bottle is None:
+            error = 'This bottle is not listed in the database.'
+        elif code in succeeded:
+            error = None
+        else:
+            error = unavailable_error(bottle).message
+        results.append((code, bottle, error))
+    return results
+
+
+def apply_batch_checkout(form):
+    """
+    Check out all available bottles of a valid BatchCheckoutForm with one UPDATE.
+    Returns the per-bottle results (see batch_results) and the set of codes that were checked out.
+    """
+    codes = form.cleaned_data['bottle_codes']
+    available = [code for code in codes if code in form.bottles and form.bottles[code].status == 'in']
+    checkout_date = timezone.now().date()
+    checked_out = set(Bottle.objects.check_out_many(
+        available,
+        borrower_full_name=form.cleaned_data['borrower_full_name'],
+        borrower_email=form.cleaned_data['borrower_email'],
+        borrower_group=form.cleaned_data['borrower_group'],
+        checkout_date=checkout_date,
+    ))
+    for code in checked_out:
+        bottle = form.bottles[code]
+        bottle.status = 'out'
+        bottle.borrower_full_name = form.cleaned_data['borrower_full_name']
+        bottle.borrower_email = form.cleaned_data['borrower_email']
+        bottle.borrower_group = form.cleaned_data['borrower_group']
+        bottle.checkout_date = checkout_date
+    # bottles that were available at validation but are not checked out now went to someone else
+    lost = set(available) - checked_out
+    if lost:
+        form.bottles.update(Bottle.objects.in_bulk(list(lost)))
+    return batch_results(codes, form.bottles, checked_out, checkout_unavailable_error), checked_out
+
+
+def apply_batch_checkin(form):
+    """
+    Return (or mark empty) all suitable bottles of a valid BatchCheckinForm with one UPDATE.
+    Returns the per-bottle results (see batch_results) and the set of codes that were returned (or marked empty).
+    """
+    codes = form.cleaned_data['bottle_codes']
+    empty = form.cleaned_data['return_status'] == 'EMPTY'
+    allowed_status = ['in', 'out'] if empty else ['out']
+    available = [code for code in codes if code in form.bottles and form.bottles[code].status in allowed_status]
+    returned = set(Bottle.objects.check_in_many(available, empty=empty))
+    for code in returned:
+        form.bottles[code].status = 'empty' if empty else 'in'
+        form.bottles[code].checkout_date = None
+    return batch_results(codes, form.bottles, returned, checkin_unavailable_error), returned
+
+
+def get_batch_checkout_data(request):
+    """
+    This view renders the batch checkout form and checks out all entered bottles that are available, at once.
+    The bottles are validated with one query and checked out with one UPDATE. The confirmation page lists the result
+    for every bottle.
+    """
+    if request.method == 'POST':
+        form = BatchCheckoutForm(request.POST)
+        if form.is_valid():
+            results, checked_out = apply_batch_checkout(form)
+            response = render(request, 'inventorymanagement/batchconfirm.html', {
+                'results': results,
+                'action': 'checked out',
+                'count': len(checked_out),
+            })
+            # add cookies to the response to help fill form next time (max_age is 4 weeks...in seconds)
+            response.set_cookie('email', form.cleaned_data['borrower_email'], max_age=2419200)
+            response.set_cookie('fullname', form.cleaned_data['borrower_full_name'], max_age=2419200)
+            response.set_cookie('group', form.cleaned_data['borrower_group'], max_age=2419200)
+            return response
+    else:
+        form = BatchCheckoutForm(initial={
+            'borrower_full_name': request.COOKIES.get('fullname'),
+            'borrower_email': request.COOKIES.get('email'),
+            'borrower_group': request.COOKIES.get('group'),
+        })
+    return render(request, 'inventorymanagement/batchform.html', {'form': form, 'action': 'borrow'})
+
+
+def get_batch_checkin_data(request):
+    """
+    This view renders the batch checkin form and returns (or marks empty) all entered bottles at once.
+    The bottles are validated with one query and updated with one UPDATE. The confirmation page lists the result
+    for every bottle.
+    """
+    if request.method == 'POST':
+        form = BatchCheckinForm(request.POST)
+        if form.is_valid():
+            results, returned = apply_batch_checkin(form)
+            empty = form.cleaned_data['return_status'] == 'EMPTY'
+            return render(request, 'inventorymanagement/batchconfirm.html', {
+                'results': results,
+                'action': 'marked as empty' if empty else 'returned',
+                'count': len(returned),
+                'empty': empty,
+            })
+    else:
+        form = BatchCheckinForm()
+    return render(request, 'inventorymanagement/batchform.html', {'form': form, 'action': 'return'})
+
+
 def get_status_data(request):
     """
     This view renders the status check form, and sends the user-entered data back to the server
@@ -149,16 +261,40 @@ def get_user_code(request):
     return render(request, 'inventorymanagement/codeform.html', {'form': form})
 
 
-class IndexView(generic.ListView):
+class IndexView(CachedPageMixin, generic.ListView):
+    """
+    This view shows the home page with the recent changelist entries (served from the cache)
+    """
     model = ChangeListEntry
     ordering = '-date'
     template_name = 'inventorymanagement/index.html'
+    cache_name = 'index'
+
+    def get_queryset(self):
+        return ChangeListEntry.objects.recent().order_by(self.ordering)
 
 
-class ChangeListView(generic.ListView):
+class AnalyticsView(CachedPageMixin, generic.TemplateView):
+    """
+    This view shows the usage statistics of the last days, read from the daily rollups (served from the cache)
+    """
+    template_name = 'inventorymanagement/analytics.html'
+    cache_name = 'analytics'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(analytics.dashboard())
+        return context
+
+
+class ChangeListView(CachedPageMixin, generic.ListView):
+    """
+    This view shows the full changelist (served from the cache)
+    """
     model = ChangeListEntry
     ordering = '-date'
     template_name = 'inventorymanagement/changelist.html'
+    cache_name = 'changelist'
 
 
 class CheckoutView(generic.DetailView):
@@ -187,11 +323,19 @@ class CheckinEmptyView(generic.DetailView):
 
 class StatusView(generic.DetailView):
     """
-    This view shows the user detailed bottle information after a status request
+    This view shows the user detailed bottle information after a status request.
+    Bottles that are no longer in the Bottle table are looked up in the archive.
     """
     model = Bottle
+    context_object_name = 'bottle'
     template_name = 'inventorymanagement/status.html'
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            return get_object_or_404(ArchivedBottle, pk=self.kwargs['pk'])
+
 
 class AboutView(generic.TemplateView):
     """
@@ -200,10 +344,37 @@ class AboutView(generic.TemplateView):
     template_name = 'inventorymanagement/about.html'
 
 
+def encode_cursor(bottle):
+    """
+    Encode the position of <bottle> in a listing ordered by (description, id) as an URL-safe string
+    """
+    return base64.urlsafe_b64encode(json.dumps([bottle.description, bottle.id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor created by encode_cursor() into a (description, id) tuple.
+    Returns None if no (or an invalid) cursor is given.
+    """
+    if not cursor:
+        return None
+    try:
+        description, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    return description, id
+
+
 class UserChemicalsView(generic.ListView):
     """
-    This view shows all bottles associated to a usercode
+    This view shows all bottles associated to a usercode.
+    The list is paginated with a cursor (keyset pagination): the query parameter 'after' holds the (description, id)
+    of the last bottle of the previous page, and the next page starts right after it. Together with the index on
+    (code, status, description, id) every page costs the same, no matter how many bottles a group owns.
     """
+    page_size = 100
+    list_fields = ['id', 'description', 'location', 'status']
+    """Bottle fields shown in the list (no other fields are loaded)"""
 
     def dispatch(self, request, *args, **kwargs):
         self.code = kwargs['code']
@@ -215,9 +386,141 @@ class UserChemicalsView(generic.ListView):
             queryset = Bottle.objects.filter(code=self.code, status='out')
         else:
             queryset = Bottle.objects.filter(code=self.code)
-        return queryset
+        cursor = decode_cursor(self.request.GET.get('after'))
+        if cursor is not None:
+            description, id = cursor
+            queryset = queryset.filter(Q(description__gt=description) | Q(description=description, id__gt=id))
+        # fetch one more bottle than shown to know whether there is a next page
+        return queryset.order_by('description', 'id').only(*self.list_fields)[:self.page_size + 1]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        bottles = list(context['object_list'])
+        context['next_cursor'] = None
+        if len(bottles) > self.page_size:
+            bottles = bottles[:self.page_size]
+            context['next_cursor'] = encode_cursor(bottles[-1])
+        context['object_list'] = context['bottle_list'] = bottles
+        context['is_first_page'] = not self.request.GET.get('after')
+        return context
 
     form_class = CheckUserChemicals
     model = Bottle
     template_name = 'inventorymanagement/list_detail.html'
-    ordering = 'description'
+
+
+class CompoundView(generic.ListView):
+    """
+    This view shows all bottles of a compound (same compound key, see chemnames.py), whatever their description
+    """
+    paginate_by = 100
+    context_object_name = 'bottle_list'
+    template_name = 'inventorymanagement/compound.html'
+    list_fields = ['id', 'description', 'code', 'location', 'status']
+    """Bottle fields shown in the list (no other fields are loaded)"""
+
+    def get_queryset(self):
+        return (Bottle.objects.filter(compound_key=self.kwargs['compound_key'])
+                .order_by('id').only(*self.list_fields))
+
+
+NO_LOCATION = '-'
+"""Stands for an empty room or shelf in the URLs of the location pages (e.g. the bottles of a room not on a shelf)"""
+
+
+def location_from_url(value):
+    """Returns the room or shelf given by <value> in the URL of a location page"""
+    return '' if value == NO_LOCATION else value
+
+
+class LocationListView(generic.ListView):
+    """
+    This view shows all rooms with their number of bottles per status, summed up from the location counts
+    (no bottle is read)
+    """
+    context_object_name = 'room_list'
+    template_name = 'inventorymanagement/locations.html'
+
+    def get_queryset(self):
+        return (LocationCount.objects.values('room')
+                .annotate(checked_in_total=Sum('checked_in'),
+                          checked_out_total=Sum('checked_out'),
+                          empty_total=Sum('empty'))
+                .order_by('room'))
+
+
+class RoomView(generic.ListView):
+    """
+    This view shows the shelves of a room with their number of bottles per status (from the location counts)
+    """
+    context_object_name = 'shelf_list'
+    template_name = 'inventorymanagement/room.html'
+
+    def get_queryset(self):
+        return LocationCount.objects.filter(room=location_from_url(self.kwargs['room'])).order_by('shelf')
+
+
+class ShelfView(generic.ListView):
+    """
+    This view shows the bottles on a shelf, optionally only those with the status given by the query parameter
+    'status' (e.g. the bottles missing from the shelf: status=out). The number of bottles for the paginator is taken
+    from the location counts instead of counting the bottles.
+    """
+    paginate_by = 100
+    context_object_name = 'bottle_list'
+    template_name = 'inventorymanagement/shelf.html'
+    list_fields = ['id', 'description', 'code', 'status', 'checkout_date', 'borrower_full_name']
+    """Bottle fields shown in the list (no other fields are loaded)"""
+
+    def get_queryset(self):
+        self.room = location_from_url(self.kwargs['room'])
+        self.shelf = location_from_url(self.kwargs['shelf'])
+        self.status = self.request.GET.get('status')
+        if self.status not in STATUS_COUNT_FIELDS:
+            self.status = None
+        self.counts = LocationCount.objects.filter(room=self.room, shelf=self.shelf).first()
+        bottles = Bottle.objects.filter(room=self.room, shelf=self.shelf)
+        if self.status:
+            bottles = bottles.filter(status=self.status)
+        return bottles.order_by('id').only(*self.list_fields)
+
+    def get_paginator(self, queryset, per_page, *args, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, *args, **kwargs)
+        if self.counts is not None:
+            paginator.count = (getattr(self.counts, STATUS_COUNT_FIELDS[self.status]) if self.status
+                               else self.counts.total())
+        return paginator
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['counts'] = self.counts
+        context['status'] = self.status
+        return context
+
+
+class SearchView(generic.ListView):
+    """
+    This view shows the bottles whose description or supplier match the query parameter 'q', best match first.
+    The results come from the full-text search index (see search.py) and are paginated with the parameter 'page'.
+    """
+    page_size = 25
+    context_object_name = 'bottle_list'
+    template_name = 'inventorymanagement/search.html'
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        try:
+            self.page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            self.page = 1
+        # fetch one more bottle than shown to know whether there is a next page
+        return search_bottles(self.query, offset=(self.page - 1) * self.page_size, limit=self.page_size + 1)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        bottles = context['object_list']
+        context['has_next'] = len(bottles) > self.page_size
+        context['object_list'] = context['bottle_list'] = bottles[:self.page_size]
+        context['query'] = self.query
+        context['page'] = self.page
+        return context
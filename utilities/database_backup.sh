@@ -9,7 +9,14 @@ CURRENTDATE=$(date +%Y-%m-%d)
 # cd to directory of this script
 cd $DIR || exit 1
 # copy db to backup folder
-cp ../db.sqlite3 ../backup/
+# the database is in WAL mode (recent changes may only be in db.sqlite3-wal), so it is copied through SQLite's online
+# backup, which gives a consistent copy even while the web app or the Expereact sync write to it
+if command -v sqlite3 >/dev/null 2>&1; then
+  sqlite3 ../db.sqlite3 ".backup '../backup/db.sqlite3'"
+else
+  python3 -c "import sqlite3; sqlite3.connect('../db.sqlite3').execute('PRAGMA wal_checkpoint(TRUNCATE)')"
+  cp ../db.sqlite3 ../backup/
+fi
 cd ../backup/ || exit 1
 # tar-gz the database copy
 tar -czf backup_${CURRENTDATE}.tar.gz db.sqlite3